@@ -1,13 +1,10 @@
-import os
+from app.LLMs.llm_cache import build_llm_cache
+from app.LLMs.model_registry import build_model_registry
+from app.utils.env_loader import load_env
 
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+load_env()
 
-load_dotenv()
+llm_response_cache = build_llm_cache()
 
-llm = ChatOpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    base_url=os.environ.get("OPENAI_API_URL"),
-    model="qwen-flash",
-    temperature=0.2
-)
\ No newline at end of file
+# 各档位的模型客户端在首次使用或启动预热时才创建
+model_registry = build_model_registry(cache=llm_response_cache)
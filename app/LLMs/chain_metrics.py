@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.LLMs.model_registry import token_usage
+from app.utils.metrics import metrics, observe_stage
+
+chain_runs = metrics.counter(
+    "chain_runs", "经 run_chain / stream_chain 发起的链调用次数", ("chain", "status"))
+chain_in_flight = metrics.gauge(
+    "chain_in_flight", "正在进行的链调用数", ("chain",))
+llm_tokens = metrics.counter(
+    "llm_tokens", "各链消耗的 token 数，kind 为 prompt、cached_prompt 或 completion",
+    ("chain", "kind"))
+
+
+def run_stage(run_name: str) -> Optional[str]:
+  """
+  按子运行的名称判断所属阶段，其余的组合类运行（RunnableMap、路由等）不单独记录
+  """
+  if run_name.endswith("PromptTemplate"):
+    return "prompt_render"
+  if run_name.endswith("OutputParser"):
+    return "parse"
+  return None
+
+
+class ChainMetricsCallback(BaseCallbackHandler):
+  """
+  记录每次链调用中提示词渲染、模型调用、输出解析各阶段的耗时与 token 用量，
+  链名取自链定义处 with_config(run_name=...) 设置的名称
+  """
+  run_inline = True
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # run_id -> (链名, 阶段, 开始时间)，阶段为 None 的运行只用于向下传递链名
+    self._runs: Dict[UUID, Tuple[str, Optional[str], float]] = {}
+
+
+  def on_chain_start(self, serialized: Optional[Dict[str, Any]],
+      inputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+      **kwargs: Any) -> None:
+    name = kwargs.get("name") or (serialized or {}).get("name") or "unknown"
+    if parent_run_id is None:
+      chain_in_flight.inc(chain=name)
+      self._start(run_id, name, "chain")
+    else:
+      self._start_child(run_id, parent_run_id, run_stage(name))
+
+
+  def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+    self._end(run_id, "success")
+
+
+  def on_chain_error(self, error: BaseException, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    self._end(run_id, "error")
+
+
+  def on_chat_model_start(self, serialized: Optional[Dict[str, Any]],
+      messages: List[List[Any]], *, run_id: UUID,
+      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+    self._start_child(run_id, parent_run_id, "llm")
+
+
+  def on_llm_start(self, serialized: Optional[Dict[str, Any]],
+      prompts: List[str], *, run_id: UUID,
+      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+    self._start_child(run_id, parent_run_id, "llm")
+
+
+  def on_llm_end(self, response: LLMResult, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    run = self._end(run_id, "success")
+    if run is None:
+      return
+    prompt_tokens, cached_tokens, completion_tokens = token_usage(response)
+    llm_tokens.inc(prompt_tokens, chain=run[0], kind="prompt")
+    llm_tokens.inc(cached_tokens, chain=run[0], kind="cached_prompt")
+    llm_tokens.inc(completion_tokens, chain=run[0], kind="completion")
+
+
+  def on_llm_error(self, error: BaseException, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    self._end(run_id, "error")
+
+
+  def _start(self, run_id: UUID, chain: str, stage: Optional[str]) -> None:
+    with self._lock:
+      self._runs[run_id] = (chain, stage, time.perf_counter())
+
+
+  def _start_child(self, run_id: UUID, parent_run_id: Optional[UUID],
+      stage: Optional[str]) -> None:
+    with self._lock:
+      parent = self._runs.get(parent_run_id) if parent_run_id else None
+      if parent is not None:
+        self._runs[run_id] = (parent[0], stage, time.perf_counter())
+
+
+  def _end(self, run_id: UUID,
+      status: str) -> Optional[Tuple[str, Optional[str], float]]:
+    with self._lock:
+      run = self._runs.pop(run_id, None)
+    if run is None:
+      return None
+    chain, stage, started = run
+    if stage is not None:
+      observe_stage(chain, stage, started)
+    if stage == "chain":
+      chain_in_flight.dec(chain=chain)
+      chain_runs.inc(chain=chain, status=status)
+    return run
+
+
+# 全局实例
+chain_metrics = ChainMetricsCallback()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.runnables import Runnable
+
+from app.LLMs.model_router import warm_up_routes
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+# background：启动后在线程中预热，不推迟就绪；eager：预热完成后才开始接收请求；off：全部按需构建
+DEFAULT_WARM_UP_MODE = "background"
+WARM_UP_MODES = ("background", "eager", "off")
+
+
+class LazyChain:
+  """
+  首次调用时才构建的链，构建结果带有 run_name，与指标、追踪、用量账本中的链名一致；
+  并发的首次调用只会构建一次
+  """
+
+  def __init__(self, name: str, factory: Callable[[], Runnable]):
+    self.name = name
+    self.factory = factory
+    self.build_seconds: Optional[float] = None
+
+    self._chain: Optional[Runnable] = None
+    self._lock = threading.Lock()
+
+
+  def __call__(self) -> Runnable:
+    chain = self._chain
+    if chain is not None:
+      return chain
+    with self._lock:
+      if self._chain is None:
+        started = time.perf_counter()
+        self._chain = self.factory().with_config(run_name=self.name)
+        self.build_seconds = time.perf_counter() - started
+      return self._chain
+
+
+  @property
+  def built(self) -> bool:
+    return self._chain is not None
+
+
+class ChainRegistry:
+  """
+  按名称登记各工作流的链：导入时只登记构建函数，首次使用或启动预热时才构建链与模型客户端，
+  只查询文档的接口与 worker 启动都不必承担这部分开销
+  """
+
+  def __init__(self):
+    self._chains: Dict[str, LazyChain] = {}
+    self._lock = threading.Lock()
+    self._warm_up_seconds: Optional[float] = None
+    self._warm_up_task: Optional[asyncio.Future] = None
+
+
+  def register(self, name: str, factory: Callable[[], Runnable]) -> LazyChain:
+    """
+    :param name: 链名，同时作为 run_name
+    :param factory: 无参的构建函数
+    :return: 调用即返回构建好的链
+    """
+    with self._lock:
+      if name in self._chains:
+        raise ValueError(f"链 {name} 已登记")
+      chain = self._chains[name] = LazyChain(name, factory)
+    return chain
+
+
+  async def start(self, mode: Optional[str] = None) -> None:
+    """
+    按 LLM_WARM_UP 指定的方式预热
+    """
+    mode = (mode or os.environ.get("LLM_WARM_UP", DEFAULT_WARM_UP_MODE)).lower()
+    if mode not in WARM_UP_MODES:
+      raise ValueError(f"未知的 LLM_WARM_UP：{mode}，可选 {'、'.join(WARM_UP_MODES)}")
+    if mode == "eager":
+      await asyncio.to_thread(self.warm_up)
+    elif mode == "background":
+      self._warm_up_task = asyncio.ensure_future(asyncio.to_thread(self.warm_up))
+
+
+  async def stop(self) -> None:
+    if self._warm_up_task is not None and not self._warm_up_task.done():
+      self._warm_up_task.cancel()
+    self._warm_up_task = None
+
+
+  def warm_up(self) -> None:
+    """
+    构建所有已登记的链，并为每条链声明的档位创建模型客户端与结构化输出；
+    在线程中执行，失败只记录日志，留给首次调用时重试
+    """
+    started = time.perf_counter()
+    with self._lock:
+      chains = list(self._chains.values())
+    for chain in chains:
+      try:
+        chain()
+      except Exception as e:
+        logger.error("预热链 %s 失败：%s", chain.name, e)
+    try:
+      warm_up_routes()
+    except Exception as e:
+      logger.error("预热模型客户端失败：%s", e)
+    self._warm_up_seconds = time.perf_counter() - started
+    logger.info("预热完成：%s 条链，耗时 %.3f 秒", len(chains),
+                self._warm_up_seconds)
+
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      chains: List[LazyChain] = list(self._chains.values())
+    return {
+      "registered": len(chains),
+      "built": sum(chain.built for chain in chains),
+      "warm_up_seconds": round(self._warm_up_seconds, 4)
+      if self._warm_up_seconds is not None else None,
+      "build_seconds": {chain.name: round(chain.build_seconds, 4)
+                        for chain in chains if chain.build_seconds is not None},
+    }
+
+
+# 全局实例
+chain_registry = ChainRegistry()
@@ -0,0 +1,160 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import Runnable, RunnableBinding, \
+  RunnableSequence
+
+from app.LLMs.chain_metrics import chain_metrics
+from app.LLMs.chain_tracing import chain_tracing
+from app.LLMs.LLM import model_registry
+from app.LLMs.llm_governor import llm_endpoint, llm_governor
+from app.LLMs.usage_ledger import UsageCollector, usage_ledger
+from app.utils.session_resolver import current_session_id
+from app.utils.token_estimator import estimate_tokens
+from app.utils.tracing import tracer
+
+# 结构化输出的数据模型与用户故事通常在这个量级，用于预留每分钟 token 预算
+DEFAULT_COMPLETION_TOKENS = 1500
+
+
+class PromptTooLargeError(ValueError):
+  """
+  提示词的估算 token 数超过上限，请求在发送给模型之前被拒绝
+  """
+
+  def __init__(self, estimated_tokens: int, limit: int):
+    super().__init__(f"提示词估算约 {estimated_tokens} 个 token，超过上限 {limit}，"
+                     f"请缩短输入或拆分后分批提交")
+    self.estimated_tokens = estimated_tokens
+    self.limit = limit
+
+
+def max_prompt_tokens() -> int:
+  """
+  单次调用的提示词 token 上限，默认取各档位模型中最大的输入上限
+  """
+  configured = os.environ.get("LLM_MAX_PROMPT_TOKENS")
+  return int(configured) if configured else model_registry.max_input_tokens()
+
+
+def chain_name(chain: Runnable) -> str:
+  """
+  链定义处 with_config(run_name=...) 设置的名称，与指标、追踪中的链名一致
+  """
+  if isinstance(chain, RunnableBinding) and chain.config.get("run_name"):
+    return chain.config["run_name"]
+  return chain.get_name()
+
+
+def estimate_prompt_tokens(chain: Runnable, chain_input: Dict[str, Any]) -> int:
+  """
+  估算一次链调用的提示词 token 数：链以提示词模板开头时按渲染后的提示词估算，否则按输入估算
+  """
+  if isinstance(chain, RunnableBinding):
+    chain = chain.bound
+  prompt = chain.first if isinstance(chain, RunnableSequence) else None
+  try:
+    if isinstance(prompt, BasePromptTemplate):
+      text = prompt.format(**chain_input)
+    else:
+      text = str(chain_input)
+  except Exception:
+    text = str(chain_input)
+  return estimate_tokens(text)
+
+
+def chain_config(usage: Optional[UsageCollector] = None) -> Dict[str, Any]:
+  """
+  每次链调用附带的回调，各阶段耗时与 token 用量按链名记录到指标中；开启追踪时同时记录 span
+  :param usage: 本次调用的用量收集器
+  """
+  callbacks = [chain_metrics]
+  if tracer.enabled:
+    callbacks.append(chain_tracing)
+  if usage is not None:
+    callbacks.append(usage)
+  return {"callbacks": callbacks}
+
+
+@contextmanager
+def usage_recording(chain: Runnable,
+    prompt_tokens: int) -> Iterator[Optional[UsageCollector]]:
+  """
+  发送前预检提示词长度，并把本次链调用的用量记入账本；超过上限的调用记为 rejected
+  :raises PromptTooLargeError: 提示词估算 token 数超过上限
+  """
+  usage = usage_ledger.start(chain_name(chain), llm_endpoint.get(),
+                             current_session_id.get(), prompt_tokens) \
+    if usage_ledger is not None else None
+  limit = max_prompt_tokens()
+  if prompt_tokens > limit:
+    if usage is not None:
+      usage_ledger.finish(usage, "rejected")
+    raise PromptTooLargeError(prompt_tokens, limit)
+
+  status = "success"
+  try:
+    yield usage
+  except (asyncio.CancelledError, GeneratorExit):
+    status = "cancelled"
+    raise
+  except BaseException:
+    status = "error"
+    raise
+  finally:
+    if usage is not None:
+      usage_ledger.finish(usage, status)
+
+
+async def run_chain(chain: Runnable, chain_input: Dict[str, Any]) -> Any:
+  """
+  经过全局限流器调用链，所有 llm 调用都应通过这里发起
+  :raises PromptTooLargeError: 提示词过长，未发送
+  """
+  prompt_tokens = estimate_prompt_tokens(chain, chain_input)
+  with usage_recording(chain, prompt_tokens) as usage:
+    return await llm_governor.run(
+        lambda: chain.ainvoke(chain_input, config=chain_config(usage)),
+        prompt_tokens + DEFAULT_COMPLETION_TOKENS
+    )
+
+
+async def stream_chain(chain: Runnable,
+    chain_input: Dict[str, Any]) -> AsyncIterator[Any]:
+  prompt_tokens = estimate_prompt_tokens(chain, chain_input)
+  with usage_recording(chain, prompt_tokens) as usage:
+    async for chunk in llm_governor.stream(
+        lambda: chain.astream(chain_input, config=chain_config(usage)),
+        prompt_tokens + DEFAULT_COMPLETION_TOKENS
+    ):
+      yield chunk
+
+
+async def run_chain_as_completed(
+    chain: Runnable,
+    chain_inputs: List[Dict[str, Any]],
+    max_concurrency: int
+) -> AsyncIterator[Tuple[int, Any]]:
+  """
+  并发调用链并按完成顺序返回 (下标, 结果)，失败的条目以异常作为结果返回
+  """
+  semaphore = asyncio.Semaphore(max_concurrency)
+
+  async def invoke(index: int, chain_input: Dict[str, Any]) -> Tuple[int, Any]:
+    async with semaphore:
+      try:
+        return index, await run_chain(chain, chain_input)
+      except Exception as e:
+        return index, e
+
+  tasks = [asyncio.create_task(invoke(index, chain_input))
+           for index, chain_input in enumerate(chain_inputs)]
+  try:
+    for finished in asyncio.as_completed(tasks):
+      yield await finished
+  finally:
+    for task in tasks:
+      task.cancel()
@@ -0,0 +1,126 @@
+import threading
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.LLMs.llm_cache import CACHE_HIT_INFO_KEY
+from app.LLMs.model_registry import token_usage
+from app.utils.tracing import Span, current_span, tracer
+
+
+class ChainTracingCallback(BaseCallbackHandler):
+  """
+  把链调用挂到当前请求的 span 下：每次链调用一个 span，其中的每次模型调用一个子 span，
+  记录模型名、token 用量与缓存命中情况。请求未采样时只做一次查询，不记录任何运行
+  """
+  run_inline = True
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # 已开始的 span，以及子运行 run_id -> 所属链调用的 span
+    self._spans: Dict[UUID, Span] = {}
+    self._owners: Dict[UUID, Span] = {}
+
+
+  def on_chain_start(self, serialized: Optional[Dict[str, Any]],
+      inputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+      **kwargs: Any) -> None:
+    if parent_run_id is not None:
+      with self._lock:
+        owner = self._owner(parent_run_id)
+        if owner is not None:
+          self._owners[run_id] = owner
+      return
+
+    name = kwargs.get("name") or (serialized or {}).get("name") or "unknown"
+    span = tracer.start_span(f"chain {name}", parent=current_span.get(),
+                             attributes={"chain.name": name})
+    if span is not None:
+      with self._lock:
+        self._spans[run_id] = span
+
+
+  def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+    self._end(run_id)
+
+
+  def on_chain_error(self, error: BaseException, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    self._end(run_id, error)
+
+
+  def on_chat_model_start(self, serialized: Optional[Dict[str, Any]],
+      messages: List[List[Any]], *, run_id: UUID,
+      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+    self._start_llm(run_id, parent_run_id, kwargs)
+
+
+  def on_llm_start(self, serialized: Optional[Dict[str, Any]],
+      prompts: List[str], *, run_id: UUID,
+      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+    self._start_llm(run_id, parent_run_id, kwargs)
+
+
+  def on_llm_end(self, response: LLMResult, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    with self._lock:
+      span = self._spans.get(run_id)
+    if span is not None:
+      prompt_tokens, cached_tokens, completion_tokens = token_usage(response)
+      span.set_attribute("llm.usage.prompt_tokens", prompt_tokens)
+      span.set_attribute("llm.usage.cached_prompt_tokens", cached_tokens)
+      span.set_attribute("llm.usage.completion_tokens", completion_tokens)
+      span.set_attribute("llm.cache", _cache_status(response))
+    self._end(run_id)
+
+
+  def on_llm_error(self, error: BaseException, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    self._end(run_id, error)
+
+
+  def _start_llm(self, run_id: UUID, parent_run_id: Optional[UUID],
+      kwargs: Dict[str, Any]) -> None:
+    with self._lock:
+      owner = self._owner(parent_run_id) if parent_run_id else None
+    if owner is None:
+      return
+    params = kwargs.get("invocation_params") or {}
+    metadata = kwargs.get("metadata") or {}
+    span = tracer.start_span("llm", parent=owner, kind="client", attributes={
+      "llm.model": params.get("model_name") or params.get("model")
+                   or metadata.get("ls_model_name"),
+      "llm.provider": metadata.get("ls_provider"),
+    })
+    with self._lock:
+      self._spans[run_id] = span
+
+
+  def _owner(self, run_id: UUID) -> Optional[Span]:
+    return self._spans.get(run_id) or self._owners.get(run_id)
+
+
+  def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+    with self._lock:
+      self._owners.pop(run_id, None)
+      span = self._spans.pop(run_id, None)
+    if span is None:
+      return
+    if error is not None:
+      span.record_error(error)
+    tracer.finish(span)
+
+
+def _cache_status(response: LLMResult) -> str:
+  for generations in response.generations:
+    for generation in generations:
+      tier = (generation.generation_info or {}).get(CACHE_HIT_INFO_KEY)
+      if tier:
+        return f"{tier}_hit"
+  return "miss"
+
+
+# 全局实例
+chain_tracing = ChainTracingCallback()
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import time
+from operator import itemgetter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, \
+  CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.output_parsers import JsonOutputParser, \
+  PydanticOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, \
+  ChatResult
+from langchain_core.runnables import Runnable, RunnableMap, \
+  RunnablePassthrough
+
+from app.utils.token_estimator import estimate_tokens
+
+DEFAULT_LATENCY_SECONDS = 0.2
+DEFAULT_TOKENS_PER_SECOND = 400.0
+DEFAULT_STORY_COUNT = 8
+DEFAULT_ENTITY_COUNT = 6
+# 流式输出时每个分片的字符数
+CHUNK_CHARS = 16
+TEXT_OUTPUT = "text"
+
+
+class FakeChatModel(BaseChatModel):
+  """
+  不访问网络的模型，用于离线基准测试：按设定的首个 token 延迟与输出速率返回预置的输出。
+  结构化输出按 schema 的标题选择预置的 JSON，普通调用返回预置的文本
+  """
+  latency_seconds: float = DEFAULT_LATENCY_SECONDS
+  tokens_per_second: float = DEFAULT_TOKENS_PER_SECOND
+  responses: Dict[str, str] = {}
+  model_name: str = "fake"
+
+  @property
+  def _llm_type(self) -> str:
+    return "fake-chat-model"
+
+
+  @property
+  def _identifying_params(self) -> Dict[str, Any]:
+    return {"model_name": self.model_name}
+
+
+  def with_structured_output(
+      self,
+      schema: Any,
+      *,
+      include_raw: bool = False,
+      **kwargs: Any
+  ) -> Runnable:
+    """
+    与 ChatOpenAI 的 json_schema 模式行为一致：pydantic 模型解析为对象，json schema 字典解析为字典
+    """
+    output_name = schema.get("title", TEXT_OUTPUT) if isinstance(schema, dict) \
+      else schema.__name__
+    model = self.bind(output_name=output_name)
+    parser = JsonOutputParser() if isinstance(schema, dict) \
+      else PydanticOutputParser(pydantic_object=schema)
+    if not include_raw:
+      return model | parser
+    parser_assign = RunnablePassthrough.assign(
+        parsed=itemgetter("raw") | parser, parsing_error=lambda _: None)
+    parser_none = RunnablePassthrough.assign(parsed=lambda _: None)
+    parser_with_fallback = parser_assign.with_fallbacks(
+        [parser_none], exception_key="parsing_error")
+    return RunnableMap(raw=model) | parser_with_fallback
+
+
+  def _generate(
+      self,
+      messages: List[BaseMessage],
+      stop: Optional[List[str]] = None,
+      run_manager: Optional[CallbackManagerForLLMRun] = None,
+      output_name: str = TEXT_OUTPUT,
+      **kwargs: Any
+  ) -> ChatResult:
+    content = self._content(output_name)
+    time.sleep(self._duration(content))
+    return self._result(messages, content)
+
+
+  async def _agenerate(
+      self,
+      messages: List[BaseMessage],
+      stop: Optional[List[str]] = None,
+      run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+      output_name: str = TEXT_OUTPUT,
+      **kwargs: Any
+  ) -> ChatResult:
+    content = self._content(output_name)
+    await asyncio.sleep(self._duration(content))
+    return self._result(messages, content)
+
+
+  def _stream(
+      self,
+      messages: List[BaseMessage],
+      stop: Optional[List[str]] = None,
+      run_manager: Optional[CallbackManagerForLLMRun] = None,
+      output_name: str = TEXT_OUTPUT,
+      **kwargs: Any
+  ) -> Iterator[ChatGenerationChunk]:
+    content = self._content(output_name)
+    time.sleep(self.latency_seconds)
+    for piece in _pieces(content):
+      time.sleep(self._piece_seconds(piece))
+      chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+      if run_manager:
+        run_manager.on_llm_new_token(piece, chunk=chunk)
+      yield chunk
+    yield self._usage_chunk(messages, content)
+
+
+  async def _astream(
+      self,
+      messages: List[BaseMessage],
+      stop: Optional[List[str]] = None,
+      run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+      output_name: str = TEXT_OUTPUT,
+      **kwargs: Any
+  ) -> AsyncIterator[ChatGenerationChunk]:
+    content = self._content(output_name)
+    await asyncio.sleep(self.latency_seconds)
+    for piece in _pieces(content):
+      await asyncio.sleep(self._piece_seconds(piece))
+      chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+      if run_manager:
+        await run_manager.on_llm_new_token(piece, chunk=chunk)
+      yield chunk
+    yield self._usage_chunk(messages, content)
+
+
+  def _content(self, output_name: str) -> str:
+    return self.responses.get(output_name) or self.responses[TEXT_OUTPUT]
+
+
+  def _duration(self, content: str) -> float:
+    return self.latency_seconds + self._piece_seconds(content)
+
+
+  def _piece_seconds(self, piece: str) -> float:
+    if self.tokens_per_second <= 0:
+      return 0.0
+    return estimate_tokens(piece) / self.tokens_per_second
+
+
+  def _result(self, messages: List[BaseMessage], content: str) -> ChatResult:
+    message = AIMessage(content=content,
+                        usage_metadata=_usage(messages, content))
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+  def _usage_chunk(self, messages: List[BaseMessage],
+      content: str) -> ChatGenerationChunk:
+    return ChatGenerationChunk(message=AIMessageChunk(
+        content="", usage_metadata=_usage(messages, content)))
+
+
+def _pieces(content: str) -> List[str]:
+  return [content[index:index + CHUNK_CHARS]
+          for index in range(0, len(content), CHUNK_CHARS)]
+
+
+def _usage(messages: List[BaseMessage], content: str) -> Dict[str, int]:
+  input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+  output_tokens = estimate_tokens(content)
+  return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+          "total_tokens": input_tokens + output_tokens}
+
+
+def build_user_stories(story_count: int) -> Dict[str, Any]:
+  return {"stories": [{
+    "function_name": f"管理任务{index}",
+    "role": "作为团队成员",
+    "action": f"我想创建并分配第{index}类任务（Task{index}）",
+    "value": "这样我就可以追踪团队的工作进度",
+    "acceptance_criteria": [f"可以创建第{index}类任务", f"可以分配第{index}类任务"],
+  } for index in range(story_count)]}
+
+
+def build_data_model(entity_count: int) -> Dict[str, Any]:
+  entities = [{
+    "name": f"Task{index}",
+    "title": f"第{index}类任务",
+    "type": "table",
+    "properties": [{
+      "name": name,
+      "label": label,
+      "type": type_name,
+      "length": length,
+      "accuracy": 0,
+      "required": required,
+      "description": label,
+      "is_primary_key": name == "id",
+      "is_associated": name == "parent_id",
+    } for name, label, type_name, length, required in (
+        ("id", "主键", "bigint", 20, True),
+        ("title", "标题", "string", 128, True),
+        ("parent_id", "上级任务", "bigint", 20, False),
+        ("due_date", "截止日期", "date", 0, False),
+    )],
+  } for index in range(entity_count)]
+  relationships = [{
+    "entity": f"Task{index}",
+    "related_entity": f"Task{index + 1}",
+    "cardinality": "one_to_many",
+    "relations": [{"property": "id", "related_property": "parent_id"}],
+  } for index in range(entity_count - 1)]
+  return {"entities": entities, "relationships": relationships}
+
+
+def build_fake_responses() -> Dict[str, str]:
+  """
+  预置输出：FAKE_LLM_RESPONSES_PATH 指向的 JSON 文件（schema 标题 -> 输出文本）优先，
+  其余按 FAKE_LLM_STORIES 与 FAKE_LLM_ENTITIES 生成固定的用户故事与数据模型
+  """
+  responses = {
+    "UserStoriesResponse": json.dumps(build_user_stories(
+        int(os.environ.get("FAKE_LLM_STORIES", DEFAULT_STORY_COUNT))),
+        ensure_ascii=False),
+    "DataModelResponse": json.dumps(build_data_model(
+        int(os.environ.get("FAKE_LLM_ENTITIES", DEFAULT_ENTITY_COUNT))),
+        ensure_ascii=False),
+    TEXT_OUTPUT: "# 文档\n\n" + "\n".join(f"- 条目 {index}" for index in range(20)),
+  }
+  path = os.environ.get("FAKE_LLM_RESPONSES_PATH")
+  if path:
+    with open(path, "r", encoding="utf-8") as f:
+      responses.update({name: content if isinstance(content, str)
+                        else json.dumps(content, ensure_ascii=False)
+                        for name, content in json.load(f).items()})
+  return responses
+
+
+def build_fake_chat_model(model_name: str, **kwargs: Any) -> FakeChatModel:
+  """
+  根据环境变量 FAKE_LLM_LATENCY_SECONDS 与 FAKE_LLM_TOKENS_PER_SECOND 创建离线模型
+  :param model_name: 模型名，只用于统计与缓存键
+  :param kwargs: 传给模型的其他参数，如 cache 与 callbacks
+  """
+  return FakeChatModel(
+      model_name=model_name,
+      latency_seconds=float(os.environ.get("FAKE_LLM_LATENCY_SECONDS",
+                                           DEFAULT_LATENCY_SECONDS)),
+      tokens_per_second=float(os.environ.get("FAKE_LLM_TOKENS_PER_SECOND",
+                                             DEFAULT_TOKENS_PER_SECOND)),
+      responses=build_fake_responses(),
+      **kwargs
+  )
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_DB_PATH = 'app/cache/llm_cache.sqlite3'
+LLM_CACHE_BYPASS_HEADER = "X-LLM-Cache"
+# 命中缓存时写入 generation_info 的键，值为命中的层级（memory / disk），供回调区分真实调用与缓存
+CACHE_HIT_INFO_KEY = "llm_cache"
+
+# 由中间件按请求头设置，为 True 时本次请求跳过缓存读取（仍会写入最新结果）
+llm_cache_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass",
+                                                default=False)
+
+
+class LLMResponseCache(BaseCache):
+  """
+  以 (渲染后的提示词, 模型配置) 的哈希为键的两级 llm 响应缓存：
+  内存 LRU 层 + SQLite 磁盘层，均支持 TTL 与条目数上限
+  """
+
+  def __init__(
+      self,
+      db_path: str = DEFAULT_CACHE_DB_PATH,
+      max_memory_entries: int = 256,
+      max_disk_entries: int = 5000,
+      ttl_seconds: float = 24 * 3600
+  ):
+    self.db_path = db_path
+    self.max_memory_entries = max_memory_entries
+    self.max_disk_entries = max_disk_entries
+    self.ttl_seconds = ttl_seconds
+
+    self._memory: "OrderedDict[str, Tuple[float, RETURN_VAL_TYPE]]" = OrderedDict()
+    self._memory_lock = threading.Lock()
+    self._disk_lock = threading.Lock()
+    self._counters = {
+      "memory_hits": 0,
+      "disk_hits": 0,
+      "misses": 0,
+      "bypasses": 0,
+      "writes": 0,
+      "evictions": 0,
+    }
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    self._conn = sqlite3.connect(db_path, check_same_thread=False)
+    self._conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+        "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+    )
+    self._conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed "
+        "ON llm_cache (accessed_at)"
+    )
+    self._conn.commit()
+
+
+  @staticmethod
+  def make_key(prompt: str, llm_string: str) -> str:
+    """
+    llm_string 由 langchain 生成，已包含模型名、temperature 以及绑定的工具等调用参数
+    """
+    digest = hashlib.sha256()
+    digest.update(prompt.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(llm_string.encode("utf-8"))
+    return digest.hexdigest()
+
+
+  def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+    if llm_cache_bypass.get():
+      self._count("bypasses")
+      return None
+
+    key = self.make_key(prompt, llm_string)
+    cached = self._memory_get(key)
+    if cached is not None:
+      self._count("memory_hits")
+      return mark_cache_hit(cached, "memory")
+
+    row = self._disk_get(key)
+    if row is None:
+      self._count("misses")
+      return None
+
+    created_at, cached = row
+    self._count("disk_hits")
+    self._memory_put(key, cached, created_at)
+    return mark_cache_hit(cached, "disk")
+
+
+  def update(self, prompt: str, llm_string: str,
+      return_val: RETURN_VAL_TYPE) -> None:
+    key = self.make_key(prompt, llm_string)
+    self._memory_put(key, return_val)
+    self._disk_put(key, return_val)
+    self._count("writes")
+
+
+  async def alookup(self, prompt: str,
+      llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+    if llm_cache_bypass.get():
+      self._count("bypasses")
+      return None
+
+    key = self.make_key(prompt, llm_string)
+    cached = self._memory_get(key)
+    if cached is not None:
+      self._count("memory_hits")
+      return mark_cache_hit(cached, "memory")
+
+    row = await asyncio.to_thread(self._disk_get, key)
+    if row is None:
+      self._count("misses")
+      return None
+
+    created_at, cached = row
+    self._count("disk_hits")
+    self._memory_put(key, cached, created_at)
+    return mark_cache_hit(cached, "disk")
+
+
+  async def aupdate(self, prompt: str, llm_string: str,
+      return_val: RETURN_VAL_TYPE) -> None:
+    key = self.make_key(prompt, llm_string)
+    self._memory_put(key, return_val)
+    await asyncio.to_thread(self._disk_put, key, return_val)
+    self._count("writes")
+
+
+  def clear(self, **kwargs: Any) -> None:
+    with self._memory_lock:
+      self._memory.clear()
+    with self._disk_lock:
+      self._conn.execute("DELETE FROM llm_cache")
+      self._conn.commit()
+
+
+  def stats(self) -> Dict[str, Any]:
+    """
+    获取缓存命中统计
+    :return: 各计数器、命中率与两级缓存的当前条目数
+    """
+    with self._memory_lock:
+      counters = dict(self._counters)
+      memory_entries = len(self._memory)
+    with self._disk_lock:
+      disk_entries = self._conn.execute(
+          "SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+    hits = counters["memory_hits"] + counters["disk_hits"]
+    return {
+      **counters,
+      "hit_ratio": hits / lookups if lookups else 0.0,
+      "memory_entries": memory_entries,
+      "disk_entries": disk_entries,
+    }
+
+
+  def _count(self, name: str, amount: int = 1) -> None:
+    with self._memory_lock:
+      self._counters[name] += amount
+
+
+  def _is_expired(self, created_at: float) -> bool:
+    return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+
+  def _memory_get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+    with self._memory_lock:
+      entry = self._memory.get(key)
+      if entry is None:
+        return None
+      created_at, value = entry
+      if self._is_expired(created_at):
+        del self._memory[key]
+        return None
+      self._memory.move_to_end(key)
+      return value
+
+
+  def _memory_put(self, key: str, value: RETURN_VAL_TYPE,
+      created_at: Optional[float] = None) -> None:
+    """
+    :param created_at: 从磁盘提升的条目沿用磁盘上的写入时间，过期时间不因提升而延长
+    """
+    with self._memory_lock:
+      self._memory[key] = (time.time() if created_at is None else created_at,
+                           value)
+      self._memory.move_to_end(key)
+      while len(self._memory) > self.max_memory_entries:
+        self._memory.popitem(last=False)
+        self._counters["evictions"] += 1
+
+
+  def _disk_get(self, key: str) -> Optional[Tuple[float, RETURN_VAL_TYPE]]:
+    """
+    :return: 条目的写入时间与内容，不存在、已过期或无法反序列化时返回 None
+    """
+    with self._disk_lock:
+      row = self._conn.execute(
+          "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+      ).fetchone()
+      if row is None:
+        return None
+      value, created_at = row
+      if self._is_expired(created_at):
+        self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        self._conn.commit()
+        return None
+      self._conn.execute(
+          "UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+          (time.time(), key)
+      )
+      self._conn.commit()
+
+    try:
+      with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return created_at, loads(value, allowed_objects="core")
+    except Exception as e:
+      logger.error("llm 缓存条目反序列化失败，已忽略：%s", e)
+      return None
+
+
+  def _disk_put(self, key: str, value: RETURN_VAL_TYPE) -> None:
+    now = time.time()
+    serialized = dumps(value)
+    with self._disk_lock:
+      self._conn.execute(
+          "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) "
+          "VALUES (?, ?, ?, ?)",
+          (key, serialized, now, now)
+      )
+      if self.ttl_seconds > 0:
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?",
+                           (now - self.ttl_seconds,))
+      overflow = self._conn.execute(
+          "SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_disk_entries
+      if overflow > 0:
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+            (overflow,)
+        )
+      self._conn.commit()
+    if overflow > 0:
+      self._count("evictions", overflow)
+
+
+def mark_cache_hit(cached: RETURN_VAL_TYPE, tier: str) -> RETURN_VAL_TYPE:
+  """
+  返回带命中层级标记的副本；langchain 会原地修改命中的结果，副本也避免了污染缓存条目
+  """
+  return [generation.model_copy(update={"generation_info": {
+    **(generation.generation_info or {}), CACHE_HIT_INFO_KEY: tier}})
+    for generation in cached]
+
+
+def build_llm_cache() -> Optional[LLMResponseCache]:
+  """
+  按环境变量构建 llm 响应缓存，LLM_CACHE_ENABLED=false 时返回 None
+  """
+  if os.environ.get("LLM_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+    return None
+
+  return LLMResponseCache(
+      db_path=os.environ.get("LLM_CACHE_DB_PATH", DEFAULT_CACHE_DB_PATH),
+      max_memory_entries=int(os.environ.get("LLM_CACHE_MEMORY_SIZE", 256)),
+      max_disk_entries=int(os.environ.get("LLM_CACHE_DISK_SIZE", 5000)),
+      ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 24 * 3600)),
+  )
+
+
+def is_cache_bypass_requested(header_value: Optional[str]) -> bool:
+  return (header_value or "").strip().lower() in ("bypass", "no-cache", "off")
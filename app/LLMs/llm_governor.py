@@ -0,0 +1,389 @@
+import asyncio
+import math
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, \
+  Optional, Tuple, TypeVar
+
+
+from app.logger.logger import get_logger
+from app.utils.tracing import tracer
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# 由中间件或任务队列设置，用于在不同接口之间公平排队
+llm_endpoint: ContextVar[str] = ContextVar("llm_endpoint", default="internal")
+
+
+class LLMOverloadedError(RuntimeError):
+  """
+  排队超时或多次被限流后仍失败，调用方应稍后重试
+  """
+
+  def __init__(self, message: str, retry_after: float):
+    super().__init__(message)
+    self.retry_after = retry_after
+
+
+class TokenBucket:
+  """
+  每分钟补充 capacity 个令牌的令牌桶
+  """
+
+  def __init__(self, per_minute: float):
+    self.capacity = float(per_minute)
+    self.rate = self.capacity / 60.0
+    self.tokens = self.capacity
+    self.updated = time.monotonic()
+
+
+  def delay_for(self, amount: float) -> float:
+    self._refill()
+    amount = min(amount, self.capacity)
+    if self.tokens >= amount:
+      return 0.0
+    return (amount - self.tokens) / self.rate
+
+
+  def consume(self, amount: float) -> None:
+    self._refill()
+    self.tokens -= min(amount, self.capacity)
+
+
+  def _refill(self) -> None:
+    now = time.monotonic()
+    self.tokens = min(self.capacity,
+                      self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+
+@dataclass
+class _Waiter:
+  endpoint: str
+  tokens: int
+  future: asyncio.Future
+  enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class LLMGovernor:
+  """
+  所有 llm 调用共用的限流器：
+  - 每分钟请求数与 token 数两个令牌桶
+  - 同时进行的调用数上限，被限流时减半，成功后逐步恢复（AIMD）
+  - 按接口分别排队，轮流放行，避免某个接口的大批量请求饿死其他接口
+  - 遇到 429 / 5xx / 超时按带抖动的指数退避重试，429 时暂停所有放行
+  """
+
+  def __init__(
+      self,
+      requests_per_minute: int = 60,
+      tokens_per_minute: int = 100_000,
+      max_in_flight: int = 8,
+      max_retries: int = 4,
+      base_backoff: float = 1.0,
+      max_backoff: float = 30.0,
+      queue_timeout: float = 120.0
+  ):
+    self.max_in_flight = max_in_flight
+    self.max_retries = max_retries
+    self.base_backoff = base_backoff
+    self.max_backoff = max_backoff
+    self.queue_timeout = queue_timeout
+
+    self._requests = TokenBucket(requests_per_minute)
+    self._tokens = TokenBucket(tokens_per_minute)
+    self._limit = float(max_in_flight)
+    self._in_flight = 0
+    self._paused_until = 0.0
+    self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._wakeup: Optional[asyncio.Event] = None
+    self._dispatcher: Optional[asyncio.Task] = None
+
+    self._waits: Deque[float] = deque(maxlen=1000)
+    self._counters = {"admitted": 0, "succeeded": 0, "failed": 0,
+                      "retries": 0, "throttled": 0, "queue_timeouts": 0}
+
+
+  async def run(
+      self,
+      call: Callable[[], Awaitable[T]],
+      estimated_tokens: int,
+      endpoint: Optional[str] = None
+  ) -> T:
+    """
+    排队获得放行后执行一次 llm 调用，可重试的错误按退避策略重试
+    :param call: 发起调用的无参协程函数，每次重试都会重新调用
+    :param estimated_tokens: 本次调用预计消耗的 token 数
+    :param endpoint: 排队所属的接口，默认取当前请求的接口
+    :return: 调用结果
+    """
+    endpoint = endpoint or llm_endpoint.get()
+    attempt = 0
+    while True:
+      with tracer.span("llm.queue", attributes={"llm.endpoint": endpoint,
+                                                "llm.attempt": attempt}):
+        await self._acquire(endpoint, estimated_tokens)
+      released = False
+      try:
+        result = await call()
+      except Exception as e:
+        released = True
+        delay = self._on_failure(e, attempt)
+        if delay is None:
+          raise
+        attempt += 1
+      else:
+        released = True
+        self._on_success()
+        return result
+      finally:
+        # 调用被取消（任务取消、客户端断开）时归还名额
+        if not released:
+          self._release()
+      await asyncio.sleep(delay)
+
+
+  async def stream(
+      self,
+      make_stream: Callable[[], AsyncIterator[T]],
+      estimated_tokens: int,
+      endpoint: Optional[str] = None
+  ) -> AsyncIterator[T]:
+    """
+    流式调用占用一个并发名额直到流结束；只有在收到第一个分块之前失败才会重试
+    """
+    endpoint = endpoint or llm_endpoint.get()
+    attempt = 0
+    while True:
+      with tracer.span("llm.queue", attributes={"llm.endpoint": endpoint,
+                                                "llm.attempt": attempt}):
+        await self._acquire(endpoint, estimated_tokens)
+      started = False
+      released = False
+      try:
+        async for chunk in make_stream():
+          started = True
+          yield chunk
+      except Exception as e:
+        released = True
+        if started:
+          self._counters["failed"] += 1
+          self._release()
+          raise
+        delay = self._on_failure(e, attempt)
+        if delay is None:
+          raise
+        attempt += 1
+      else:
+        released = True
+        self._on_success()
+        return
+      finally:
+        # 调用方提前结束迭代时归还名额
+        if not released:
+          self._release()
+      await asyncio.sleep(delay)
+
+
+  def stats(self) -> Dict[str, Any]:
+    waits = sorted(self._waits)
+    queue_depth = {endpoint: len(queue)
+                   for endpoint, queue in self._queues.items() if queue}
+    return {
+      **self._counters,
+      "in_flight": self._in_flight,
+      "concurrency_limit": round(self._limit, 2),
+      "max_in_flight": self.max_in_flight,
+      "queue_depth": sum(queue_depth.values()),
+      "queue_depth_by_endpoint": queue_depth,
+      "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+      "wait_seconds": {
+        "samples": len(waits),
+        "mean": round(sum(waits) / len(waits), 4) if waits else 0.0,
+        "p95": round(waits[int(len(waits) * 0.95) - 1], 4) if waits else 0.0,
+        "max": round(waits[-1], 4) if waits else 0.0,
+      },
+    }
+
+
+  async def _acquire(self, endpoint: str, tokens: int) -> None:
+    self._ensure_dispatcher()
+    waiter = _Waiter(endpoint=endpoint, tokens=tokens,
+                     future=self._loop.create_future())
+    self._queues.setdefault(endpoint, deque()).append(waiter)
+    self._wakeup.set()
+    try:
+      # 不用 wait_for：3.11 中放行与取消同时发生时它会吞掉取消，被取消的调用照常执行
+      async with asyncio.timeout(self.queue_timeout):
+        await waiter.future
+    except TimeoutError:
+      if waiter.future.done() and not waiter.future.cancelled():
+        self._release()
+      self._counters["queue_timeouts"] += 1
+      raise LLMOverloadedError(f"llm 调用排队超过 {self.queue_timeout:.0f} 秒",
+                               retry_after=self.base_backoff * 4)
+    except BaseException:
+      # 放行后、调用方恢复执行前被取消，名额已经计入，需要归还
+      if waiter.future.done() and not waiter.future.cancelled():
+        self._release()
+      raise
+    self._waits.append(time.monotonic() - waiter.enqueued_at)
+
+
+  def _ensure_dispatcher(self) -> None:
+    loop = asyncio.get_running_loop()
+    if self._loop is loop and self._dispatcher is not None \
+        and not self._dispatcher.done():
+      return
+    self._loop = loop
+    self._wakeup = asyncio.Event()
+    self._in_flight = 0
+    self._queues.clear()
+    self._dispatcher = loop.create_task(self._dispatch())
+
+
+  async def _dispatch(self) -> None:
+    while True:
+      waiter = self._next_waiter()
+      if waiter is None:
+        self._wakeup.clear()
+        await self._wakeup.wait()
+        continue
+
+      while not waiter.future.done():
+        delay = self._admission_delay(waiter.tokens)
+        if delay == 0:
+          break
+        self._wakeup.clear()
+        try:
+          await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+          pass
+      if waiter.future.done():
+        continue
+
+      self._requests.consume(1)
+      self._tokens.consume(waiter.tokens)
+      self._in_flight += 1
+      self._counters["admitted"] += 1
+      waiter.future.set_result(None)
+
+
+  def _next_waiter(self) -> Optional[_Waiter]:
+    # 轮询各接口的队列，取出一个后把该接口移到末尾
+    for endpoint in list(self._queues):
+      queue = self._queues[endpoint]
+      while queue and queue[0].future.done():
+        queue.popleft()
+      if not queue:
+        del self._queues[endpoint]
+        continue
+      self._queues.move_to_end(endpoint)
+      return queue.popleft()
+    return None
+
+
+  def _admission_delay(self, tokens: int) -> Optional[float]:
+    """
+    :return: 0 表示可以放行；None 表示需等待其他调用结束；其余为需等待的秒数
+    """
+    if self._in_flight >= max(1, math.floor(self._limit)):
+      return None
+    return max(self._paused_until - time.monotonic(),
+               self._requests.delay_for(1),
+               self._tokens.delay_for(tokens),
+               0.0)
+
+
+  def _release(self) -> None:
+    self._in_flight = max(0, self._in_flight - 1)
+    if self._wakeup is not None:
+      self._wakeup.set()
+
+
+  def _on_success(self) -> None:
+    self._counters["succeeded"] += 1
+    self._limit = min(float(self.max_in_flight), self._limit + 1 / self._limit)
+    self._release()
+
+
+  def _on_failure(self, error: Exception, attempt: int) -> Optional[float]:
+    """
+    :return: 重试前需等待的秒数，不可重试时返回 None
+    """
+    self._release()
+    retryable, throttled, retry_after = classify_llm_error(error)
+    if not retryable:
+      self._counters["failed"] += 1
+      return None
+
+    delay = retry_after if retry_after is not None else random.uniform(
+        0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+    if throttled:
+      self._counters["throttled"] += 1
+      self._limit = max(1.0, self._limit / 2)
+      self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    if attempt >= self.max_retries:
+      self._counters["failed"] += 1
+      raise LLMOverloadedError(f"llm 服务繁忙，重试 {attempt} 次后仍失败：{error}",
+                               retry_after=max(delay, self.base_backoff)) from error
+
+    self._counters["retries"] += 1
+    logger.info("llm 调用失败，%.2f 秒后第 %s 次重试：%s", delay, attempt + 1, error)
+    return delay
+
+
+def classify_llm_error(error: Exception) -> Tuple[bool, bool, Optional[float]]:
+  """
+  :return: (是否可重试, 是否为限流, 服务端要求的等待秒数)
+  """
+  # openai 较重，只在出错时导入，模型客户端创建后它已在内存中
+  import openai
+
+  if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError,
+                        asyncio.TimeoutError)):
+    return True, False, None
+
+  status_code = getattr(error, "status_code", None)
+  response = getattr(error, "response", None)
+  if status_code is None and response is not None:
+    status_code = getattr(response, "status_code", None)
+  if status_code is None:
+    return False, False, None
+
+  retry_after = None
+  headers = getattr(response, "headers", None) or {}
+  try:
+    retry_after = float(headers.get("retry-after")) \
+      if headers.get("retry-after") else None
+  except (TypeError, ValueError):
+    retry_after = None
+
+  if status_code == 429:
+    return True, True, retry_after
+  if status_code >= 500:
+    return True, False, retry_after
+  return False, False, None
+
+
+def build_llm_governor() -> LLMGovernor:
+  return LLMGovernor(
+      requests_per_minute=int(os.environ.get("LLM_RPM", 60)),
+      tokens_per_minute=int(os.environ.get("LLM_TPM", 100_000)),
+      max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", 8)),
+      max_retries=int(os.environ.get("LLM_MAX_RETRIES", 4)),
+      queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", 120)),
+  )
+
+
+# 全局实例
+llm_governor = build_llm_governor()
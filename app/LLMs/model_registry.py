@@ -0,0 +1,313 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.caches import BaseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+
+from app.LLMs.fake_llm import build_fake_chat_model
+
+DEFAULT_MODEL = "qwen-flash"
+DEFAULT_TEMPERATURE = 0.2
+DEFAULT_LLM_BACKEND = "openai"
+# 离线基准测试使用的模型后端，不访问网络
+FAKE_LLM_BACKEND = "fake"
+
+
+
+class ModelTier(str, Enum):
+  Light = "light"
+  Standard = "standard"
+  Strong = "strong"
+
+
+TIER_ORDER = [ModelTier.Light, ModelTier.Standard, ModelTier.Strong]
+
+
+@dataclass
+class ModelSpec:
+  name: str
+  model: str
+  api_key: Optional[str]
+  base_url: Optional[str]
+  temperature: float = DEFAULT_TEMPERATURE
+  timeout: float = 120.0
+  max_input_tokens: int = 120_000
+  # 在静态的系统提示词上标注 cache_control，仅部分 OpenAI 兼容服务支持
+  prompt_cache_control: bool = False
+
+
+class ModelUsageCallback(BaseCallbackHandler):
+  """
+  记录某个模型每次调用的耗时、首个 token 的等待时间与 token 用量（含命中前缀缓存的 token）
+  """
+  run_inline = True
+
+  def __init__(self, name: str):
+    self.name = name
+    self._lock = threading.Lock()
+    self._started: Dict[UUID, float] = {}
+    self._first_token_seen: Set[UUID] = set()
+    self._stats = {"calls": 0, "errors": 0, "prompt_tokens": 0,
+                   "cached_prompt_tokens": 0, "cache_hit_calls": 0,
+                   "completion_tokens": 0, "total_latency_seconds": 0.0,
+                   "max_latency_seconds": 0.0, "streamed_calls": 0,
+                   "total_first_token_seconds": 0.0}
+
+
+  def on_chat_model_start(self, serialized: Dict[str, Any],
+      messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+    with self._lock:
+      self._started[run_id] = time.monotonic()
+
+
+  def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *,
+      run_id: UUID, **kwargs: Any) -> None:
+    with self._lock:
+      self._started[run_id] = time.monotonic()
+
+
+  def on_llm_new_token(self, token: str, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    with self._lock:
+      if run_id in self._first_token_seen or run_id not in self._started:
+        return
+      self._first_token_seen.add(run_id)
+      self._stats["streamed_calls"] += 1
+      self._stats["total_first_token_seconds"] += \
+        time.monotonic() - self._started[run_id]
+
+
+  def on_llm_end(self, response: LLMResult, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    prompt_tokens, cached_tokens, completion_tokens = token_usage(response)
+    with self._lock:
+      latency = time.monotonic() - self._started.pop(run_id, time.monotonic())
+      self._first_token_seen.discard(run_id)
+      self._stats["calls"] += 1
+      self._stats["prompt_tokens"] += prompt_tokens
+      self._stats["cached_prompt_tokens"] += cached_tokens
+      self._stats["cache_hit_calls"] += 1 if cached_tokens else 0
+      self._stats["completion_tokens"] += completion_tokens
+      self._stats["total_latency_seconds"] += latency
+      self._stats["max_latency_seconds"] = max(self._stats["max_latency_seconds"],
+                                               latency)
+
+
+  def on_llm_error(self, error: BaseException, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    with self._lock:
+      self._started.pop(run_id, None)
+      self._first_token_seen.discard(run_id)
+      self._stats["errors"] += 1
+
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      stats = dict(self._stats)
+    calls = stats["calls"]
+    streamed = stats["streamed_calls"]
+    stats["average_latency_seconds"] = round(
+        stats["total_latency_seconds"] / calls, 4) if calls else 0.0
+    stats["average_first_token_seconds"] = round(
+        stats["total_first_token_seconds"] / streamed, 4) if streamed else 0.0
+    stats["cached_prompt_ratio"] = round(
+        stats["cached_prompt_tokens"] / stats["prompt_tokens"], 4) \
+      if stats["prompt_tokens"] else 0.0
+    stats["total_latency_seconds"] = round(stats["total_latency_seconds"], 4)
+    stats["total_first_token_seconds"] = round(stats["total_first_token_seconds"], 4)
+    stats["max_latency_seconds"] = round(stats["max_latency_seconds"], 4)
+    return stats
+
+
+class ModelRegistry:
+  """
+  按档位管理模型：light 用于格式转换与片段修复，standard 用于一般的生成与修改，
+  strong 用于数据模型设计等较难的调用。输入过长时自动升档，主模型超时时切换到备用端点
+  """
+
+  def __init__(
+      self,
+      specs: Dict[ModelTier, ModelSpec],
+      fallback: Optional[ModelSpec] = None,
+      escalate_tokens: int = 12_000,
+      cache: Optional[BaseCache] = None,
+      backend: str = DEFAULT_LLM_BACKEND
+  ):
+    self.specs = specs
+    self.fallback = fallback
+    self.escalate_tokens = escalate_tokens
+    self.cache = cache
+    self.backend = backend
+
+    self._lock = threading.Lock()
+    self._models: Dict[str, BaseChatModel] = {}
+    self._usage: Dict[str, ModelUsageCallback] = {}
+    self._routes: Dict[str, int] = {tier.value: 0 for tier in ModelTier}
+    self._escalations = 0
+
+
+  def select(self, tier: ModelTier, prompt_tokens: int) -> ModelTier:
+    """
+    :param tier: 链声明的档位
+    :param prompt_tokens: 提示词的估算 token 数
+    :return: 实际使用的档位
+    """
+    index = TIER_ORDER.index(tier)
+    if prompt_tokens > self.escalate_tokens:
+      index = min(index + 1, len(TIER_ORDER) - 1)
+    while index < len(TIER_ORDER) - 1 and \
+        prompt_tokens > self.specs[TIER_ORDER[index]].max_input_tokens:
+      index += 1
+    selected = TIER_ORDER[index]
+    with self._lock:
+      self._routes[selected.value] += 1
+      if selected != tier:
+        self._escalations += 1
+    return selected
+
+
+  def model(self, tier: ModelTier) -> BaseChatModel:
+    return self._chat_model(self.specs[tier])
+
+
+  def prompt_cache_control(self, tier: ModelTier) -> bool:
+    return self.specs[tier].prompt_cache_control
+
+
+  def max_input_tokens(self) -> int:
+    """
+    各档位中最大的输入上限，超过它的提示词没有模型能处理
+    """
+    return max(spec.max_input_tokens for spec in self.specs.values())
+
+
+  def fallback_model(self) -> Optional[BaseChatModel]:
+    return self._chat_model(self.fallback) if self.fallback else None
+
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      usage = {name: callback.stats() for name, callback in self._usage.items()}
+      return {
+        "backend": self.backend,
+        "tiers": {tier.value: spec.model for tier, spec in self.specs.items()},
+        "fallback": self.fallback.model if self.fallback else None,
+        "routes": dict(self._routes),
+        "escalations": self._escalations,
+        "models": usage,
+      }
+
+
+  def _chat_model(self, spec: ModelSpec) -> BaseChatModel:
+    with self._lock:
+      chat_model = self._models.get(spec.name)
+      if chat_model is None:
+        usage = ModelUsageCallback(spec.model)
+        self._usage[spec.name] = usage
+        if self.backend == FAKE_LLM_BACKEND:
+          chat_model = build_fake_chat_model(spec.model, cache=self.cache,
+                                             callbacks=[usage])
+        else:
+          # langchain_openai 与 openai 的导入约占启动时间的三分之一，首次创建客户端时才导入
+          from langchain_openai import ChatOpenAI
+
+          chat_model = ChatOpenAI(
+              api_key=spec.api_key,
+              base_url=spec.base_url,
+              model=spec.model,
+              temperature=spec.temperature,
+              timeout=spec.timeout,
+              cache=self.cache,
+              callbacks=[usage],
+              # 流式调用也返回 token 用量，用于统计命中前缀缓存的 token
+              stream_usage=True,
+              # 重试统一由 llm_governor 负责，避免客户端内部重试绕过限流
+              max_retries=0
+          )
+        self._models[spec.name] = chat_model
+      return chat_model
+
+
+def fallback_exceptions() -> Tuple[Type[Exception], ...]:
+  """
+  主模型超时或连接失败时才切换到备用端点，429 交给 llm_governor 退避
+  """
+  import openai
+
+  return (openai.APITimeoutError, openai.APIConnectionError,
+          openai.InternalServerError)
+
+
+def token_usage(response: LLMResult) -> Tuple[int, int, int]:
+  """
+  :return: (输入 token 数, 其中命中前缀缓存的 token 数, 输出 token 数)
+  """
+  for generations in response.generations:
+    for generation in generations:
+      metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+      if metadata:
+        details = metadata.get("input_token_details") or {}
+        return (metadata.get("input_tokens", 0), details.get("cache_read", 0) or 0,
+                metadata.get("output_tokens", 0))
+  usage = (response.llm_output or {}).get("token_usage") or {}
+  details = usage.get("prompt_tokens_details") or {}
+  return (usage.get("prompt_tokens", 0) or 0, details.get("cached_tokens", 0) or 0,
+          usage.get("completion_tokens", 0) or 0)
+
+
+def llm_backend() -> str:
+  """
+  LLM_BACKEND 为 fake 时所有档位都使用离线的 FakeChatModel
+  """
+  return os.environ.get("LLM_BACKEND", DEFAULT_LLM_BACKEND).lower()
+
+
+def build_model_registry(cache: Optional[BaseCache] = None) -> ModelRegistry:
+  """
+  根据环境变量创建模型注册表；未单独配置的档位都使用 LLM_MODEL
+  """
+  api_key = os.environ.get("OPENAI_API_KEY")
+  base_url = os.environ.get("OPENAI_API_URL")
+  default_model = os.environ.get("LLM_MODEL", DEFAULT_MODEL)
+  timeout = float(os.environ.get("LLM_TIMEOUT_SECONDS", 120))
+  prompt_cache_control = os.environ.get("LLM_PROMPT_CACHE_CONTROL", "false") \
+    .lower() in ("1", "true", "yes")
+
+  specs = {}
+  for tier in ModelTier:
+    suffix = tier.value.upper()
+    specs[tier] = ModelSpec(
+        name=tier.value,
+        model=os.environ.get(f"LLM_MODEL_{suffix}", default_model),
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_input_tokens=int(os.environ.get(f"LLM_MAX_INPUT_TOKENS_{suffix}",
+                                            120_000)),
+        prompt_cache_control=prompt_cache_control,
+    )
+
+  fallback = None
+  if os.environ.get("LLM_FALLBACK_API_URL"):
+    fallback = ModelSpec(
+        name="fallback",
+        model=os.environ.get("LLM_FALLBACK_MODEL", default_model),
+        api_key=os.environ.get("LLM_FALLBACK_API_KEY", api_key),
+        base_url=os.environ.get("LLM_FALLBACK_API_URL"),
+        timeout=timeout,
+    )
+
+  return ModelRegistry(
+      specs=specs,
+      fallback=fallback,
+      escalate_tokens=int(os.environ.get("LLM_ESCALATE_TOKENS", 12_000)),
+      cache=cache,
+      backend=llm_backend(),
+  )
@@ -0,0 +1,99 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from app.LLMs.LLM import model_registry
+from app.LLMs.model_registry import ModelTier, fallback_exceptions
+from app.logger.logger import get_logger
+from app.utils.token_estimator import estimate_tokens
+
+logger = get_logger(__name__)
+
+# 每个 routed_llm 按链声明的档位预先构建的函数，启动预热时调用
+_route_warmers: List[Callable[[], Runnable]] = []
+_route_warmers_lock = threading.Lock()
+
+
+def routed_llm(
+    tier: ModelTier,
+    schema: Optional[Any] = None,
+    include_raw: bool = False
+) -> Runnable:
+  """
+  按链声明的档位与提示词长度选择模型，接在提示词模板之后使用
+  :param tier: 链声明的档位
+  :param schema: 结构化输出的模型或 json schema，为 None 时直接输出消息
+  :param include_raw: 结构化输出是否保留原始消息
+  :return: 接收 PromptValue 的 Runnable
+  """
+  runnables: Dict[Tuple[ModelTier, bool], Runnable] = {}
+  lock = threading.Lock()
+
+  def build(selected: ModelTier) -> Runnable:
+    key = (selected, schema is not None)
+    runnable = runnables.get(key)
+    if runnable is not None:
+      return runnable
+    with lock:
+      runnable = runnables.get(key)
+      if runnable is None:
+        runnable = _with_output(model_registry.model(selected), schema,
+                                include_raw)
+        if model_registry.prompt_cache_control(selected):
+          runnable = RunnableLambda(mark_cache_control,
+                                    name="mark_cache_control") | runnable
+        fallback = model_registry.fallback_model()
+        if fallback is not None:
+          runnable = runnable.with_fallbacks(
+              [_with_output(fallback, schema, include_raw)],
+              exceptions_to_handle=fallback_exceptions())
+        runnables[key] = runnable
+      return runnable
+
+  def route(prompt_value: PromptValue) -> Runnable:
+    prompt_tokens = estimate_tokens(prompt_value.to_string())
+    selected = model_registry.select(tier, prompt_tokens)
+    if selected != tier:
+      logger.info("提示词约 %s tokens，模型档位由 %s 升至 %s",
+                  prompt_tokens, tier.value, selected.value)
+    return build(selected)
+
+  with _route_warmers_lock:
+    _route_warmers.append(lambda: build(tier))
+  return RunnableLambda(route, name=f"route_{tier.value}")
+
+
+def warm_up_routes() -> None:
+  """
+  为已创建的每个 routed_llm 构建其声明档位的模型客户端与结构化输出，升档的情况仍在首次使用时构建
+  """
+  with _route_warmers_lock:
+    warmers = list(_route_warmers)
+  for warm_up in warmers:
+    warm_up()
+
+
+def _with_output(model: Runnable, schema: Optional[Any],
+    include_raw: bool) -> Runnable:
+  if schema is None:
+    return model
+  return model.with_structured_output(schema, include_raw=include_raw)
+
+
+def mark_cache_control(prompt_value: PromptValue) -> List[BaseMessage]:
+  """
+  在开头的静态系统提示词上标注 cache_control，提示服务端缓存这段前缀；
+  提示词模板保证系统提示词中不含变量，变化的内容都在其后的消息中
+  """
+  messages = prompt_value.to_messages()
+  if messages and isinstance(messages[0], SystemMessage) \
+      and isinstance(messages[0].content, str):
+    messages[0] = SystemMessage(content=[{
+      "type": "text",
+      "text": messages[0].content,
+      "cache_control": {"type": "ephemeral"},
+    }])
+  return messages
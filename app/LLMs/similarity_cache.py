@@ -0,0 +1,228 @@
+import asyncio
+import heapq
+import math
+import os
+import threading
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from app.LLMs.llm_cache import llm_cache_bypass
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+DEFAULT_SIMILARITY_CACHE_SIZE = 1000
+# 召回候选时使用的最罕见特征数，以及计算完整相似度的候选数上限
+DEFAULT_MAX_QUERY_FEATURES = 64
+DEFAULT_MAX_CANDIDATES = 16
+
+SparseVector = Dict[int, float]
+
+
+class HashedNgramVectorizer:
+  """
+  把文本映射为字符 n-gram 的哈希稀疏向量。
+  忽略空白、标点与大小写，句子顺序调换只影响少量跨句的 n-gram，适合中英文混排的需求文档
+  """
+
+  def __init__(self, dimensions: int = 1 << 20,
+      ngram_sizes: Tuple[int, ...] = (2, 3)):
+    self.dimensions = dimensions
+    self.ngram_sizes = ngram_sizes
+
+
+  @staticmethod
+  def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(char for char in text
+                   if unicodedata.category(char)[0] not in ("P", "Z", "C", "S"))
+
+
+  def vectorize(self, text: str) -> SparseVector:
+    """
+    :param text: 原始文本
+    :return: L2 归一化后的稀疏向量，词频取对数
+    """
+    normalized = self.normalize(text)
+    counts: Counter = Counter()
+    for size in self.ngram_sizes:
+      for start in range(len(normalized) - size + 1):
+        gram = normalized[start:start + size]
+        counts[zlib.crc32(gram.encode("utf-8")) % self.dimensions] += 1
+    if not counts and normalized:
+      counts[zlib.crc32(normalized.encode("utf-8")) % self.dimensions] = 1
+
+    vector = {feature: 1 + math.log(count) for feature, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {feature: weight / norm for feature, weight in vector.items()} \
+      if norm else {}
+
+
+def cosine_similarity(vector: SparseVector, other: SparseVector) -> float:
+  """
+  两个已归一化的稀疏向量的余弦相似度
+  """
+  if len(other) < len(vector):
+    vector, other = other, vector
+  return sum(weight * other.get(feature, 0.0) for feature, weight in vector.items())
+
+
+@dataclass
+class SimilarityHit:
+  result: Dict[str, Any]
+  similarity: float
+
+
+@dataclass
+class _Entry:
+  session_id: str
+  vector: SparseVector
+  result: Dict[str, Any]
+
+
+class SimilarityCache:
+  """
+  基于文本相似度的结果缓存：向量保存在进程内按会话划分的倒排索引中，只返回同一会话生成过的结果。
+  查询时只用最罕见的若干特征召回候选，再对候选计算完整的余弦相似度，
+  扫描量不随文档长度与条目数增长；向量化与查询都在线程中执行，不阻塞事件循环
+  """
+
+  def __init__(
+      self,
+      name: str,
+      threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+      max_entries: int = DEFAULT_SIMILARITY_CACHE_SIZE,
+      vectorizer: Optional[HashedNgramVectorizer] = None,
+      max_query_features: int = DEFAULT_MAX_QUERY_FEATURES,
+      max_candidates: int = DEFAULT_MAX_CANDIDATES
+  ):
+    self.name = name
+    self.threshold = threshold
+    self.max_entries = max_entries
+    self.vectorizer = vectorizer or HashedNgramVectorizer()
+    self.max_query_features = max_query_features
+    self.max_candidates = max_candidates
+
+    self._lock = threading.Lock()
+    self._next_id = 0
+    self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+    # (会话 id, 特征) -> {条目 id: 权重}
+    self._postings: Dict[Tuple[str, int], Dict[int, float]] = defaultdict(dict)
+    self._counters = {"lookups": 0, "hits": 0, "misses": 0, "bypasses": 0,
+                      "stores": 0, "evictions": 0}
+    self._hit_similarity_total = 0.0
+
+
+  async def lookup(self, session_id: str, text: str) -> Optional[SimilarityHit]:
+    """
+    :param session_id: 只在该会话缓存的结果中查找
+    :param text: 请求的文本
+    :return: 相似度不低于阈值的最相似结果，没有时返回 None
+    """
+    if llm_cache_bypass.get():
+      self._count("bypasses")
+      return None
+    return await asyncio.to_thread(self._lookup, session_id, text)
+
+
+  async def store(self, session_id: str, text: str,
+      result: Dict[str, Any]) -> None:
+    await asyncio.to_thread(self._store, session_id, text, result)
+
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._postings.clear()
+
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      counters = dict(self._counters)
+      hits = counters["hits"]
+      lookups = counters["lookups"]
+      return {
+        **counters,
+        "entries": len(self._entries),
+        "threshold": self.threshold,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "average_hit_similarity": round(self._hit_similarity_total / hits, 4)
+        if hits else 0.0,
+      }
+
+
+  def _lookup(self, session_id: str, text: str) -> Optional[SimilarityHit]:
+    vector = self.vectorizer.vectorize(text)
+    with self._lock:
+      self._counters["lookups"] += 1
+      postings = [self._postings[(session_id, feature)] for feature in vector
+                  if (session_id, feature) in self._postings]
+      matches: Counter = Counter()
+      for entries in heapq.nsmallest(self.max_query_features, postings, key=len):
+        matches.update(entries.keys())
+      candidates = [(entry_id, self._entries[entry_id].vector)
+                    for entry_id, _ in matches.most_common(self.max_candidates)]
+
+    # 向量存入后不再修改，可以在锁外计算相似度
+    best_id, best_score = max(
+        ((entry_id, cosine_similarity(vector, candidate))
+         for entry_id, candidate in candidates),
+        key=lambda item: item[1], default=(None, 0.0))
+    with self._lock:
+      entry = self._entries.get(best_id) if best_id is not None else None
+      if entry is None or best_score < self.threshold:
+        self._counters["misses"] += 1
+        return None
+      self._entries.move_to_end(best_id)
+      self._counters["hits"] += 1
+      self._hit_similarity_total += best_score
+    logger.info("%s 相似度缓存命中，相似度 %.3f", self.name, best_score)
+    return SimilarityHit(result=entry.result, similarity=round(best_score, 4))
+
+
+  def _store(self, session_id: str, text: str, result: Dict[str, Any]) -> None:
+    vector = self.vectorizer.vectorize(text)
+    if not vector:
+      return
+    with self._lock:
+      entry_id = self._next_id
+      self._next_id += 1
+      self._entries[entry_id] = _Entry(session_id, vector, result)
+      for feature, weight in vector.items():
+        self._postings[(session_id, feature)][entry_id] = weight
+      self._counters["stores"] += 1
+
+      while len(self._entries) > self.max_entries:
+        evicted_id, evicted = self._entries.popitem(last=False)
+        for feature in evicted.vector:
+          key = (evicted.session_id, feature)
+          postings = self._postings[key]
+          postings.pop(evicted_id, None)
+          if not postings:
+            del self._postings[key]
+        self._counters["evictions"] += 1
+
+
+  def _count(self, name: str) -> None:
+    with self._lock:
+      self._counters[name] += 1
+
+
+def build_similarity_cache(name: str) -> Optional[SimilarityCache]:
+  """
+  根据环境变量创建相似度缓存，默认关闭
+  """
+  if os.environ.get("SIMILARITY_CACHE_ENABLED", "false").lower() \
+      not in ("1", "true", "yes"):
+    return None
+  return SimilarityCache(
+      name=name,
+      threshold=float(os.environ.get("SIMILARITY_CACHE_THRESHOLD",
+                                     DEFAULT_SIMILARITY_THRESHOLD)),
+      max_entries=int(os.environ.get("SIMILARITY_CACHE_SIZE",
+                                     DEFAULT_SIMILARITY_CACHE_SIZE)),
+  )
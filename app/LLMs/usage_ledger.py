@@ -0,0 +1,307 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.LLMs.llm_cache import CACHE_HIT_INFO_KEY
+from app.LLMs.model_registry import token_usage
+from app.logger.logger import get_logger
+from app.storage.sqlite_store import SQLiteConnectionPool
+
+logger = get_logger(__name__)
+
+DEFAULT_USAGE_DB_PATH = 'app/usage/usage_ledger.sqlite3'
+DEFAULT_FLUSH_INTERVAL_SECONDS = 2.0
+DEFAULT_FLUSH_BATCH_SIZE = 200
+# 聚合查询可用的分组字段
+USAGE_GROUP_COLUMNS = ("endpoint", "session_id", "day", "chain", "model")
+
+
+@dataclass
+class UsageRecord:
+  """
+  一次链调用的用量：估算与实际的 token 数、模型调用次数与总耗时（含排队与重试）
+  """
+  chain: str
+  endpoint: str
+  session_id: str
+  estimated_prompt_tokens: int
+  started_at: float = field(default_factory=time.time)
+  day: str = ""
+  model: str = ""
+  status: str = "success"
+  llm_calls: int = 0
+  cache_hits: int = 0
+  prompt_tokens: int = 0
+  cached_tokens: int = 0
+  completion_tokens: int = 0
+  wall_ms: float = 0.0
+
+  def __post_init__(self):
+    if not self.day:
+      self.day = datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d")
+
+
+USAGE_COLUMNS = [f.name for f in fields(UsageRecord)]
+
+
+class UsageCollector(BaseCallbackHandler):
+  """
+  随单次链调用传入的回调，累计其中所有模型调用的 token 用量；每次调用新建一个，无需按 run_id 区分
+  """
+  run_inline = True
+
+  def __init__(self, record: UsageRecord):
+    self.record = record
+    self._lock = threading.Lock()
+    self._models: List[str] = []
+
+
+  def on_chat_model_start(self, serialized: Optional[Dict[str, Any]],
+      messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+    self._add_model(kwargs)
+
+
+  def on_llm_start(self, serialized: Optional[Dict[str, Any]],
+      prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+    self._add_model(kwargs)
+
+
+  def on_llm_end(self, response: LLMResult, *, run_id: UUID,
+      **kwargs: Any) -> None:
+    prompt_tokens, cached_tokens, completion_tokens = token_usage(response)
+    cache_hit = any((generation.generation_info or {}).get(CACHE_HIT_INFO_KEY)
+                    for generations in response.generations
+                    for generation in generations)
+    with self._lock:
+      self.record.llm_calls += 1
+      if cache_hit:
+        # 命中缓存的结果带着原调用的用量，没有实际消耗 token
+        self.record.cache_hits += 1
+        return
+      self.record.prompt_tokens += prompt_tokens
+      self.record.cached_tokens += cached_tokens
+      self.record.completion_tokens += completion_tokens
+
+
+  def _add_model(self, kwargs: Dict[str, Any]) -> None:
+    params = kwargs.get("invocation_params") or {}
+    model = params.get("model_name") or params.get("model") \
+            or (kwargs.get("metadata") or {}).get("ls_model_name")
+    with self._lock:
+      if model and model not in self._models:
+        self._models.append(model)
+        self.record.model = ",".join(self._models)
+
+
+class UsageLedger:
+  """
+  只追加的用量账本：每次链调用一行，先缓存在内存中，由后台任务批量写入 SQLite，
+  查询前先写入缓存中的记录，聚合结果总是包含最新的调用
+  """
+
+  def __init__(
+      self,
+      db_path: str = DEFAULT_USAGE_DB_PATH,
+      flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+      flush_batch_size: int = DEFAULT_FLUSH_BATCH_SIZE
+  ):
+    self.db_path = db_path
+    self.flush_interval_seconds = flush_interval_seconds
+    self.flush_batch_size = flush_batch_size
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    self._pool = SQLiteConnectionPool(db_path, size=2)
+    self._pending: List[UsageRecord] = []
+    self._lock = threading.Lock()
+    self._flush_lock = asyncio.Lock()
+    self._flusher: Optional[asyncio.Task] = None
+    self._counters = {"recorded": 0, "written": 0, "write_errors": 0}
+    with self._pool.connection() as conn:
+      conn.execute(
+          "CREATE TABLE IF NOT EXISTS usage_ledger ("
+          "id INTEGER PRIMARY KEY AUTOINCREMENT, chain TEXT NOT NULL, "
+          "endpoint TEXT NOT NULL, session_id TEXT NOT NULL, "
+          "estimated_prompt_tokens INTEGER NOT NULL, started_at REAL NOT NULL, "
+          "day TEXT NOT NULL, model TEXT NOT NULL, status TEXT NOT NULL, "
+          "llm_calls INTEGER NOT NULL, cache_hits INTEGER NOT NULL, "
+          "prompt_tokens INTEGER NOT NULL, cached_tokens INTEGER NOT NULL, "
+          "completion_tokens INTEGER NOT NULL, wall_ms REAL NOT NULL)"
+      )
+      conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ledger_day "
+                   "ON usage_ledger (day)")
+      conn.commit()
+
+
+  def start(self, chain: str, endpoint: str, session_id: str,
+      estimated_prompt_tokens: int) -> UsageCollector:
+    """
+    :return: 作为回调传入本次链调用的收集器，调用结束后交给 finish
+    """
+    return UsageCollector(UsageRecord(
+        chain=chain, endpoint=endpoint, session_id=session_id,
+        estimated_prompt_tokens=estimated_prompt_tokens))
+
+
+  def finish(self, collector: UsageCollector, status: str) -> None:
+    record = collector.record
+    record.status = status
+    record.wall_ms = round((time.time() - record.started_at) * 1000, 3)
+    with self._lock:
+      self._pending.append(record)
+      self._counters["recorded"] += 1
+      pending = len(self._pending)
+    if pending >= self.flush_batch_size:
+      self._ensure_flusher(immediate=True)
+    else:
+      self._ensure_flusher()
+
+
+  async def aggregate(
+      self,
+      group_by: str,
+      since: Optional[str] = None,
+      until: Optional[str] = None,
+      endpoint: Optional[str] = None,
+      session_id: Optional[str] = None
+  ) -> List[Dict[str, Any]]:
+    """
+    按 endpoint、session_id、day、chain 或 model 汇总用量，按总 token 数降序排列
+    :param since: 起始日期（含），格式 YYYY-MM-DD
+    :param until: 结束日期（含），格式 YYYY-MM-DD
+    """
+    if group_by not in USAGE_GROUP_COLUMNS:
+      raise ValueError(f"不支持按 {group_by} 汇总，可选：{', '.join(USAGE_GROUP_COLUMNS)}")
+    conditions, params = [], []
+    for column, operator, value in (("day", ">=", since), ("day", "<=", until),
+                                    ("endpoint", "=", endpoint),
+                                    ("session_id", "=", session_id)):
+      if value is not None:
+        conditions.append(f"{column} {operator} ?")
+        params.append(value)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    query = (
+      f"SELECT {group_by}, COUNT(*), SUM(llm_calls), SUM(cache_hits), "
+      "SUM(estimated_prompt_tokens), SUM(prompt_tokens), SUM(cached_tokens), "
+      "SUM(completion_tokens), AVG(wall_ms), MAX(wall_ms), "
+      "SUM(status = 'rejected'), SUM(status NOT IN ('success', 'rejected')) "
+      f"FROM usage_ledger {where}GROUP BY {group_by} "
+      "ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC"
+    )
+    await self.flush()
+    rows = await asyncio.to_thread(self._query, query, params)
+    return [{
+      group_by: key,
+      "calls": calls,
+      "llm_calls": llm_calls,
+      "cache_hits": cache_hits,
+      "estimated_prompt_tokens": estimated,
+      "prompt_tokens": prompt_tokens,
+      "cached_tokens": cached_tokens,
+      "completion_tokens": completion_tokens,
+      "total_tokens": prompt_tokens + completion_tokens,
+      "avg_wall_ms": round(avg_wall_ms, 3),
+      "max_wall_ms": round(max_wall_ms, 3),
+      "rejected": rejected,
+      "failed": failed,
+    } for key, calls, llm_calls, cache_hits, estimated, prompt_tokens,
+          cached_tokens, completion_tokens, avg_wall_ms, max_wall_ms, rejected,
+          failed in rows]
+
+
+  async def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+    await self.flush()
+    rows = await asyncio.to_thread(
+        self._query,
+        f"SELECT {', '.join(USAGE_COLUMNS)} FROM usage_ledger "
+        "ORDER BY id DESC LIMIT ?", [limit])
+    return [dict(zip(USAGE_COLUMNS, row)) for row in rows]
+
+
+  async def flush(self) -> None:
+    async with self._flush_lock:
+      with self._lock:
+        records, self._pending = self._pending, []
+      if not records:
+        return
+      try:
+        await asyncio.to_thread(self._write, records)
+        self._count("written", len(records))
+      except Exception as e:
+        self._count("write_errors")
+        with self._lock:
+          self._pending = records + self._pending
+        logger.error("写入 %s 条用量记录失败，稍后重试：%s", len(records), e)
+
+
+  async def close(self) -> None:
+    if self._flusher is not None:
+      self._flusher.cancel()
+      self._flusher = None
+    await self.flush()
+    self._pool.close()
+
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      return {**self._counters, "pending": len(self._pending)}
+
+
+  def _count(self, name: str, amount: int = 1) -> None:
+    with self._lock:
+      self._counters[name] += amount
+
+
+  def _ensure_flusher(self, immediate: bool = False) -> None:
+    if self._flusher is not None and not self._flusher.done():
+      return
+    try:
+      loop = asyncio.get_running_loop()
+    except RuntimeError:
+      return
+    self._flusher = loop.create_task(self._flush_later(
+        0 if immediate else self.flush_interval_seconds))
+
+
+  async def _flush_later(self, delay: float) -> None:
+    await asyncio.sleep(delay)
+    await self.flush()
+
+
+  def _write(self, records: List[UsageRecord]) -> None:
+    placeholders = ", ".join("?" for _ in USAGE_COLUMNS)
+    with self._pool.connection() as conn:
+      conn.executemany(
+          f"INSERT INTO usage_ledger ({', '.join(USAGE_COLUMNS)}) "
+          f"VALUES ({placeholders})",
+          [tuple(asdict(record).values()) for record in records])
+      conn.commit()
+
+
+  def _query(self, query: str, params: List[Any]) -> List[tuple]:
+    with self._pool.connection() as conn:
+      return conn.execute(query, params).fetchall()
+
+
+def build_usage_ledger() -> Optional[UsageLedger]:
+  """
+  USAGE_LEDGER_ENABLED=false 时不记录用量
+  """
+  if os.environ.get("USAGE_LEDGER_ENABLED", "true").lower() in ("0", "false", "no"):
+    return None
+  return UsageLedger(
+      db_path=os.environ.get("USAGE_LEDGER_DB_PATH", DEFAULT_USAGE_DB_PATH),
+      flush_interval_seconds=float(os.environ.get(
+          "USAGE_LEDGER_FLUSH_SECONDS", DEFAULT_FLUSH_INTERVAL_SECONDS)),
+  )
+
+
+# 全局实例
+usage_ledger = build_usage_ledger()
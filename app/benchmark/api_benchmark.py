@@ -0,0 +1,451 @@
+"""
+离线驱动 main.py 中的全部接口，测量服务自身（路由、校验、修复、存储、限流等）的开销：
+所有 llm 调用由 FakeChatModel 按设定的延迟与输出速率返回预置输出，存储与任务队列写入临时目录。
+按接口输出 p50/p95/p99 延迟、首字节时间、吞吐、每个请求的 CPU 时间与内存峰值
+
+运行：python -m app.benchmark.api_benchmark [--concurrency 1 8] [--requests 40]
+      [--latency 0.05] [--tokens-per-second 2000] [--only user_stories]
+      [--trace-memory] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.benchmark.storage_benchmark import percentile
+from app.LLMs.fake_llm import build_data_model, build_user_stories
+
+try:
+  import resource
+except ImportError:  # Windows 没有 resource 模块，不统计常驻内存
+  resource = None
+
+STORY_COUNT = 8
+ENTITY_COUNT = 6
+REQUIREMENTS = "我们需要一个小团队使用的任务管理应用，支持项目、任务、分配与截止日期。"
+
+
+@dataclass
+class Scenario:
+  method: str
+  path: str
+  body: Optional[Callable[[], Any]] = None
+  params: Dict[str, Any] = field(default_factory=dict)
+  # 视为成功的状态码，取消或重试已结束的任务返回 409 也属于正常结果
+  expected: Tuple[int, ...] = (200,)
+
+  @property
+  def name(self) -> str:
+    return f"{self.method} {self.path}"
+
+
+@dataclass
+class EndpointResult:
+  endpoint: str
+  concurrency: int
+  requests: int
+  failures: int
+  throughput: float
+  p50_ms: float
+  p95_ms: float
+  p99_ms: float
+  first_byte_p50_ms: float
+  cpu_ms_per_request: float
+  peak_memory_kib: Optional[float]
+
+
+def stories() -> Dict[str, Any]:
+  return build_user_stories(STORY_COUNT)
+
+
+def data_model() -> Dict[str, Any]:
+  return build_data_model(ENTITY_COUNT)
+
+
+def revised_stories() -> Dict[str, Any]:
+  revised = stories()
+  revised["stories"][0]["acceptance_criteria"].append("可以修改截止日期")
+  return revised
+
+
+def revised_data_model() -> Dict[str, Any]:
+  revised = data_model()
+  revised["entities"][0]["title"] += "（已修改）"
+  return revised
+
+
+def data_model_requirement() -> Dict[str, Any]:
+  return {"user_story_result": stories(), "human_requirements": "无"}
+
+
+def build_scenarios() -> List[Scenario]:
+  """
+  按 main.py 中的接口顺序列出所有场景，路径中的 {job_id} 在准备阶段确定
+  """
+  save_draft = {"save_as_draft": True, "save_as_result": False, "not_save": False}
+  return [
+    Scenario("GET", "/"),
+    Scenario("GET", "/metrics"),
+    Scenario("GET", "/tracing/stats"),
+    Scenario("GET", "/logging/stats"),
+    Scenario("GET", "/llm_cache/stats"),
+    Scenario("GET", "/llm_models/stats"),
+    Scenario("GET", "/usage/summary", params={"group_by": "endpoint"}),
+    Scenario("GET", "/usage/records"),
+    Scenario("GET", "/usage/stats"),
+    Scenario("GET", "/llm_governor/stats"),
+    Scenario("GET", "/context/stats"),
+    Scenario("GET", "/similarity_cache/stats"),
+    Scenario("GET", "/outcome_cache/stats"),
+    Scenario("GET", "/repair/stats"),
+    Scenario("POST", "/user_stories/json_to_md", stories),
+    Scenario("POST", "/user_stories/generate",
+             lambda: {"requirements": REQUIREMENTS}),
+    Scenario("POST", "/user_stories/generate/stream",
+             lambda: {"requirements": REQUIREMENTS}),
+    Scenario("POST", "/user_stories/generate/batch",
+             lambda: {"items": [{"requirements": REQUIREMENTS}] * 3}),
+    Scenario("GET", "/user_stories/query/draft"),
+    Scenario("GET", "/user_stories/query/result"),
+    Scenario("POST", "/user_stories/modify",
+             lambda: {"requirements": "增加任务评论功能"}),
+    Scenario("POST", "/user_stories/modify/stream",
+             lambda: {"requirements": "增加任务评论功能"}),
+    Scenario("POST", "/user_stories/update/draft", stories),
+    Scenario("POST", "/user_stories/save/draft",
+             lambda: {**save_draft, "user_stories_draft": stories()}),
+    Scenario("POST", "/data_model/json_to_md", data_model),
+    Scenario("POST", "/data_model/generate", data_model_requirement),
+    Scenario("POST", "/data_model/generate/stream", data_model_requirement),
+    Scenario("POST", "/data_model/generate/batch",
+             lambda: {"items": [data_model_requirement()] * 3}),
+    Scenario("POST", "/data_model/modify", data_model_requirement),
+    Scenario("POST", "/data_model/modify/stream", data_model_requirement),
+    Scenario("GET", "/data_model/query/draft"),
+    Scenario("GET", "/data_model/query/result"),
+    Scenario("POST", "/data_model/update/draft", data_model),
+    Scenario("POST", "/data_model/save/draft",
+             lambda: {**save_draft, **data_model()}),
+    Scenario("GET", "/user_stories/draft/versions"),
+    Scenario("GET", "/user_stories/draft/versions/diff",
+             params={"from_version": 1, "to_version": 2}),
+    Scenario("GET", "/user_stories/draft/versions/1"),
+    Scenario("POST", "/user_stories/draft/versions/1/restore"),
+    Scenario("GET", "/data_model/draft/versions"),
+    Scenario("GET", "/data_model/draft/versions/diff",
+             params={"from_version": 1, "to_version": 2}),
+    Scenario("GET", "/data_model/draft/versions/1"),
+    Scenario("POST", "/data_model/draft/versions/1/restore"),
+    Scenario("POST", "/jobs/user_stories/generate",
+             lambda: {"requirements": REQUIREMENTS}, expected=(202,)),
+    Scenario("POST", "/jobs/user_stories/modify",
+             lambda: {"requirements": "增加任务评论功能"}, expected=(202,)),
+    Scenario("POST", "/jobs/data_model/generate", data_model_requirement,
+             expected=(202,)),
+    Scenario("POST", "/jobs/data_model/modify", data_model_requirement,
+             expected=(202,)),
+    Scenario("GET", "/jobs"),
+    Scenario("GET", "/jobs/stats"),
+    Scenario("GET", "/jobs/{job_id}"),
+    Scenario("DELETE", "/jobs/{job_id}", expected=(200, 409)),
+    Scenario("POST", "/jobs/{job_id}/retry", expected=(200, 409)),
+  ]
+
+
+def configure_environment(args: argparse.Namespace, root: Path) -> None:
+  """
+  必须在导入 app.main 之前调用：模型、缓存、存储与任务队列都在导入时按环境变量创建
+  """
+  os.environ.update({
+    "LLM_BACKEND": "fake",
+    "FAKE_LLM_LATENCY_SECONDS": str(args.latency),
+    "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+    "FAKE_LLM_STORIES": str(STORY_COUNT),
+    "FAKE_LLM_ENTITIES": str(ENTITY_COUNT),
+    "LLM_CACHE_ENABLED": "true" if args.llm_cache else "false",
+    "LLM_CACHE_DB_PATH": str(root / "llm_cache.sqlite3"),
+    "OUTCOME_STORE_ROOT": str(root / "outcomes"),
+    "OUTCOME_STORE_DB_PATH": str(root / "outcomes.sqlite3"),
+    "JOB_STORE_PATH": str(root / "jobs.json"),
+    "USAGE_LEDGER_DB_PATH": str(root / "usage_ledger.sqlite3"),
+  })
+  # 默认不让限流成为瓶颈，需要测量限流时可以在环境变量中覆盖
+  os.environ.setdefault("LLM_RPM", "1000000")
+  os.environ.setdefault("LLM_TPM", "1000000000")
+  os.environ.setdefault("LLM_MAX_IN_FLIGHT", "1000")
+
+
+def session_headers(worker_index: int) -> Dict[str, str]:
+  return {"X-Session-Id": f"bench-{worker_index}"}
+
+
+async def prepare_sessions(client: httpx.AsyncClient,
+    concurrency: int) -> Dict[str, str]:
+  """
+  为每个并发准备用户故事与数据模型的草稿、结果以及两个草稿版本，并提交一个任务
+  :return: 场景路径中使用的变量
+  """
+  save_result = {"save_as_draft": False, "save_as_result": True, "not_save": False}
+
+  async def prepare(worker_index: int) -> None:
+    headers = session_headers(worker_index)
+    steps = [
+      ("/user_stories/generate", {"requirements": REQUIREMENTS}),
+      ("/user_stories/update/draft", revised_stories()),
+      ("/user_stories/save/draft", {**save_result, "user_stories_draft": stories()}),
+      ("/data_model/generate", data_model_requirement()),
+      ("/data_model/update/draft", revised_data_model()),
+      ("/data_model/save/draft", {**save_result, **data_model()}),
+    ]
+    for path, body in steps:
+      response = await client.post(path, json=body, headers=headers)
+      response.raise_for_status()
+
+  await asyncio.gather(*(prepare(index) for index in range(concurrency)))
+  response = await client.post("/jobs/user_stories/generate",
+                               json={"requirements": REQUIREMENTS},
+                               headers=session_headers(0))
+  response.raise_for_status()
+  return {"job_id": response.json()["job_id"]}
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    variables: Dict[str, str],
+    concurrency: int,
+    total_requests: int,
+    trace_memory: bool
+) -> EndpointResult:
+  latencies: List[float] = []
+  first_bytes: List[float] = []
+  failures = 0
+  remaining = total_requests
+  path = scenario.path.format(**variables)
+
+  async def worker(worker_index: int) -> None:
+    nonlocal failures, remaining
+    headers = session_headers(worker_index)
+    while remaining > 0:
+      remaining -= 1
+      started = time.perf_counter()
+      first_byte = None
+      async with client.stream(
+          scenario.method, path,
+          json=scenario.body() if scenario.body else None,
+          params=scenario.params, headers=headers
+      ) as response:
+        async for _ in response.aiter_raw():
+          if first_byte is None:
+            first_byte = time.perf_counter() - started
+      elapsed = time.perf_counter() - started
+      latencies.append(elapsed)
+      first_bytes.append(elapsed if first_byte is None else first_byte)
+      if response.status_code not in scenario.expected:
+        failures += 1
+
+  if trace_memory:
+    tracemalloc.reset_peak()
+  cpu_started = time.process_time()
+  rss_started = _peak_rss_kib()
+  started = time.perf_counter()
+  await asyncio.gather(*(worker(index) for index in range(concurrency)))
+  elapsed = time.perf_counter() - started
+  cpu = time.process_time() - cpu_started
+
+  if trace_memory:
+    peak_memory = tracemalloc.get_traced_memory()[1] / 1024
+  elif rss_started is not None:
+    # 常驻内存峰值只增不减，这里记录的是本接口运行期间峰值的增长
+    peak_memory = _peak_rss_kib() - rss_started
+  else:
+    peak_memory = None
+  return EndpointResult(
+      endpoint=scenario.name,
+      concurrency=concurrency,
+      requests=len(latencies),
+      failures=failures,
+      throughput=len(latencies) / elapsed,
+      p50_ms=percentile(latencies, 0.5) * 1000,
+      p95_ms=percentile(latencies, 0.95) * 1000,
+      p99_ms=percentile(latencies, 0.99) * 1000,
+      first_byte_p50_ms=percentile(first_bytes, 0.5) * 1000,
+      cpu_ms_per_request=cpu / len(latencies) * 1000,
+      peak_memory_kib=peak_memory,
+  )
+
+
+def _peak_rss_kib() -> Optional[float]:
+  if resource is None:
+    return None
+  # Linux 上 ru_maxrss 的单位是 KiB
+  return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def print_result(result: EndpointResult) -> None:
+  memory = "-" if result.peak_memory_kib is None \
+    else f"{result.peak_memory_kib:.0f}"
+  print(f"{result.endpoint:<46} {result.concurrency:>4} {result.requests:>5} "
+        f"{result.failures:>4} {result.throughput:>8.1f} {result.p50_ms:>9.1f} "
+        f"{result.p95_ms:>9.1f} {result.p99_ms:>9.1f} "
+        f"{result.first_byte_p50_ms:>9.1f} {result.cpu_ms_per_request:>8.2f} "
+        f"{memory:>9}")
+
+
+async def check_cancellation_releases_slots() -> List[str]:
+  """
+  回归检查：在排队、放行后与调用中的各个时刻取消 llm 调用，名额都应归还，
+  否则取消任务或客户端断开若干次后所有 llm 接口都会返回 503
+  :return: 未通过的检查
+  """
+  from app.LLMs.llm_governor import LLMGovernor
+
+  governor = LLMGovernor(max_in_flight=2, queue_timeout=1)
+
+  async def slow_call() -> None:
+    await asyncio.sleep(60)
+
+  async def fast_call() -> str:
+    return "ok"
+
+  problems = []
+  for steps in range(8):
+    task = asyncio.create_task(governor.run(slow_call, estimated_tokens=1))
+    for _ in range(steps):
+      await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    if governor.stats()["in_flight"]:
+      problems.append(f"调度 {steps} 步后取消，名额未归还")
+  try:
+    await governor.run(fast_call, estimated_tokens=1)
+  except Exception as e:
+    problems.append(f"取消后的调用失败：{e}")
+  return problems
+
+
+def check_global_edits_keep_full_draft() -> List[str]:
+  """
+  回归检查：统一修改所有条目的要求（如“给所有实体加上 created_at 字段”）不能精简草稿，
+  否则还原精简实体时会用草稿原样覆盖模型的修改；点名个别条目的要求仍应精简
+  :return: 未通过的检查
+  """
+  from app.work_flow.data_model.schemas.dto_schemas.data_model_response import \
+    DataModelResponse
+  from app.work_flow.data_model.service.context_service import \
+    condense_data_model_draft, restore_condensed_entities
+  from app.work_flow.user_story.service.context_service import \
+    condense_user_stories_draft
+
+  draft = build_data_model(20)
+  problems = []
+  for instruction in ("给所有实体加上 created_at 字段", "每个实体都要有 created_at 字段",
+                      "add created_at to all entities", "删除审计相关的表"):
+    _, condensed = condense_data_model_draft(draft, instruction, budget=200)
+    if condensed:
+      problems.append(f"“{instruction}”精简了 {len(condensed)} 个实体")
+      continue
+    edited = json.loads(json.dumps(draft))
+    for entity in edited["entities"]:
+      entity["properties"].append(dict(entity["properties"][-1], name="created_at"))
+    restored = restore_condensed_entities(
+        DataModelResponse.model_validate(edited), draft, condensed)
+    kept = sum(any(prop.name == "created_at" for prop in entity.properties)
+               for entity in restored.entities)
+    if kept != len(draft["entities"]):
+      problems.append(f"“{instruction}”还原后只有 {kept} 个实体保留了 created_at")
+  for instruction in ("Task3 加上 created_at 字段", "修改一下字段类型"):
+    _, condensed = condense_data_model_draft(draft, instruction, budget=200)
+    if bool(condensed) != ("Task3" in instruction):
+      problems.append(f"“{instruction}”精简了 {len(condensed)} 个实体")
+  _, condensed = condense_user_stories_draft(build_user_stories(20),
+                                             "所有故事的价值都写得更具体", budget=200)
+  if condensed:
+    problems.append(f"统一修改用户故事时精简了 {len(condensed)} 个故事")
+  return problems
+
+
+async def run(args: argparse.Namespace) -> List[EndpointResult]:
+  # 导入 app.main 时才按 configure_environment 设置的环境变量创建全局实例
+  from app.main import app
+
+  if args.trace_memory:
+    tracemalloc.start()
+  scenarios = [scenario for scenario in build_scenarios()
+               if not args.only or any(keyword in scenario.path
+                                       for keyword in args.only)]
+  print(f"模型延迟 {args.latency}s，输出 {args.tokens_per_second} tokens/s，"
+        f"每个接口 {args.requests} 个请求；内存列为"
+        f"{'tracemalloc 峰值' if args.trace_memory else '常驻内存峰值增长'}（KiB）")
+  print(f"{'接口':<46} {'并发':>4} {'请求':>5} {'失败':>4} {'req/s':>8} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'首字节 ms':>9} "
+        f"{'CPU ms':>8} {'内存':>9}")
+
+  results = []
+  transport = httpx.ASGITransport(app=app)
+  async with app.router.lifespan_context(app):
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark",
+                                 timeout=None) as client:
+      for concurrency in args.concurrency:
+        variables = await prepare_sessions(client, concurrency)
+        for scenario in scenarios:
+          result = await measure(client, scenario, variables, concurrency,
+                                 args.requests, args.trace_memory)
+          print_result(result)
+          results.append(result)
+
+  from app.LLMs.llm_governor import llm_governor
+  problems = await check_cancellation_releases_slots()
+  if llm_governor.stats()["in_flight"]:
+    problems.append(f"全部请求结束后仍有 {llm_governor.stats()['in_flight']} 个名额未归还")
+  print("\n".join(problems) if problems else "取消 llm 调用后并发名额全部归还")
+  problems = check_global_edits_keep_full_draft()
+  print("\n".join(problems) if problems else "统一修改所有条目时草稿不被精简")
+  return results
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+  parser.add_argument("--requests", type=int, default=40,
+                      help="每个接口在每个并发级别下的请求数")
+  parser.add_argument("--latency", type=float, default=0.05,
+                      help="模型返回首个 token 前的等待秒数")
+  parser.add_argument("--tokens-per-second", type=float, default=2000,
+                      help="模型的输出速率，0 表示立即返回全部输出")
+  parser.add_argument("--only", nargs="*", default=[],
+                      help="只测试路径中包含这些关键字的接口")
+  parser.add_argument("--llm-cache", action="store_true",
+                      help="开启 llm 响应缓存，默认关闭以测量完整的调用路径")
+  parser.add_argument("--trace-memory", action="store_true",
+                      help="用 tracemalloc 统计内存峰值，会明显增加 CPU 开销")
+  parser.add_argument("--log-level", default="WARNING")
+  parser.add_argument("--output", help="把结果写入 JSON 文件，便于对比不同提交")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as root:
+    configure_environment(args, Path(root))
+    for name in ("app", "app.access", "httpx"):
+      logging.getLogger(name).setLevel(args.log_level.upper())
+    results = asyncio.run(run(args))
+
+  if args.output:
+    with open(args.output, "w", encoding="utf-8") as f:
+      json.dump([asdict(result) for result in results], f, ensure_ascii=False,
+                indent=2)
+  failed = [result.endpoint for result in results if result.failures]
+  if failed:
+    print(f"以下接口存在失败的请求：{', '.join(sorted(set(failed)))}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,123 @@
+"""
+统计各提示词可被服务端前缀缓存的静态部分占比；加 --live 时实际调用模型，
+对比标注 cache_control 前后首个 token 的等待时间与计费的输入 token（需要配置 OPENAI_API_KEY）
+
+运行：python -m app.benchmark.prompt_cache_benchmark [--live] [--calls 3]
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from app.LLMs.LLM import model_registry
+from app.LLMs.llm_cache import llm_cache_bypass
+from app.LLMs.model_registry import ModelTier, ModelUsageCallback
+from app.LLMs.model_router import mark_cache_control
+from app.utils.context_assembler import minify_json
+from app.utils.token_estimator import estimate_tokens
+from app.work_flow.data_model.chain.prompts.data_model_prompts import \
+  DATA_MODEL_GENERATION_PROMPT, DATA_MODEL_MODIFICATION_PROMPT
+from app.work_flow.data_model.schemas.dto_schemas.data_model_response import \
+  DataModelResponse
+from app.work_flow.user_story.chain.prompts.user_story_prompts import \
+  STORY_GENERATION_PROMPT, STORY_UPDATE_PROMPT
+
+SAMPLE_STORIES = {"stories": [{
+  "function_name": f"功能{index}",
+  "role": "作为团队成员",
+  "action": f"我想管理第{index}类任务",
+  "value": "这样我就可以追踪我的职责",
+  "acceptance_criteria": ["任务可以被创建", "任务可以被分配"],
+} for index in range(12)]}
+
+SAMPLE_INPUTS: Dict[str, Dict[str, Any]] = {
+  "story_generation": {
+    "user_stories_requirements": "我们需要一个小团队使用的任务管理应用，支持项目、任务、分配与截止日期。",
+  },
+  "story_update": {
+    "user_stories_draft": minify_json(SAMPLE_STORIES),
+    "conversation_history": "暂无历史修改记录。",
+    "user_stories_modification_suggestions": "增加任务评论功能",
+  },
+  "data_model_generation": {
+    "user_story_result": minify_json(SAMPLE_STORIES),
+    "user_requirements": "用户无额外要求，直接生成数据模型即可。",
+  },
+  "data_model_modification": {
+    "user_story_result": minify_json(SAMPLE_STORIES),
+    "data_model_draft": "{}",
+    "conversation_history": "暂无历史修改记录。",
+    "user_requirements": "给任务增加优先级字段",
+  },
+}
+
+PROMPTS: Dict[str, ChatPromptTemplate] = {
+  "story_generation": STORY_GENERATION_PROMPT,
+  "story_update": STORY_UPDATE_PROMPT,
+  "data_model_generation": DATA_MODEL_GENERATION_PROMPT,
+  "data_model_modification": DATA_MODEL_MODIFICATION_PROMPT,
+}
+
+
+def report_prefix_share() -> None:
+  print(f"{'提示词':<26} {'静态前缀':>8} {'总计':>8} {'可缓存占比':>10}")
+  for name, prompt in PROMPTS.items():
+    messages = prompt.format_messages(**SAMPLE_INPUTS[name])
+    total = sum(estimate_tokens(str(message.content)) for message in messages)
+    static = 0
+    for template, message in zip(prompt.messages, messages):
+      if getattr(template, "input_variables", None):
+        break
+      static += estimate_tokens(str(message.content))
+    print(f"{name:<26} {static:>8} {total:>8} {static / total:>10.1%}")
+
+
+async def measure_live(calls: int, cache_control: bool) -> List[Dict[str, float]]:
+  usage = ModelUsageCallback("benchmark")
+  model = model_registry.model(ModelTier.Strong).with_structured_output(
+      DataModelResponse.model_json_schema())
+  chain = DATA_MODEL_GENERATION_PROMPT | RunnableLambda(mark_cache_control) | model \
+    if cache_control else DATA_MODEL_GENERATION_PROMPT | model
+
+  results = []
+  for _ in range(calls):
+    before = usage.stats()
+    started = time.monotonic()
+    first_chunk = None
+    async for _ in chain.astream(SAMPLE_INPUTS["data_model_generation"],
+                                 config={"callbacks": [usage]}):
+      if first_chunk is None:
+        first_chunk = time.monotonic() - started
+    after = usage.stats()
+    results.append({
+      "first_chunk_seconds": first_chunk or 0.0,
+      "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+      "cached_tokens": after["cached_prompt_tokens"] - before["cached_prompt_tokens"],
+    })
+  return results
+
+
+async def run_live(calls: int) -> None:
+  llm_cache_bypass.set(True)
+  print(f"\n{'cache_control':<14} {'调用':>4} {'首块耗时':>10} {'输入 token':>10} {'缓存命中':>8}")
+  for cache_control in (False, True):
+    for index, result in enumerate(await measure_live(calls, cache_control), 1):
+      print(f"{str(cache_control):<14} {index:>4} {result['first_chunk_seconds']:>9.2f}s "
+            f"{result['prompt_tokens']:>10} {result['cached_tokens']:>8}")
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--live", action="store_true")
+  parser.add_argument("--calls", type=int, default=3)
+  args = parser.parse_args()
+  report_prefix_share()
+  if args.live:
+    asyncio.run(run_live(args.calls))
+
+
+if __name__ == "__main__":
+  main()
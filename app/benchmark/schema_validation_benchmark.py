@@ -0,0 +1,65 @@
+"""
+对比每次调用 jsonschema.validate 与复用编译好的验证器的耗时
+
+运行：python -m app.benchmark.schema_validation_benchmark
+"""
+import timeit
+
+from jsonschema import validate
+
+from app.utils.schema_verifier import fastjsonschema, schema_validators, \
+  validate_json_str
+from app.work_flow.data_model.chain.prompts.data_model_templates import \
+  DATA_ENTITY_VALIDATION_SCHEMA
+
+ENTITY_COUNTS = (10, 100, 300, 500)
+PROPERTIES_PER_ENTITY = 12
+REPEAT = 20
+
+
+def build_data_model(entity_count: int) -> dict:
+  entities = [{
+    "name": f"Entity{index}",
+    "title": f"实体{index}",
+    "type": "table",
+    "properties": [{
+      "name": f"field_{field}",
+      "label": f"字段{field}",
+      "type": "string",
+      "length": 64,
+      "accuracy": 0,
+      "required": field == 0,
+      "description": "用于基准测试的字段",
+      "is_primary_key": field == 0,
+      "is_associated": False,
+    } for field in range(PROPERTIES_PER_ENTITY)],
+  } for index in range(entity_count)]
+  relationships = [{
+    "entity": f"Entity{index}",
+    "related_entity": f"Entity{index + 1}",
+    "cardinality": "one_to_many",
+    "relations": [{"property": "field_0", "related_property": "field_1"}],
+  } for index in range(entity_count - 1)]
+  return {"entities": entities, "relationships": relationships}
+
+
+def run() -> None:
+  schema_validators.register(DATA_ENTITY_VALIDATION_SCHEMA)
+  print(f"fastjsonschema: {'已安装' if fastjsonschema else '未安装'}")
+  print(f"{'实体数':>6} {'jsonschema.validate':>20} {'编译后的验证器':>14} {'加速比':>6}")
+  for entity_count in ENTITY_COUNTS:
+    data = build_data_model(entity_count)
+    assert validate_json_str(data, DATA_ENTITY_VALIDATION_SCHEMA)[0]
+
+    legacy = min(timeit.repeat(
+        lambda: validate(instance=data, schema=DATA_ENTITY_VALIDATION_SCHEMA),
+        number=1, repeat=REPEAT))
+    compiled = min(timeit.repeat(
+        lambda: validate_json_str(data, DATA_ENTITY_VALIDATION_SCHEMA),
+        number=1, repeat=REPEAT))
+    print(f"{entity_count:>6} {legacy * 1000:>18.2f}ms {compiled * 1000:>14.2f}ms "
+          f"{legacy / compiled:>6.1f}x")
+
+
+if __name__ == "__main__":
+  run()
@@ -0,0 +1,234 @@
+"""
+测量 worker 冷启动：每次都在新的解释器中导入 app.main，输出：
+- 导入耗时最多的依赖包与 app 模块（python -X importtime）
+- 各预热方式（LLM_WARM_UP）下的导入耗时、lifespan 启动耗时、预热完成时间，
+  以及首个只读请求与首个 llm 请求的延迟（llm 请求仅在 fake 后端下测量）
+
+运行：python -m app.benchmark.startup_benchmark [--runs 5] [--top 15]
+      [--warm-up off background eager] [--backend fake] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+IMPORTTIME_PATTERN = re.compile(
+    r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+WARM_UP_POLL_SECONDS = 0.005
+WARM_UP_TIMEOUT_SECONDS = 30.0
+
+
+@dataclass
+class ImportEntry:
+  module: str
+  self_us: int
+  cumulative_us: int
+  depth: int
+
+
+@dataclass
+class StartupResult:
+  warm_up: str
+  runs: int
+  import_ms: float
+  startup_ms: float
+  warm_up_ms: Optional[float]
+  first_query_ms: float
+  first_llm_ms: Optional[float]
+  samples: List[Dict[str, Optional[float]]] = field(default_factory=list)
+
+
+def child_environment(backend: str, root: Path) -> Dict[str, str]:
+  """
+  子进程的环境变量：存储写入临时目录；openai 后端使用不可达的地址，只测量客户端创建，不发送请求
+  """
+  env = dict(os.environ)
+  env.update({
+    "LLM_BACKEND": backend,
+    "FAKE_LLM_LATENCY_SECONDS": "0",
+    "FAKE_LLM_TOKENS_PER_SECOND": "0",
+    "LLM_CACHE_DB_PATH": str(root / "llm_cache.sqlite3"),
+    "OUTCOME_STORE_ROOT": str(root / "outcomes"),
+    "OUTCOME_STORE_DB_PATH": str(root / "outcomes.sqlite3"),
+    "JOB_STORE_PATH": str(root / "jobs.json"),
+    "USAGE_LEDGER_DB_PATH": str(root / "usage_ledger.sqlite3"),
+  })
+  if backend != "fake":
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("OPENAI_API_URL", "http://127.0.0.1:9/v1")
+  return env
+
+
+def parse_importtime(output: str) -> List[ImportEntry]:
+  entries = []
+  for line in output.splitlines():
+    match = IMPORTTIME_PATTERN.match(line)
+    if match:
+      entries.append(ImportEntry(module=match.group(4),
+                                 self_us=int(match.group(1)),
+                                 cumulative_us=int(match.group(2)),
+                                 depth=len(match.group(3)) // 2))
+  return entries
+
+
+def import_profile(env: Dict[str, str], runs: int) -> List[ImportEntry]:
+  """
+  多次冷导入 app.main，返回 app.main 累计耗时居中的一次的明细
+  """
+  profiles = []
+  for _ in range(runs):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True)
+    entries = parse_importtime(completed.stderr)
+    total = next(entry.cumulative_us for entry in entries
+                 if entry.module == "app.main")
+    profiles.append((total, entries))
+  profiles.sort(key=lambda profile: profile[0])
+  return profiles[len(profiles) // 2][1]
+
+
+def print_import_profile(entries: List[ImportEntry], top: int) -> None:
+  """
+  依赖按顶层包汇总自身耗时，app 下的模块单独列出
+  """
+  total_ms = next(entry.cumulative_us for entry in entries
+                  if entry.module == "app.main") / 1000
+  by_package: Dict[str, int] = defaultdict(int)
+  for entry in entries:
+    key = entry.module if entry.module.startswith("app.") \
+      else entry.module.split(".")[0]
+    by_package[key] += entry.self_us
+  print(f"导入 app.main 共 {total_ms:.1f} ms，自身耗时最多的包与模块：")
+  print(f"{'包 / 模块':<56} {'ms':>8} {'占比':>7}")
+  for name, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+    print(f"{name:<56} {self_us / 1000:>8.1f} {self_us / 10 / total_ms:>6.1f}%")
+
+
+async def measure_child() -> Dict[str, Optional[float]]:
+  """
+  在子进程中执行：导入、启动、等待预热、发出首个只读请求与首个 llm 请求
+  """
+  started = time.perf_counter()
+  from app.main import app
+  from app.LLMs.chain_registry import chain_registry
+  import httpx
+
+  imported = time.perf_counter()
+  sample: Dict[str, Optional[float]] = {
+    "import_ms": (imported - started) * 1000,
+    "warm_up_ms": None,
+    "first_llm_ms": None,
+  }
+  transport = httpx.ASGITransport(app=app)
+  async with app.router.lifespan_context(app):
+    ready = time.perf_counter()
+    sample["startup_ms"] = (ready - imported) * 1000
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark",
+                                 timeout=None) as client:
+      request_started = time.perf_counter()
+      await client.get("/user_stories/query/draft")
+      sample["first_query_ms"] = (time.perf_counter() - request_started) * 1000
+
+      if os.environ.get("LLM_WARM_UP") != "off":
+        deadline = ready + WARM_UP_TIMEOUT_SECONDS
+        while chain_registry.stats()["warm_up_seconds"] is None \
+            and time.perf_counter() < deadline:
+          await asyncio.sleep(WARM_UP_POLL_SECONDS)
+        sample["warm_up_ms"] = (time.perf_counter() - ready) * 1000
+
+      if os.environ.get("LLM_BACKEND") == "fake":
+        request_started = time.perf_counter()
+        response = await client.post(
+            "/user_stories/generate",
+            json={"requirements": "我们需要一个小团队使用的任务管理应用。"})
+        response.raise_for_status()
+        sample["first_llm_ms"] = (time.perf_counter() - request_started) * 1000
+  return sample
+
+
+def measure_startup(env: Dict[str, str], warm_up: str,
+    runs: int) -> StartupResult:
+  samples = []
+  for _ in range(runs):
+    completed = subprocess.run(
+        [sys.executable, "-m", "app.benchmark.startup_benchmark", "--child"],
+        env={**env, "LLM_WARM_UP": warm_up}, capture_output=True, text=True,
+        check=True)
+    samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+  def median(key: str) -> Optional[float]:
+    values = [sample[key] for sample in samples if sample[key] is not None]
+    return round(statistics.median(values), 1) if values else None
+
+  return StartupResult(
+      warm_up=warm_up,
+      runs=runs,
+      import_ms=median("import_ms"),
+      startup_ms=median("startup_ms"),
+      warm_up_ms=median("warm_up_ms"),
+      first_query_ms=median("first_query_ms"),
+      first_llm_ms=median("first_llm_ms"),
+      samples=samples,
+  )
+
+
+def print_startup_result(result: StartupResult) -> None:
+  def cell(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+  print(f"{result.warm_up:<12} {cell(result.import_ms):>10} "
+        f"{cell(result.startup_ms):>10} {cell(result.warm_up_ms):>10} "
+        f"{cell(result.first_query_ms):>12} {cell(result.first_llm_ms):>12}")
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--runs", type=int, default=5,
+                      help="每种预热方式冷启动的次数，结果取中位数")
+  parser.add_argument("--top", type=int, default=15,
+                      help="导入明细中列出的包与模块数")
+  parser.add_argument("--warm-up", nargs="+",
+                      default=["off", "background", "eager"],
+                      choices=["off", "background", "eager"])
+  parser.add_argument("--backend", default="fake", choices=["fake", "openai"],
+                      help="openai 后端会导入并创建真实的客户端，但不发送 llm 请求")
+  parser.add_argument("--output", help="把结果写入 JSON 文件，便于对比不同提交")
+  parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    print(json.dumps(asyncio.run(measure_child())))
+    return
+
+  with tempfile.TemporaryDirectory() as root:
+    env = child_environment(args.backend, Path(root))
+    print_import_profile(import_profile(env, args.runs), args.top)
+    print()
+    print(f"{args.backend} 后端，每种方式冷启动 {args.runs} 次取中位数（ms）")
+    print(f"{'预热方式':<12} {'导入':>10} {'启动':>10} {'预热完成':>10} "
+          f"{'首个查询请求':>12} {'首个llm请求':>12}")
+    results = []
+    for warm_up in args.warm_up:
+      result = measure_startup(env, warm_up, args.runs)
+      print_startup_result(result)
+      results.append(result)
+
+  if args.output:
+    with open(args.output, "w", encoding="utf-8") as f:
+      json.dump([asdict(result) for result in results], f, ensure_ascii=False,
+                indent=2)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,87 @@
+"""
+在并发请求下对比目录存储与 SQLite 存储（WAL + 连接池）的读写延迟
+
+运行：python -m app.benchmark.storage_benchmark
+"""
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.benchmark.schema_validation_benchmark import build_data_model
+from app.storage.directory_store import DirectoryOutcomeStore
+from app.storage.outcome_store import OutcomeStore
+from app.storage.sqlite_store import SQLiteOutcomeStore
+
+CONCURRENCY_LEVELS = (1, 8, 32)
+OPERATIONS_PER_WORKER = 50
+SESSIONS = 16
+ENTITY_COUNT = 50
+
+
+def percentile(samples: List[float], ratio: float) -> float:
+  ordered = sorted(samples)
+  return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+async def measure(
+    concurrency: int,
+    operation: Callable[[int, int], "asyncio.Future"]
+) -> Dict[str, float]:
+  latencies: List[float] = []
+
+  async def worker(worker_index: int) -> None:
+    for step in range(OPERATIONS_PER_WORKER):
+      started = time.perf_counter()
+      await operation(worker_index, step)
+      latencies.append(time.perf_counter() - started)
+
+  started = time.perf_counter()
+  await asyncio.gather(*(worker(index) for index in range(concurrency)))
+  elapsed = time.perf_counter() - started
+  return {
+    "ops": len(latencies) / elapsed,
+    "p50": percentile(latencies, 0.5) * 1000,
+    "p95": percentile(latencies, 0.95) * 1000,
+  }
+
+
+async def bench_store(name: str, store: OutcomeStore, content: str) -> None:
+  for session in range(SESSIONS):
+    await store.write(f"s{session}", "data_model_draft", content)
+
+  async def read(worker_index: int, step: int) -> None:
+    await store.read(f"s{(worker_index + step) % SESSIONS}", "data_model_draft")
+
+  async def write(worker_index: int, step: int) -> None:
+    await store.write(f"s{(worker_index + step) % SESSIONS}", "data_model_draft",
+                      content)
+
+  async def mixed(worker_index: int, step: int) -> None:
+    await (write if step % 5 == 0 else read)(worker_index, step)
+
+  for concurrency in CONCURRENCY_LEVELS:
+    for label, operation in (("读", read), ("写", write), ("混合 1:4", mixed)):
+      result = await measure(concurrency, operation)
+      print(f"{name:>8} {concurrency:>4} {label:>8} {result['ops']:>10.0f} "
+            f"{result['p50']:>9.2f}ms {result['p95']:>9.2f}ms")
+  await store.close()
+
+
+async def run() -> None:
+  content = json.dumps(build_data_model(ENTITY_COUNT), indent=2,
+                       ensure_ascii=False)
+  print(f"文档大小 {len(content.encode('utf-8')) / 1024:.0f} KiB，"
+        f"每个并发各执行 {OPERATIONS_PER_WORKER} 次操作")
+  print(f"{'后端':>8} {'并发':>4} {'操作':>8} {'ops/s':>10} {'p50':>11} {'p95':>11}")
+  with tempfile.TemporaryDirectory() as root:
+    await bench_store("目录", DirectoryOutcomeStore(str(Path(root) / "dir")),
+                      content)
+    await bench_store("SQLite", SQLiteOutcomeStore(
+        str(Path(root) / "outcomes.sqlite3")), content)
+
+
+if __name__ == "__main__":
+  asyncio.run(run())
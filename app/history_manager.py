@@ -1,88 +1,182 @@
-import datetime
+import asyncio
 import json
 import os
-from collections import deque
-from typing import Optional, Dict, Tuple, Any, List
+import re
+import struct
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
 
 DEFAULT_HISTORY_FILE_PATH = 'app/history/history.jsonl'
+DEFAULT_SESSION_HISTORY_MANAGERS = 128
+
+# 索引文件中每条记录占 16 字节：记录在段文件中的偏移量 + 写入时间戳
+INDEX_ENTRY = struct.Struct("<Qd")
+
 
 class HistoryManager:
   """
   管理历史对话的类
+
+  历史记录按段存放：<name>.<段号>.jsonl 中每行一条紧凑的 json 记录，
+  同名的 .idx 文件按写入顺序保存每条记录的偏移量与时间戳。
+  读取最近 N 条只需读取索引尾部并按偏移量定位，与日志总量无关。
   """
 
-  def __init__(self, history_file_path: str = DEFAULT_HISTORY_FILE_PATH):
+  def __init__(
+      self,
+      history_file_path: str = DEFAULT_HISTORY_FILE_PATH,
+      max_segment_records: int = 100_000,
+      max_segment_bytes: int = 64 * 1024 * 1024,
+      max_segments: int = 20
+  ):
     self.history_file_path = history_file_path
-    os.makedirs(os.path.dirname(history_file_path), exist_ok=True)
+    self.max_segment_records = max_segment_records
+    self.max_segment_bytes = max_segment_bytes
+    self.max_segments = max_segments
+
+    self._directory = os.path.dirname(history_file_path) or "."
+    self._name = os.path.splitext(os.path.basename(history_file_path))[0]
+    self._segment_pattern = re.compile(
+        rf"^{re.escape(self._name)}\.(\d{{6}})\.jsonl$")
+    self._lock = threading.Lock()
+    self._last_timestamp = 0.0
+
+    os.makedirs(self._directory, exist_ok=True)
+    with self._lock:
+      self._migrate_legacy_file()
+      self._segments = self._scan_segments()
+      self._active_segment = self._segments[-1] if self._segments else 1
+      if not self._segments:
+        self._segments.append(self._active_segment)
+      self._recover_index(self._active_segment)
+      last = self._read_index_entries(self._active_segment, -1, None)
+      if last:
+        self._last_timestamp = last[-1][1]
+
+
+  async def save_history_record(self, history_message: dict) -> bool:
+    """
+    将最近的用户提示词与 llm 的回答储存进 .jsonl 文档，磁盘写入在线程池中完成
+    :param history_message: 最新的用户提示词与设计记录
+    :return:保存是否成功的 bool 值
+    """
+    return await asyncio.to_thread(self.append_history_record, history_message)
 
 
-  def save_history_record(self, history_message: dict) -> bool:
+  def append_history_record(self, history_message: dict) -> bool:
     """
-    将最近的用户提示词与 llm 的回答储存进 .jsonl 文档
+    save_history_record 的同步版本
     :param history_message: 最新的用户提示词与设计记录
     :return:保存是否成功的 bool 值
     """
     try:
-      record_dict = {
-        "time_stamp": datetime.now().isoformat(),
-        "message": history_message
-      }
-
-      with open(self.history_file_path, 'a', encoding="utf-8") as file:
-        new_line = json.dumps(record_dict, ensure_ascii=False, indent=2)
-        file.write(new_line + "\n")
+      with self._lock:
+        # 时间戳单调不减，保证索引可以按时间二分查找
+        timestamp = max(time.time(), self._last_timestamp)
+        record_dict = {
+          "time_stamp": datetime.fromtimestamp(timestamp).isoformat(),
+          "message": history_message
+        }
+        new_line = json.dumps(record_dict, ensure_ascii=False,
+                              separators=(",", ":")) + "\n"
+
+        self._rotate_if_needed()
+        with open(self._segment_path(self._active_segment), 'ab') as file:
+          offset = file.tell()
+          file.write(new_line.encode("utf-8"))
+        with open(self._index_path(self._active_segment), 'ab') as index_file:
+          index_file.write(INDEX_ENTRY.pack(offset, timestamp))
+        self._last_timestamp = timestamp
 
       return True
 
-
     except (FileNotFoundError, PermissionError) as e:
-      print(f"文件访问错误: {str(e)}。路径: {self.history_file_path}")
+      logger.error("文件访问错误: %s。路径: %s", e, self.history_file_path)
       return False
 
     except OSError as e:  # 捕获所有操作系统相关错误
-      print(f"系统错误: {str(e)}。错误号: {e.errno}")
+      logger.error("系统错误: %s。错误号: %s", e, e.errno)
       return False
 
     except Exception as e:
-      print(f"保存历史记录时发生未知错误: {type(e).__name__} - {str(e)}")
+      logger.error("保存历史记录时发生未知错误: %s - %s", type(e).__name__, e)
       return False
 
 
-  def load_history_record(self) -> Optional[List[Dict]]:
+  def load_history_record(self, limit: int = 10) -> Optional[List[Dict]]:
     """
-    获取最近的十个提示词与 llm 回答的历史记录
-    :return: 保存最近的十个提示词与 llm 回答的历史记录的字典列表
+    获取最近的若干条提示词与 llm 回答的历史记录
+    :param limit: 获取的条数，默认为十条
+    :return: 按时间先后排列的历史记录字典列表，没有记录时返回 None
     """
     try:
-      if not os.path.exists(self.history_file_path):
-        return None
-
-      with open(self.history_file_path, 'r', encoding="utf-8") as file:
-        last_lines = deque(file, maxlen=10)
-        history_str_list = list(last_lines)
-
-        if not history_str_list:
-           return None
+      with self._lock:
+        records = []
+        for segment in reversed(self._list_segments()):
+          remaining = limit - len(records)
+          if remaining <= 0:
+            break
+          entries = self._read_index_entries(segment, -remaining, None)
+          records = self._read_records(segment, entries) + records
 
-        history_list = self.__history_list_converter(history_str_list)
-
-        return history_list
+      return records or None
 
     except (FileNotFoundError, ValueError) as e:
-      print(f"加载历史记录失败: {str(e)}")
+      logger.error("加载历史记录失败: %s", e)
       return None
 
     except Exception as e:
-      print(f"未知错误: {str(e)}")
+      logger.error("未知错误: %s", e)
       return None
 
 
+  def query_history_range(
+      self,
+      start: Optional[datetime] = None,
+      end: Optional[datetime] = None
+  ) -> List[Dict]:
+    """
+    按时间范围查询历史记录，在各段的索引上二分查找起止位置
+    :param start: 起始时间（包含），为空表示不限
+    :param end: 结束时间（包含），为空表示不限
+    :return: 按时间先后排列的历史记录字典列表
+    """
+    start_ts = start.timestamp() if start else float("-inf")
+    end_ts = end.timestamp() if end else float("inf")
+
+    records = []
+    with self._lock:
+      for segment in self._list_segments():
+        count = self._index_count(segment)
+        if count == 0:
+          continue
+        first_ts = self._read_index_entries(segment, 0, 1)[0][1]
+        last_ts = self._read_index_entries(segment, count - 1, count)[0][1]
+        if last_ts < start_ts or first_ts > end_ts:
+          continue
+
+        lower = self._bisect(segment, count, start_ts, inclusive_left=True)
+        upper = self._bisect(segment, count, end_ts, inclusive_left=False)
+        entries = self._read_index_entries(segment, lower, upper)
+        records.extend(self._read_records(segment, entries))
+    return records
+
+
   def get_lastest_history(self) -> Optional[Dict]:
     """
     获取最近的提示词与 llm 回答的历史记录
-    :return: 保存最近的提示词与 llm 回答的历史记录的字典列表
+    :return: 保存最近的提示词与 llm 回答的历史记录的字典，没有记录时返回 None
     """
-    return self.load_history_record()[-1]
+    history = self.load_history_record(limit=1)
+    return history[-1] if history else None
 
 
   def has_history(self) -> bool:
@@ -90,46 +184,250 @@ class HistoryManager:
     检测对话是否已经有历史记录
     :return: 已经有则返回 True， 否则返回 False
     """
-    latest = self.get_lastest_history()
-    return latest is not None
+    with self._lock:
+      return any(self._index_count(segment) > 0
+                 for segment in self._list_segments())
 
 
-  def __history_list_converter(self,history_str_list: List[str]) \
-      -> Optional[List[Dict[str, Any]]]:
+  def compact(self) -> int:
+    """
+    删除超出保留数量的最旧的段
+    :return: 删除的段数
+    """
+    with self._lock:
+      return self._compact()
+
+
+  def _rotate_if_needed(self) -> None:
+    segment_path = self._segment_path(self._active_segment)
+    if not os.path.exists(segment_path):
+      return
+    if (self._index_count(self._active_segment) < self.max_segment_records
+        and os.path.getsize(segment_path) < self.max_segment_bytes):
+      return
+
+    self._active_segment += 1
+    self._segments.append(self._active_segment)
+    logger.info("历史记录切换到新的段：%s",
+                self._segment_path(self._active_segment))
+    self._compact()
+
+
+  def _compact(self) -> int:
+    segments = self._list_segments()
+    expired = segments[:max(0, len(segments) - self.max_segments)]
+    self._segments = segments[len(expired):]
+    for segment in expired:
+      for path in (self._segment_path(segment), self._index_path(segment)):
+        if os.path.exists(path):
+          os.remove(path)
+    if expired:
+      logger.info("历史记录已清理 %s 个旧段", len(expired))
+    return len(expired)
+
+
+  def _bisect(self, segment: int, count: int, timestamp: float,
+      inclusive_left: bool) -> int:
+    low, high = 0, count
+    while low < high:
+      middle = (low + high) // 2
+      middle_ts = self._read_index_entries(segment, middle, middle + 1)[0][1]
+      if middle_ts < timestamp or (not inclusive_left and middle_ts == timestamp):
+        low = middle + 1
+      else:
+        high = middle
+    return low
+
+
+  def _read_index_entries(self, segment: int, start: int,
+      stop: Optional[int]) -> List[Tuple[int, float]]:
     """
-    将 json 字符串列表转为 dict 列表
-    :param history_str_list: 由历史记录 .jsonl 文件加载的 json 字符串列表
-    :return: 储存历史记录的 dict 列表
+    读取索引中 [start, stop) 范围的条目，start 为负数时表示从尾部倒数
     """
-    history_dict_list = []
+    count = self._index_count(segment)
+    if start < 0:
+      start = max(0, count + start)
+    stop = count if stop is None else min(stop, count)
+    if start >= stop:
+      return []
+
+    with open(self._index_path(segment), 'rb') as index_file:
+      index_file.seek(start * INDEX_ENTRY.size)
+      data = index_file.read((stop - start) * INDEX_ENTRY.size)
+    return [entry for entry in INDEX_ENTRY.iter_unpack(data)]
+
+
+  def _read_records(self, segment: int,
+      entries: List[Tuple[int, float]]) -> List[Dict[str, Any]]:
+    if not entries:
+      return []
+
+    records = []
+    with open(self._segment_path(segment), 'rb') as file:
+      for offset, _ in entries:
+        file.seek(offset)
+        line = file.readline().decode("utf-8").strip()
+        try:
+          record = json.loads(line)
+          if not isinstance(record, dict):
+            raise ValueError("记录格式错误，应为字典类型")
+          records.append(record)
+        except json.JSONDecodeError as e:
+          logger.error("忽略无效JSON行: '%s'。错误: %s", line, e)
+        except ValueError as e:
+          logger.error("忽略无效记录格式: '%s'。错误: %s", line, e)
+    return records
+
+
+  def _index_count(self, segment: int) -> int:
+    index_path = self._index_path(segment)
+    if not os.path.exists(index_path):
+      return 0
+    return os.path.getsize(index_path) // INDEX_ENTRY.size
+
+
+  def _recover_index(self, segment: int) -> None:
+    """
+    进程在写入段文件后、写入索引前退出时，为段尾未建立索引的记录补建索引
+    """
+    segment_path = self._segment_path(segment)
+    if not os.path.exists(segment_path):
+      return
+
+    index_path = self._index_path(segment)
+    count = self._index_count(segment)
+    if os.path.exists(index_path) and os.path.getsize(index_path) != count * INDEX_ENTRY.size:
+      with open(index_path, 'r+b') as index_file:
+        index_file.truncate(count * INDEX_ENTRY.size)
+
+    last = self._read_index_entries(segment, count - 1, count) if count else []
+    with open(segment_path, 'rb') as file:
+      if last:
+        file.seek(last[0][0])
+        file.readline()
+      missing = []
+      while True:
+        offset = file.tell()
+        line = file.readline()
+        if not line:
+          break
+        if not line.endswith(b"\n"):
+          # 未写完的半行记录直接截断
+          file.close()
+          with open(segment_path, 'r+b') as broken:
+            broken.truncate(offset)
+          break
+        missing.append((offset, self._parse_timestamp(line)))
+
+    if missing:
+      with open(index_path, 'ab') as index_file:
+        for offset, timestamp in missing:
+          index_file.write(INDEX_ENTRY.pack(offset, timestamp))
+      logger.info("历史记录段 %s 补建了 %s 条索引", segment, len(missing))
+
+
+  def _migrate_legacy_file(self) -> None:
+    """
+    将旧版的单文件历史记录（可能是多行缩进的 json）迁移为第一个段
+    """
+    if not os.path.exists(self.history_file_path) or self._scan_segments():
+      return
+
+    with open(self.history_file_path, 'r', encoding="utf-8") as file:
+      content = file.read()
+
+    decoder = json.JSONDecoder()
+    position = 0
+    lines = []
+    while True:
+      while position < len(content) and content[position].isspace():
+        position += 1
+      if position >= len(content):
+        break
+      try:
+        record, position = decoder.raw_decode(content, position)
+      except json.JSONDecodeError as e:
+        logger.error("旧历史记录解析中断，剩余内容被忽略: %s", e)
+        break
+      if isinstance(record, dict):
+        lines.append(json.dumps(record, ensure_ascii=False,
+                                separators=(",", ":")) + "\n")
 
-    for history_str in history_str_list:
-      stripped = history_str.strip()
+    with open(self._segment_path(1), 'wb') as file:
+      for line in lines:
+        file.write(line.encode("utf-8"))
+    os.replace(self.history_file_path, f"{self.history_file_path}.migrated")
+    logger.info("已迁移旧历史记录 %s 条", len(lines))
 
-      if not stripped:
-        continue
 
-      try:
-        history_dict = json.loads(stripped)
+  @staticmethod
+  def _parse_timestamp(line: bytes) -> float:
+    try:
+      record = json.loads(line)
+      return datetime.fromisoformat(record["time_stamp"]).timestamp()
+    except Exception:
+      return 0.0
 
-        if not isinstance(history_dict, dict):
-          raise ValueError("记录格式错误，应为字典类型")
 
-        history_dict_list.append(history_dict)
+  def _list_segments(self) -> List[int]:
+    return list(self._segments)
 
 
-      except json.JSONDecodeError as e:
-        print(f"忽略无效JSON行: '{stripped}'。错误: {str(e)}")
+  def _scan_segments(self) -> List[int]:
+    segments = []
+    for file_name in os.listdir(self._directory):
+      matched = self._segment_pattern.match(file_name)
+      if matched:
+        segments.append(int(matched.group(1)))
+    return sorted(segments)
 
-      except ValueError as e:
-        print(f"忽略无效记录格式: '{stripped}'。错误: {str(e)}")
 
-    return history_dict_list
+  def _segment_path(self, segment: int) -> str:
+    return os.path.join(self._directory, f"{self._name}.{segment:06d}.jsonl")
 
-# 全局实例
-history_manager = HistoryManager()
 
+  def _index_path(self, segment: int) -> str:
+    return os.path.join(self._directory, f"{self._name}.{segment:06d}.idx")
 
+# 最近使用的会话保留在 LRU 中；被淘汰但仍在使用的实例通过弱引用找回，
+# 同一会话不会同时存在两个各自加锁写入的实例
+_session_history_managers: "OrderedDict[str, HistoryManager]" = OrderedDict()
+_live_history_managers: "weakref.WeakValueDictionary[str, HistoryManager]" = \
+  weakref.WeakValueDictionary()
+_session_history_lock = threading.Lock()
 
 
+def max_session_history_managers() -> int:
+  """
+  最多缓存的会话历史实例数，由 HISTORY_SESSION_MANAGERS 配置
+  """
+  return max(1, int(os.environ.get("HISTORY_SESSION_MANAGERS",
+                                   DEFAULT_SESSION_HISTORY_MANAGERS)))
 
+
+def get_history_manager(session_id: str) -> HistoryManager:
+  """
+  获取某个项目/会话独立的历史记录，存放在 app/history/<session_id>/ 下
+  :param session_id: 已校验过的会话 id
+  :return: 该会话的 HistoryManager
+  """
+  with _session_history_lock:
+    manager = _session_history_managers.get(session_id)
+    if manager is not None:
+      _session_history_managers.move_to_end(session_id)
+      return manager
+
+    manager = _live_history_managers.get(session_id)
+    if manager is None:
+      directory = os.path.dirname(DEFAULT_HISTORY_FILE_PATH)
+      manager = HistoryManager(
+          os.path.join(directory, session_id,
+                       os.path.basename(DEFAULT_HISTORY_FILE_PATH)))
+      _live_history_managers[session_id] = manager
+    _session_history_managers[session_id] = manager
+    while len(_session_history_managers) > max_session_history_managers():
+      _session_history_managers.popitem(last=False)
+    return manager
+
+# 全局实例
+history_manager = HistoryManager()
@@ -0,0 +1,432 @@
+import asyncio
+import json
+import os
+import time
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+from urllib.parse import urlparse
+
+from pydantic import BaseModel
+
+from app.jobs.job_schemas import JobRecord, JobStatus
+from app.LLMs.llm_governor import llm_endpoint
+from app.logger.logger import get_logger
+from app.utils.session_resolver import DEFAULT_SESSION_ID, current_session_id
+from app.utils.tracing import tracer
+
+logger = get_logger(__name__)
+
+DEFAULT_JOB_STORE_PATH = 'app/job_store/jobs.json'
+LOCAL_CALLBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class JobNotFoundError(KeyError):
+  pass
+
+
+class JobQueueFullError(RuntimeError):
+  pass
+
+
+class JobStateError(ValueError):
+  pass
+
+
+@dataclass
+class JobKind:
+  request_model: Type[BaseModel]
+  handler: Callable[[BaseModel, str], Awaitable[BaseModel]]
+
+
+class JobManager:
+  """
+  管理后台生成任务的类：有界队列 + 固定数量的 worker；排队与执行中的任务持久化到本地 json，
+  结束的任务连同结果只在结束时追加一行到 finished_path，状态变化时不再重写全部结果
+  """
+
+  def __init__(
+      self,
+      store_path: str = DEFAULT_JOB_STORE_PATH,
+      worker_count: int = 2,
+      max_queue_size: int = 100,
+      max_finished_jobs: int = 500
+  ):
+    self.store_path = store_path
+    self.finished_path = f"{os.path.splitext(store_path)[0]}_finished.jsonl"
+    self.worker_count = worker_count
+    self.max_queue_size = max_queue_size
+    self.max_finished_jobs = max_finished_jobs
+
+    self._kinds: Dict[str, JobKind] = {}
+    self._jobs: Dict[str, JobRecord] = {}
+    self._running_tasks: Dict[str, asyncio.Task] = {}
+    self._queue: Optional[asyncio.Queue] = None
+    # 状态为排队的任务数；排队中取消的任务在队列里留下的条目不占用名额
+    self._queued_count = 0
+    self._workers: List[asyncio.Task] = []
+    self._persist_lock: Optional[asyncio.Lock] = None
+    self._finished_lines = 0
+    self._stopping = False
+
+
+  def register_kind(
+      self,
+      kind: str,
+      request_model: Type[BaseModel],
+      handler: Callable[[BaseModel, str], Awaitable[BaseModel]]
+  ) -> None:
+    """
+    注册一种任务
+    :param kind: 任务类型名
+    :param request_model: 任务请求体的模型，用于从持久化的 payload 还原请求
+    :param handler: 执行任务的协程函数，参数为请求与会话 id
+    """
+    self._kinds[kind] = JobKind(request_model=request_model, handler=handler)
+
+
+  async def start(self) -> None:
+    """
+    加载持久化的任务，重新排队未完成的任务并启动 worker
+    """
+    self._queue = asyncio.Queue()
+    self._persist_lock = asyncio.Lock()
+    self._queued_count = 0
+
+    for record in await asyncio.to_thread(self._load_records):
+      self._jobs[record.job_id] = record
+      if record.status in (JobStatus.Queued, JobStatus.Running):
+        record.status = JobStatus.Queued
+        record.queued_at = time.time()
+        if self._queued_count >= self.max_queue_size:
+          record.status = JobStatus.Failed
+          record.error = "重启后任务队列已满，请重试该任务"
+          continue
+        self._queue.put_nowait(record.job_id)
+        self._queued_count += 1
+
+    self._workers = [asyncio.create_task(self._worker(index))
+                     for index in range(self.worker_count)]
+    await self._compact_finished()
+    await self._persist()
+    logger.info("任务队列已启动，worker 数量：%s，恢复排队任务：%s",
+                self.worker_count, self._queued_count)
+
+
+  async def stop(self) -> None:
+    self._stopping = True
+    for worker in self._workers:
+      worker.cancel()
+    await asyncio.gather(*self._workers, return_exceptions=True)
+    self._workers = []
+    await self._persist()
+    logger.info("任务队列已停止")
+
+
+  async def submit(
+      self,
+      kind: str,
+      request: BaseModel,
+      callback_url: Optional[str] = None,
+      session_id: str = DEFAULT_SESSION_ID
+  ) -> JobRecord:
+    if kind not in self._kinds:
+      raise JobStateError(f"未注册的任务类型：{kind}")
+    if callback_url is not None:
+      validate_callback_url(callback_url)
+    if self._queue is None:
+      raise JobStateError("任务队列尚未启动")
+    if self._queued_count >= self.max_queue_size:
+      raise JobQueueFullError("任务队列已满，请稍后重试")
+
+    now = time.time()
+    record = JobRecord(
+        job_id=uuid.uuid4().hex,
+        kind=kind,
+        session_id=session_id,
+        payload=request.model_dump(mode="json"),
+        callback_url=callback_url,
+        created_at=now,
+        queued_at=now,
+    )
+    self._jobs[record.job_id] = record
+    self._queue.put_nowait(record.job_id)
+    self._queued_count += 1
+    await self._persist()
+    logger.info("任务 %s（%s）已加入队列", record.job_id, kind)
+    return record
+
+
+  def get(self, job_id: str) -> JobRecord:
+    record = self._jobs.get(job_id)
+    if record is None:
+      raise JobNotFoundError(job_id)
+    return record
+
+
+  def list_jobs(self, status: Optional[JobStatus] = None) -> List[JobRecord]:
+    records = sorted(self._jobs.values(), key=lambda r: r.created_at,
+                     reverse=True)
+    if status is not None:
+      records = [record for record in records if record.status == status]
+    return records
+
+
+  async def cancel(self, job_id: str) -> JobRecord:
+    record = self.get(job_id)
+    if record.is_finished:
+      raise JobStateError(f"任务 {job_id} 已结束，无法取消")
+
+    task = self._running_tasks.get(job_id)
+    if record.status == JobStatus.Queued:
+      self._queued_count -= 1
+    record.status = JobStatus.Cancelled
+    logger.info("任务 %s 已取消", job_id)
+    if task is not None:
+      # 执行中的任务由 _run 记录结束并发出回调
+      task.cancel()
+      record.finished_at = time.time()
+      await self._persist()
+    else:
+      # 排队中的任务在 worker 取出时会因状态为 cancelled 而被跳过，在这里记录结束并发出回调
+      await self._finish(record)
+    return record
+
+
+  async def retry(self, job_id: str) -> JobRecord:
+    record = self.get(job_id)
+    if record.status not in (JobStatus.Failed, JobStatus.Cancelled):
+      raise JobStateError(f"只能重试失败或已取消的任务，当前状态：{record.status.value}")
+    if self._queue is None:
+      raise JobStateError("任务队列尚未启动")
+    # 执行中被取消的任务要等旧的执行结束后才能重试，否则 worker 会跳过新条目，
+    # 旧的执行随后又把状态改回已取消，任务就此丢失
+    if job_id in self._running_tasks:
+      raise JobStateError(f"任务 {job_id} 正在停止，请稍后重试")
+    if self._queued_count >= self.max_queue_size:
+      raise JobQueueFullError("任务队列已满，请稍后重试")
+
+    record.status = JobStatus.Queued
+    record.error = None
+    record.result = None
+    record.queued_at = time.time()
+    record.started_at = None
+    record.finished_at = None
+    self._queue.put_nowait(job_id)
+    self._queued_count += 1
+    await self._persist()
+    logger.info("任务 %s 重新加入队列", job_id)
+    return record
+
+
+  def stats(self) -> Dict[str, Any]:
+    counts = {status.value: 0 for status in JobStatus}
+    for record in self._jobs.values():
+      counts[record.status.value] += 1
+    return {
+      "workers": self.worker_count,
+      "queue_depth": self._queued_count,
+      "max_queue_size": self.max_queue_size,
+      "jobs": counts,
+    }
+
+
+  async def _worker(self, index: int) -> None:
+    while True:
+      job_id = await self._queue.get()
+      task = None
+      try:
+        record = self._jobs.get(job_id)
+        # 排队中取消后又重试的任务在队列中有两个条目，只执行先取出的一个
+        if record is None or record.status != JobStatus.Queued \
+            or job_id in self._running_tasks:
+          continue
+        # 在创建任务前就标记为执行中，其他 worker 取出重复的条目时会跳过
+        record.status = JobStatus.Running
+        self._queued_count -= 1
+        task = asyncio.create_task(self._run(record))
+        self._running_tasks[job_id] = task
+        try:
+          await task
+        except asyncio.CancelledError:
+          if self._stopping:
+            raise
+          # 取消发生在 _run 进入 try 之前（尚未开始或正在写入开始状态），由 worker 记录结束
+          await self._finish(record)
+      finally:
+        if task is not None:
+          self._running_tasks.pop(job_id, None)
+        self._queue.task_done()
+
+
+  async def _run(self, record: JobRecord) -> None:
+    kind = self._kinds[record.kind]
+    # 后台任务按任务类型单独排队，不与在线请求争抢同一个队列
+    llm_endpoint.set(f"jobs/{record.kind}")
+    current_session_id.set(record.session_id)
+    record.attempts += 1
+    record.started_at = time.time()
+    await self._persist()
+    logger.info("任务 %s（%s）开始执行", record.job_id, record.kind)
+
+    try:
+      request = kind.request_model.model_validate(record.payload)
+      # 后台任务没有请求上下文，单独作为一条链路的根
+      with tracer.root_span(f"job {record.kind}", attributes={
+        "job.id": record.job_id,
+        "job.attempt": record.attempts,
+        "session.id": record.session_id,
+      }):
+        result = await kind.handler(request, record.session_id)
+      record.result = result.model_dump(mode="json")
+      record.status = JobStatus.Succeeded
+      logger.info("任务 %s 执行成功", record.job_id)
+    except asyncio.CancelledError:
+      if self._stopping:
+        # 服务停止导致的中断不算取消，重新标记为排队，下次启动时恢复执行
+        record.status = JobStatus.Queued
+        record.started_at = None
+        raise
+      if record.status == JobStatus.Running:
+        record.status = JobStatus.Cancelled
+      logger.info("任务 %s 在执行中被取消", record.job_id)
+    except Exception as e:
+      record.status = JobStatus.Failed
+      record.error = str(e)
+      logger.error("任务 %s 执行失败：%s", record.job_id, e)
+
+    await self._finish(record)
+
+
+  async def _finish(self, record: JobRecord) -> None:
+    record.finished_at = time.time()
+    await self._persist()
+    await self._record_finished(record)
+
+    if record.callback_url:
+      await asyncio.to_thread(self._notify, record)
+
+
+  def _notify(self, record: JobRecord) -> None:
+    body = json.dumps(record.model_dump(mode="json"), ensure_ascii=False)
+    callback_request = urllib.request.Request(
+        record.callback_url,
+        data=body.encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+      with urllib.request.urlopen(callback_request, timeout=10):
+        pass
+    except Exception as e:
+      logger.error("任务 %s 回调 %s 失败：%s", record.job_id,
+                   record.callback_url, e)
+
+
+  async def _persist(self) -> None:
+    """
+    只重写排队与执行中的任务，结束的任务由 _record_finished 追加保存
+    """
+    records = [record.model_dump(mode="json") for record in self._jobs.values()
+               if not record.is_finished]
+    async with self._persist_lock:
+      await asyncio.to_thread(self._write_records, records)
+
+
+  async def _record_finished(self, record: JobRecord) -> None:
+    """
+    追加一行结束的任务；日志行数超过保留数量的两倍时按内存中的任务重写一次
+    """
+    self._trim_finished()
+    line = json.dumps(record.model_dump(mode="json"), ensure_ascii=False)
+    async with self._persist_lock:
+      await asyncio.to_thread(self._append_finished, line)
+      self._finished_lines += 1
+    if self._finished_lines > 2 * self.max_finished_jobs:
+      await self._compact_finished()
+
+
+  async def _compact_finished(self) -> None:
+    self._trim_finished()
+    lines = [json.dumps(record.model_dump(mode="json"), ensure_ascii=False)
+             for record in self._jobs.values() if record.is_finished]
+    async with self._persist_lock:
+      await asyncio.to_thread(self._write_finished, lines)
+      self._finished_lines = len(lines)
+
+
+  def _trim_finished(self) -> None:
+    finished = [record for record in self._jobs.values() if record.is_finished]
+    overflow = len(finished) - self.max_finished_jobs
+    if overflow <= 0:
+      return
+    finished.sort(key=lambda r: r.finished_at or r.created_at)
+    for record in finished[:overflow]:
+      del self._jobs[record.job_id]
+
+
+  def _write_records(self, records: List[Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(self.store_path) or ".", exist_ok=True)
+    temp_path = f"{self.store_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+      json.dump(records, f, ensure_ascii=False)
+    os.replace(temp_path, self.store_path)
+
+
+  def _append_finished(self, line: str) -> None:
+    os.makedirs(os.path.dirname(self.finished_path) or ".", exist_ok=True)
+    with open(self.finished_path, "a", encoding="utf-8") as f:
+      f.write(line + "\n")
+
+
+  def _write_finished(self, lines: List[str]) -> None:
+    os.makedirs(os.path.dirname(self.finished_path) or ".", exist_ok=True)
+    temp_path = f"{self.finished_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+      f.writelines(line + "\n" for line in lines)
+    os.replace(temp_path, self.finished_path)
+
+
+  def _load_records(self) -> List[JobRecord]:
+    """
+    先读结束的任务（同一任务重试后以最后一行为准），再用排队与执行中的任务覆盖；
+    旧版本写在 json 中的结束任务照常加载，启动时会转存到 finished_path
+    """
+    records: Dict[str, JobRecord] = {}
+    if os.path.exists(self.finished_path):
+      with open(self.finished_path, "r", encoding="utf-8") as f:
+        for line in f:
+          try:
+            record = JobRecord.model_validate_json(line)
+          except Exception as e:
+            # 进程在追加时退出会留下不完整的最后一行
+            logger.error("加载结束的任务失败，已忽略该行：%s", e)
+            continue
+          records[record.job_id] = record
+    if os.path.exists(self.store_path):
+      try:
+        with open(self.store_path, "r", encoding="utf-8") as f:
+          for item in json.load(f):
+            record = JobRecord.model_validate(item)
+            records[record.job_id] = record
+      except Exception as e:
+        logger.error("加载持久化任务失败，已忽略：%s", e)
+    return list(records.values())
+
+
+def validate_callback_url(callback_url: str) -> None:
+  """
+  回调只允许发往本机地址
+  """
+  parsed = urlparse(callback_url)
+  if parsed.scheme not in ("http", "https") or parsed.hostname not in LOCAL_CALLBACK_HOSTS:
+    raise JobStateError("callback_url 必须是本机的 http(s) 地址")
+
+
+# 全局实例
+job_manager = JobManager(
+    store_path=os.environ.get("JOB_STORE_PATH", DEFAULT_JOB_STORE_PATH),
+    worker_count=int(os.environ.get("JOB_WORKERS", 2)),
+    max_queue_size=int(os.environ.get("JOB_QUEUE_SIZE", 100)),
+)
@@ -0,0 +1,80 @@
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, Field
+
+from app.utils.session_resolver import DEFAULT_SESSION_ID
+
+
+class JobStatus(str, Enum):
+  Queued = "queued"
+  Running = "running"
+  Succeeded = "succeeded"
+  Failed = "failed"
+  Cancelled = "cancelled"
+
+
+class JobRecord(BaseModel):
+  job_id: str = Field(description="Unique id of the job")
+  kind: str = Field(description="Registered job kind, e.g. user_stories.generate")
+  status: JobStatus = Field(default=JobStatus.Queued,
+                            description="Current status of the job")
+  session_id: str = Field(default=DEFAULT_SESSION_ID,
+                          description="Project/session the job works on")
+  payload: Dict[str, Any] = Field(description="Request body of the job")
+  callback_url: Optional[str] = Field(
+    default=None, description="Local url notified when the job finishes")
+  result: Optional[Dict[str, Any]] = Field(
+    default=None, description="Result of a succeeded job")
+  error: Optional[str] = Field(default=None,
+                               description="Error message of a failed job")
+  attempts: int = Field(default=0, description="How many times the job ran")
+  created_at: float = Field(description="Unix time when the job was submitted")
+  queued_at: float = Field(description="Unix time when the job was last queued")
+  started_at: Optional[float] = Field(default=None,
+                                      description="Unix time of the last start")
+  finished_at: Optional[float] = Field(default=None,
+                                       description="Unix time of the last finish")
+
+  @property
+  def is_finished(self) -> bool:
+    return self.status in (JobStatus.Succeeded, JobStatus.Failed,
+                           JobStatus.Cancelled)
+
+
+class JobResponse(BaseModel):
+  job_id: str
+  kind: str
+  session_id: str
+  status: JobStatus
+  result: Optional[Dict[str, Any]] = None
+  error: Optional[str] = None
+  attempts: int
+  created_at: float
+  started_at: Optional[float] = None
+  finished_at: Optional[float] = None
+  queue_seconds: Optional[float] = None
+  run_seconds: Optional[float] = None
+
+  @classmethod
+  def from_record(cls, record: JobRecord) -> "JobResponse":
+    queue_seconds = None
+    run_seconds = None
+    if record.started_at is not None:
+      queue_seconds = record.started_at - record.queued_at
+      if record.finished_at is not None:
+        run_seconds = record.finished_at - record.started_at
+    return cls(
+        job_id=record.job_id,
+        kind=record.kind,
+        session_id=record.session_id,
+        status=record.status,
+        result=record.result,
+        error=record.error,
+        attempts=record.attempts,
+        created_at=record.created_at,
+        started_at=record.started_at,
+        finished_at=record.finished_at,
+        queue_seconds=queue_seconds,
+        run_seconds=run_seconds,
+    )
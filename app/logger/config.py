@@ -1,19 +1,29 @@
+import os
+from typing import Any, Dict
 
+DEFAULT_LOG_FORMAT = "text"
+DEFAULT_LOG_QUEUE_SIZE = 10_000
+# LOG_FORMAT 的取值对应的格式化器
+LOG_FORMATTERS = {"text": "standard", "json": "json"}
 
 LOGGER_CONFIG = {
   "version": 1,
   "disable_existing_loggers": False,
   "formatters": {
     "standard": {
-      "format": "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d - %(message)s",
+      "format": "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d "
+                "[%(request_id)s] - %(message)s",
       "datefmt": "%Y-%m-%d %H:%M:%S"
+    },
+    "json": {
+      "()": "app.logger.formatters.JsonFormatter"
     }
   },
   "handlers": {
+    # 由后台的 QueueListener 线程写出，请求处理中只把记录放入队列
     "console": {
       "class": "logging.StreamHandler",
       "formatter": "standard",
-      "level": "INFO",
       "stream": "ext://sys.stdout"
     },
   },
@@ -26,6 +36,53 @@ LOGGER_CONFIG = {
       "handlers": ["console"],
       "level": "INFO",
       "propagate": False,
+    },
+    # 每个请求一条访问日志，需要时可以单独调低
+    "app.access": {
+      "level": "INFO",
+    },
+    "httpx": {
+      "level": "WARNING",
     }
   }
-}
\ No newline at end of file
+}
+
+
+def build_logger_config() -> Dict[str, Any]:
+  """
+  在 LOGGER_CONFIG 的基础上应用环境变量：
+  - LOG_FORMAT：text 或 json
+  - LOG_LEVEL：app 下所有模块的默认级别
+  - LOG_LEVELS：按模块设置级别，如 app.LLMs=DEBUG,app.access=WARNING,httpx=INFO
+  """
+  config = {
+    **LOGGER_CONFIG,
+    "handlers": {name: dict(handler)
+                 for name, handler in LOGGER_CONFIG["handlers"].items()},
+    "loggers": {name: dict(logger)
+                for name, logger in LOGGER_CONFIG["loggers"].items()},
+  }
+
+  log_format = os.environ.get("LOG_FORMAT", DEFAULT_LOG_FORMAT).lower()
+  if log_format not in LOG_FORMATTERS:
+    raise ValueError(f"未知的 LOG_FORMAT：{log_format}，可选 text、json")
+  config["handlers"]["console"]["formatter"] = LOG_FORMATTERS[log_format]
+
+  if os.environ.get("LOG_LEVEL"):
+    config["loggers"]["app"]["level"] = os.environ["LOG_LEVEL"].upper()
+  for item in os.environ.get("LOG_LEVELS", "").split(","):
+    if not item.strip():
+      continue
+    name, _, level = item.partition("=")
+    if not level:
+      raise ValueError(f"LOG_LEVELS 中的 {item} 应为 模块=级别")
+    config["loggers"].setdefault(name.strip(), {})["level"] = \
+      level.strip().upper()
+  return config
+
+
+def log_queue_size() -> int:
+  """
+  日志队列的容量，写出跟不上时丢弃新记录而不是阻塞请求
+  """
+  return int(os.environ.get("LOG_QUEUE_SIZE", DEFAULT_LOG_QUEUE_SIZE))
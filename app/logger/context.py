@@ -0,0 +1,32 @@
+import logging
+import sys
+from contextvars import ContextVar
+from typing import Any, Optional
+
+# 由请求日志中间件设置，未处于请求中时为 -
+current_request_id: ContextVar[str] = ContextVar("current_request_id",
+                                                 default="-")
+
+
+class LogContextFilter(logging.Filter):
+  """
+  在记录日志的线程中为记录补上请求 id、会话 id 与 trace id；
+  记录进入队列后由后台线程格式化，那时已经取不到请求的上下文
+  """
+
+  def filter(self, record: logging.LogRecord) -> bool:
+    record.request_id = current_request_id.get()
+    record.session_id = _context_value("app.utils.session_resolver",
+                                       "current_session_id")
+    span = _context_value("app.utils.tracing", "current_span")
+    record.trace_id = span.trace_id if span is not None else None
+    record.span_id = span.span_id if span is not None else None
+    return True
+
+
+def _context_value(module_name: str, name: str) -> Optional[Any]:
+  """
+  会话与追踪模块本身依赖 logger，不能在此导入；模块尚未加载时其上下文变量也不可能被设置过
+  """
+  variable = getattr(sys.modules.get(module_name), name, None)
+  return variable.get() if variable is not None else None
@@ -0,0 +1,39 @@
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+# LogRecord 自带的属性，其余属性都来自 extra，原样写入 JSON
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord(
+    "", logging.INFO, "", 0, "", None, None))) | {"message", "asctime"}
+CONTEXT_ATTRIBUTES = ("request_id", "session_id", "trace_id", "span_id")
+
+
+class JsonFormatter(logging.Formatter):
+  """
+  每条记录输出一行 JSON，便于日志系统按请求 id、trace id 与耗时等字段检索
+  """
+
+  def format(self, record: logging.LogRecord) -> str:
+    entry: Dict[str, Any] = {
+      "ts": datetime.fromtimestamp(record.created, timezone.utc)
+      .isoformat(timespec="milliseconds"),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage(),
+      "location": f"{record.module}:{record.lineno}",
+    }
+    for name in CONTEXT_ATTRIBUTES:
+      value = getattr(record, name, None)
+      if value is not None:
+        entry[name] = value
+    for name, value in vars(record).items():
+      if name not in RECORD_ATTRIBUTES and name not in CONTEXT_ATTRIBUTES:
+        entry[name] = value
+    if record.exc_info and not record.exc_text:
+      record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      entry["exception"] = record.exc_text
+    if record.stack_info:
+      entry["stack"] = self.formatStack(record.stack_info)
+    return json.dumps(entry, ensure_ascii=False, default=str)
@@ -1,11 +1,112 @@
+import atexit
+import copy
 import logging
 import logging.config
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
 
-from app.logger.config import LOGGER_CONFIG
+from app.logger.config import build_logger_config, log_queue_size
+from app.logger.context import LogContextFilter
 
 
-def setup_logger():
-  logging.config.dictConfig(LOGGER_CONFIG)
-  return logging.getLogger("app")
+class NonBlockingQueueHandler(QueueHandler):
+  """
+  只把记录放入有界队列，由 QueueListener 的后台线程格式化并写出；
+  队列已满时丢弃记录并计数，记录日志永远不会阻塞请求处理
+  """
 
+  def __init__(self, log_queue: queue.Queue):
+    super().__init__(log_queue)
+    self.dropped = 0
+    self._lock = threading.Lock()
+
+
+  def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+    """
+    只在调用方线程中合并消息参数（参数可能随后被修改），格式化整行留给后台线程
+    """
+    record = copy.copy(record)
+    record.message = record.getMessage()
+    record.msg, record.args = record.message, None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    return record
+
+
+  def enqueue(self, record: logging.LogRecord) -> None:
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      with self._lock:
+        self.dropped += 1
+
+
+class LogQueue:
+  """
+  按配置创建处理器后，把 root 与 app 上的处理器换成同一个队列处理器，
+  原处理器交给后台线程；Python 3.11 的 dictConfig 还不能直接配置 QueueListener
+  """
+
+  def __init__(self):
+    self._handler: Optional[NonBlockingQueueHandler] = None
+    self._listener: Optional[QueueListener] = None
+
+
+  def setup(self) -> logging.Logger:
+    self.stop()
+    logging.config.dictConfig(build_logger_config())
+
+    handlers = []
+    loggers = [logging.getLogger(), logging.getLogger("app")]
+    for each in loggers:
+      for handler in each.handlers:
+        if handler not in handlers:
+          handlers.append(handler)
+    self._handler = NonBlockingQueueHandler(queue.Queue(log_queue_size()))
+    self._handler.addFilter(LogContextFilter())
+    for each in loggers:
+      each.handlers = [self._handler]
+
+    self._listener = QueueListener(self._handler.queue, *handlers,
+                                   respect_handler_level=True)
+    self._listener.start()
+    return logging.getLogger("app")
+
+
+  def stop(self) -> None:
+    """
+    写出队列中剩余的记录后停止后台线程
+    """
+    if self._listener is not None:
+      self._listener.stop()
+      self._listener = None
+
+
+  def stats(self) -> Dict[str, Any]:
+    if self._handler is None:
+      return {"queued": 0, "capacity": 0, "dropped": 0}
+    return {
+      "queued": self._handler.queue.qsize(),
+      "capacity": self._handler.queue.maxsize,
+      "dropped": self._handler.dropped,
+    }
+
+
+def setup_logger() -> logging.Logger:
+  return log_queue.setup()
+
+
+def get_logger(name: str) -> logging.Logger:
+  """
+  app 下的模块使用 get_logger(__name__)，可以通过 LOG_LEVELS 按模块调整级别
+  """
+  return logging.getLogger(name)
+
+
+# 全局实例
+log_queue = LogQueue()
 logger = setup_logger()
+atexit.register(log_queue.stop)
@@ -1,37 +1,187 @@
-from fastapi import FastAPI, HTTPException
-from starlette.responses import PlainTextResponse
-
-from app.logger.logger import logger
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Depends
+from starlette.responses import JSONResponse, PlainTextResponse, Response, \
+  StreamingResponse
+
+# 各模块的全局实例在导入时读取环境变量，必须在其它 app 模块之前加载 .env
+from app.utils import env_loader  # noqa: F401
+from app.jobs.job_manager import job_manager, JobNotFoundError, \
+  JobQueueFullError, JobStateError
+from app.jobs.job_schemas import JobResponse, JobStatus
+from app.LLMs.chain_registry import chain_registry
+from app.LLMs.chain_runner import PromptTooLargeError
+from app.LLMs.LLM import llm_response_cache, model_registry
+from app.LLMs.llm_governor import LLMOverloadedError, llm_endpoint, \
+  llm_governor
+from app.storage.draft_versions import VersionNotFoundError
+from app.storage.store_registry import outcome_store
+from app.storage.version_schemas import DraftVersion, DraftVersionDiff
+from app.LLMs.llm_cache import LLM_CACHE_BYPASS_HEADER, llm_cache_bypass, \
+  is_cache_bypass_requested
+from app.LLMs.usage_ledger import usage_ledger
+from app.logger.logger import get_logger, log_queue
+from app.utils.batch_stream import resolve_max_concurrency, format_ndjson_line
+from app.utils.context_assembler import context_savings
+from app.utils.env_validator import env_varies_validator
+from app.utils.http_logging import RequestLoggingMiddleware
+from app.utils.http_metrics import HttpMetricsMiddleware
+from app.utils.http_tracing import TracingMiddleware
+from app.utils.metrics import PROMETHEUS_CONTENT_TYPE, metrics
+from app.utils.outcome_handler import DocumentView
+from app.utils.session_resolver import current_session_id, get_session_id, \
+  session_id_or_default
+from app.utils.tracing import tracer
 
 from app.work_flow.data_model.chain.data_model_chain import \
-  generate_data_model_draft, modify_data_model_draft, data_model_json_to_md
+  generate_data_model_draft, modify_data_model_draft, data_model_json_to_md, \
+  stream_data_model_generation, stream_data_model_modification, \
+  generate_data_model_batch, data_model_repairer, data_model_similarity_cache
 from app.work_flow.data_model.schemas.dto_schemas.data_model_requests import \
-  DataModelGenerateRequest, DataModelSaveRequest, DataModelRequest
+  DataModelGenerateRequest, DataModelSaveRequest, DataModelRequest, \
+  DataModelBatchGenerateRequest
 from app.work_flow.data_model.schemas.dto_schemas.data_model_response import \
   DataModelResponse
 from app.work_flow.data_model.service.outcomes_service import \
   query_data_model_draft, query_data_model_result, update_data_model_draft, \
-  save_data_model_draft
+  save_data_model_draft, list_data_model_draft_versions, \
+  query_data_model_draft_version, diff_data_model_draft_versions, \
+  restore_data_model_draft_version
 from app.work_flow.user_story.chain.user_story_chain import \
-  generate_user_stories, modify_user_stories_draft, user_stories_json_to_md
+  generate_user_stories, modify_user_stories_draft, user_stories_json_to_md, \
+  stream_user_stories_generation, stream_user_stories_modification, \
+  generate_user_stories_batch, user_stories_repairer, \
+  user_stories_similarity_cache
 from app.work_flow.user_story.schemas.dto_schemas.user_story_requests import \
   UserStoryUpdateRequest, UserStoryRequest, UserStoryGenerateRequest, \
-  UserStorySaveRequest
+  UserStorySaveRequest, UserStoryBatchGenerateRequest
 from app.work_flow.user_story.schemas.dto_schemas.user_story_response import \
   UserStoriesResponse
 from app.work_flow.user_story.service.outcomes_service import (
   update_user_stories_draft, save_user_stories_draft, query_user_stories_draft,
-  query_user_stories_result)
+  query_user_stories_result, list_user_stories_draft_versions,
+  query_user_stories_draft_version, diff_user_stories_draft_versions,
+  restore_user_stories_draft_version)
+
+logger = get_logger(__name__)
+
+# 可以异步提交的任务类型，worker 按类型调用对应的处理函数
+job_manager.register_kind("user_stories.generate", UserStoryGenerateRequest,
+                          generate_user_stories)
+job_manager.register_kind("user_stories.modify", UserStoryUpdateRequest,
+                          modify_user_stories_draft)
+job_manager.register_kind("data_model.generate", DataModelGenerateRequest,
+                          generate_data_model_draft)
+job_manager.register_kind("data_model.modify", DataModelGenerateRequest,
+                          modify_data_model_draft)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+  await job_manager.start()
+  await chain_registry.start()
+  yield
+  await chain_registry.stop()
+  await job_manager.stop()
+  await outcome_store.close()
+  if usage_ledger is not None:
+    await usage_ledger.close()
+  await tracer.close()
+
 
-# Load environment variables
-load_dotenv()
 app = FastAPI(
     title="LLM Requirement Processing API",
     description="Converts natural language requirements into structured software design documents.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+app.add_middleware(HttpMetricsMiddleware)
+app.add_middleware(RequestLoggingMiddleware)
+app.add_middleware(TracingMiddleware)
+
+
+def cache_hit_ratios() -> dict:
+  """
+  /metrics 抓取时读取各缓存的命中率，未开启的缓存不输出
+  """
+  ratios = {("outcome",): outcome_store.stats()["hit_rate"]}
+  if llm_response_cache is not None:
+    ratios[("llm_response",)] = llm_response_cache.stats()["hit_ratio"]
+  for name, cache in (("similarity_user_stories", user_stories_similarity_cache),
+                      ("similarity_data_model", data_model_similarity_cache)):
+    if cache is not None:
+      ratios[(name,)] = cache.stats()["hit_rate"]
+  return ratios
+
+
+def llm_governor_gauges(key: str):
+  return lambda: {(): llm_governor.stats()[key]}
+
+
+metrics.callback_gauge("cache_hit_ratio", "各缓存的命中率", ("cache",),
+                       cache_hit_ratios)
+metrics.callback_gauge("llm_in_flight", "正在进行的 llm 调用数", (),
+                       llm_governor_gauges("in_flight"))
+metrics.callback_gauge("llm_queue_depth", "等待放行的 llm 调用数", (),
+                       llm_governor_gauges("queue_depth"))
+
+
+@app.middleware("http")
+async def llm_request_context_middleware(request: Request, call_next):
+  bypass = is_cache_bypass_requested(
+      request.headers.get(LLM_CACHE_BYPASS_HEADER))
+  token = llm_cache_bypass.set(bypass)
+  endpoint_token = llm_endpoint.set(request.url.path)
+  session_token = current_session_id.set(
+      session_id_or_default(request.headers.get("x-session-id")))
+  try:
+    return await call_next(request)
+  finally:
+    current_session_id.reset(session_token)
+    llm_endpoint.reset(endpoint_token)
+    llm_cache_bypass.reset(token)
+
+
+def llm_overloaded_exception(e: LLMOverloadedError) -> HTTPException:
+  logger.error(str(e))
+  return HTTPException(status_code=503, detail=str(e),
+                       headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(_: Request, e: LLMOverloadedError) -> JSONResponse:
+  exception = llm_overloaded_exception(e)
+  return JSONResponse(status_code=exception.status_code,
+                      content={"detail": exception.detail},
+                      headers=exception.headers)
+
+
+def prompt_too_large_exception(e: PromptTooLargeError) -> HTTPException:
+  logger.error(str(e))
+  return HTTPException(status_code=413, detail=str(e))
+
+
+@app.exception_handler(PromptTooLargeError)
+async def prompt_too_large_handler(_: Request, e: PromptTooLargeError) -> JSONResponse:
+  exception = prompt_too_large_exception(e)
+  return JSONResponse(status_code=exception.status_code,
+                      content={"detail": exception.detail})
+
+
+def document_response(request: Request, view: DocumentView) -> Response:
+  """
+  返回缓存中序列化好的文档；客户端的 If-None-Match 与当前 ETag 相同时返回 304
+  """
+  headers = {"ETag": view.etag, "Cache-Control": "no-cache"}
+  if_none_match = request.headers.get("if-none-match")
+  if if_none_match and view.etag in (tag.strip() for tag in if_none_match.split(",")):
+    return Response(status_code=304, headers=headers)
+  return Response(content=view.body, media_type="application/json",
+                  headers=headers)
+
 
 @app.get("/")
 async def root():
@@ -40,134 +190,553 @@ async def root():
   }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_exporter() -> PlainTextResponse:
+  return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/tracing/stats")
+async def tracing_stats() -> dict:
+  return tracer.stats()
+
+
+@app.get("/logging/stats")
+async def logging_stats() -> dict:
+  return log_queue.stats()
+
+
+@app.get("/llm_cache/stats")
+async def llm_cache_stats() -> dict:
+  if llm_response_cache is None:
+    return {"enabled": False}
+  return {"enabled": True, **llm_response_cache.stats()}
+
+
+@app.get("/llm_models/stats")
+async def llm_models_stats() -> dict:
+  return model_registry.stats()
+
+
+@app.get("/usage/summary")
+async def usage_summary(
+    group_by: str = "endpoint",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    endpoint: Optional[str] = None,
+    session_id: Optional[str] = None
+) -> dict:
+  """
+  按 endpoint、session_id、day、chain 或 model 汇总链调用的 token 用量与耗时
+  """
+  if usage_ledger is None:
+    return {"enabled": False}
+  try:
+    rows = await usage_ledger.aggregate(
+        group_by,
+        since=since.isoformat() if since else None,
+        until=until.isoformat() if until else None,
+        endpoint=endpoint,
+        session_id=session_id)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  return {"enabled": True, "group_by": group_by, "rows": rows}
+
+
+@app.get("/usage/records")
+async def usage_records(limit: int = 50) -> dict:
+  if usage_ledger is None:
+    return {"enabled": False}
+  return {"enabled": True,
+          "records": await usage_ledger.recent(max(1, min(limit, 1000)))}
+
+
+@app.get("/usage/stats")
+async def usage_stats() -> dict:
+  if usage_ledger is None:
+    return {"enabled": False}
+  return {"enabled": True, **usage_ledger.stats()}
+
+
+@app.get("/chains/stats")
+async def chains_stats() -> dict:
+  return chain_registry.stats()
+
+
+@app.get("/llm_governor/stats")
+async def llm_governor_stats() -> dict:
+  return llm_governor.stats()
+
+
+@app.get("/context/stats")
+async def context_stats() -> dict:
+  return context_savings.stats()
+
+
+@app.get("/similarity_cache/stats")
+async def similarity_cache_stats() -> dict:
+  return {
+    name: {"enabled": False} if cache is None else {"enabled": True, **cache.stats()}
+    for name, cache in (("user_stories", user_stories_similarity_cache),
+                        ("data_model", data_model_similarity_cache))
+  }
+
+
+@app.get("/outcome_cache/stats")
+async def outcome_cache_stats() -> dict:
+  return outcome_store.stats()
+
+
+@app.get("/repair/stats")
+async def repair_stats() -> dict:
+  return {
+    "user_stories": user_stories_repairer.stats(),
+    "data_model": data_model_repairer.stats(),
+  }
+
+
 @app.post("/user_stories/json_to_md", response_class=PlainTextResponse)
-async def convert_json_to_md(request: UserStoryRequest) -> PlainTextResponse:
-  result = await user_stories_json_to_md(request)
+async def convert_json_to_md(
+    request: UserStoryRequest,
+    polish: bool = False
+) -> PlainTextResponse:
+  result = await user_stories_json_to_md(request, polish)
   return PlainTextResponse(result)
 
 
 @app.post("/user_stories/generate", response_model=UserStoriesResponse)
-async def user_stories_generation(request: UserStoryGenerateRequest) -> UserStoriesResponse:
+async def user_stories_generation(
+    request: UserStoryGenerateRequest,
+    session_id: str = Depends(get_session_id)
+) -> UserStoriesResponse:
   try:
-    user_stories = await generate_user_stories(request)
+    user_stories = await generate_user_stories(request, session_id)
     return user_stories
+  except LLMOverloadedError as e:
+    raise llm_overloaded_exception(e)
+  except PromptTooLargeError as e:
+    raise prompt_too_large_exception(e)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/user_stories/generate/stream")
+async def user_stories_generation_stream(
+    request: UserStoryGenerateRequest,
+    session_id: str = Depends(get_session_id)
+) -> StreamingResponse:
+  return StreamingResponse(stream_user_stories_generation(request, session_id),
+                           media_type="text/event-stream")
+
+
+@app.post("/user_stories/generate/batch")
+async def user_stories_batch_generation(
+    request: UserStoryBatchGenerateRequest
+) -> StreamingResponse:
+  env_varies_validator()
+  max_concurrency = resolve_max_concurrency(request.max_concurrency)
+
+  async def ndjson_lines():
+    async for item in generate_user_stories_batch(request.items,
+                                                  max_concurrency):
+      yield format_ndjson_line(item)
+
+  return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
 @app.get("/user_stories/query/draft", response_model=UserStoriesResponse)
-async def user_stories_draft_querier() -> UserStoriesResponse:
+async def user_stories_draft_querier(
+    request: Request,
+    session_id: str = Depends(get_session_id)
+) -> Response:
   try:
-    draft = query_user_stories_draft()
-    return draft
+    return document_response(request, await query_user_stories_draft(session_id))
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/user_stories/query/result", response_model=UserStoriesResponse)
-async def user_stories_result_querier() -> UserStoriesResponse:
+async def user_stories_result_querier(
+    request: Request,
+    session_id: str = Depends(get_session_id)
+) -> Response:
   try:
-    result = query_user_stories_result()
-    return result
+    return document_response(request, await query_user_stories_result(session_id))
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/user_stories/modify", response_model=UserStoriesResponse)
-async def user_stories_modification(request: UserStoryUpdateRequest) -> UserStoriesResponse:
+async def user_stories_modification(
+    request: UserStoryUpdateRequest,
+    session_id: str = Depends(get_session_id)
+) -> UserStoriesResponse:
   try:
-    updated_user_stories = await modify_user_stories_draft(request)
+    updated_user_stories = await modify_user_stories_draft(request, session_id)
     return updated_user_stories
+  except LLMOverloadedError as e:
+    raise llm_overloaded_exception(e)
+  except PromptTooLargeError as e:
+    raise prompt_too_large_exception(e)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/user_stories/modify/stream")
+async def user_stories_modification_stream(
+    request: UserStoryUpdateRequest,
+    session_id: str = Depends(get_session_id)
+) -> StreamingResponse:
+  return StreamingResponse(stream_user_stories_modification(request,
+                                                            session_id),
+                           media_type="text/event-stream")
+
+
 @app.post("/user_stories/update/draft", response_model=None)
-async def user_stories_draft_update(request: UserStoryRequest) -> None:
+async def user_stories_draft_update(
+    request: UserStoryRequest,
+    session_id: str = Depends(get_session_id)
+) -> None:
   try:
-    await update_user_stories_draft(request)
+    await update_user_stories_draft(request, session_id)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/user_stories/save/draft", response_model=None)
-async def user_stories_save_draft(request: UserStorySaveRequest) -> None:
+async def user_stories_save_draft(
+    request: UserStorySaveRequest,
+    session_id: str = Depends(get_session_id)
+) -> None:
   try:
-    await save_user_stories_draft(request)
+    await save_user_stories_draft(request, session_id)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/data_model/json_to_md", response_class=PlainTextResponse)
-async def convert_json_to_md(request: DataModelRequest) -> PlainTextResponse:
-  result = await data_model_json_to_md(request)
+async def convert_json_to_md(
+    request: DataModelRequest,
+    polish: bool = False
+) -> PlainTextResponse:
+  result = await data_model_json_to_md(request, polish)
   return PlainTextResponse(result)
 
 
 @app.post("/data_model/generate", response_model= DataModelResponse)
-async def data_model_generation(data_model_requirement: DataModelGenerateRequest) -> DataModelResponse:
+async def data_model_generation(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = Depends(get_session_id)
+) -> DataModelResponse:
   try:
-    data_model = await generate_data_model_draft(data_model_requirement)
+    data_model = await generate_data_model_draft(data_model_requirement,
+                                                 session_id)
     return data_model
+  except LLMOverloadedError as e:
+    raise llm_overloaded_exception(e)
+  except PromptTooLargeError as e:
+    raise prompt_too_large_exception(e)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/data_model/generate/stream")
+async def data_model_generation_stream(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = Depends(get_session_id)
+) -> StreamingResponse:
+  return StreamingResponse(stream_data_model_generation(data_model_requirement,
+                                                        session_id),
+                           media_type="text/event-stream")
+
+
+@app.post("/data_model/generate/batch")
+async def data_model_batch_generation(
+    request: DataModelBatchGenerateRequest
+) -> StreamingResponse:
+  env_varies_validator()
+  max_concurrency = resolve_max_concurrency(request.max_concurrency)
+
+  async def ndjson_lines():
+    async for item in generate_data_model_batch(request.items,
+                                                max_concurrency):
+      yield format_ndjson_line(item)
+
+  return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
 @app.post("/data_model/modify", response_model= DataModelResponse)
-async def data_model_modification(data_model_requirement: DataModelGenerateRequest) -> DataModelResponse:
+async def data_model_modification(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = Depends(get_session_id)
+) -> DataModelResponse:
   try:
-    data_model = await modify_data_model_draft(data_model_requirement)
+    data_model = await modify_data_model_draft(data_model_requirement,
+                                               session_id)
     return data_model
+  except LLMOverloadedError as e:
+    raise llm_overloaded_exception(e)
+  except PromptTooLargeError as e:
+    raise prompt_too_large_exception(e)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/data_model/modify/stream")
+async def data_model_modification_stream(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = Depends(get_session_id)
+) -> StreamingResponse:
+  return StreamingResponse(
+      stream_data_model_modification(data_model_requirement, session_id),
+      media_type="text/event-stream")
+
+
 @app.get("/data_model/query/draft", response_model=DataModelResponse)
-async def data_model_draft_querier() -> DataModelResponse:
+async def data_model_draft_querier(
+    request: Request,
+    session_id: str = Depends(get_session_id)
+) -> Response:
   try:
-    draft = query_data_model_draft()
-    return draft
+    return document_response(request, await query_data_model_draft(session_id))
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/data_model/query/result", response_model=DataModelResponse)
-async def user_stories_result_querier() -> DataModelResponse:
+async def data_model_result_querier(
+    request: Request,
+    session_id: str = Depends(get_session_id)
+) -> Response:
   try:
-    result = query_data_model_result()
-    return result
+    return document_response(request, await query_data_model_result(session_id))
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/data_model/update/draft", response_model=None)
-async def data_model_draft_update(request: DataModelRequest) -> None:
+async def data_model_draft_update(
+    request: DataModelRequest,
+    session_id: str = Depends(get_session_id)
+) -> None:
   try:
-    await update_data_model_draft(request)
+    await update_data_model_draft(request, session_id)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/data_model/save/draft", response_model=None)
-async def data_model_save_draft(request: DataModelSaveRequest) -> None:
+async def data_model_save_draft(
+    request: DataModelSaveRequest,
+    session_id: str = Depends(get_session_id)
+) -> None:
   try:
-    await save_data_model_draft(request)
+    await save_data_model_draft(request, session_id)
   except Exception as e:
     logger.error(str(e))
     raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/user_stories/draft/versions", response_model=List[DraftVersion])
+async def user_stories_draft_versions(
+    session_id: str = Depends(get_session_id)
+) -> List[DraftVersion]:
+  return await list_user_stories_draft_versions(session_id)
+
+
+@app.get("/user_stories/draft/versions/diff", response_model=DraftVersionDiff)
+async def user_stories_draft_versions_diff(
+    from_version: int,
+    to_version: int,
+    session_id: str = Depends(get_session_id)
+) -> DraftVersionDiff:
+  try:
+    return await diff_user_stories_draft_versions(session_id, from_version,
+                                                  to_version)
+  except VersionNotFoundError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.get("/user_stories/draft/versions/{version}",
+         response_model=UserStoriesResponse)
+async def user_stories_draft_version_querier(
+    version: int,
+    session_id: str = Depends(get_session_id)
+) -> UserStoriesResponse:
+  try:
+    return await query_user_stories_draft_version(session_id, version)
+  except VersionNotFoundError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.post("/user_stories/draft/versions/{version}/restore",
+          response_model=UserStoriesResponse)
+async def user_stories_draft_version_restore(
+    version: int,
+    session_id: str = Depends(get_session_id)
+) -> UserStoriesResponse:
+  try:
+    return await restore_user_stories_draft_version(session_id, version)
+  except VersionNotFoundError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.get("/data_model/draft/versions", response_model=List[DraftVersion])
+async def data_model_draft_versions(
+    session_id: str = Depends(get_session_id)
+) -> List[DraftVersion]:
+  return await list_data_model_draft_versions(session_id)
+
+
+@app.get("/data_model/draft/versions/diff", response_model=DraftVersionDiff)
+async def data_model_draft_versions_diff(
+    from_version: int,
+    to_version: int,
+    session_id: str = Depends(get_session_id)
+) -> DraftVersionDiff:
+  try:
+    return await diff_data_model_draft_versions(session_id, from_version,
+                                                to_version)
+  except VersionNotFoundError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.get("/data_model/draft/versions/{version}",
+         response_model=DataModelResponse)
+async def data_model_draft_version_querier(
+    version: int,
+    session_id: str = Depends(get_session_id)
+) -> DataModelResponse:
+  try:
+    return await query_data_model_draft_version(session_id, version)
+  except VersionNotFoundError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.post("/data_model/draft/versions/{version}/restore",
+          response_model=DataModelResponse)
+async def data_model_draft_version_restore(
+    version: int,
+    session_id: str = Depends(get_session_id)
+) -> DataModelResponse:
+  try:
+    return await restore_data_model_draft_version(session_id, version)
+  except VersionNotFoundError as e:
+    raise HTTPException(status_code=404, detail=e.args[0])
+
+
+async def submit_job(
+    kind: str,
+    request,
+    callback_url: Optional[str],
+    session_id: str
+) -> JobResponse:
+  try:
+    record = await job_manager.submit(kind, request, callback_url, session_id)
+    return JobResponse.from_record(record)
+  except JobQueueFullError as e:
+    logger.error(str(e))
+    raise HTTPException(status_code=503, detail=str(e))
+  except JobStateError as e:
+    logger.error(str(e))
+    raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/jobs/user_stories/generate", response_model=JobResponse,
+          status_code=202)
+async def user_stories_generation_job(
+    request: UserStoryGenerateRequest,
+    callback_url: Optional[str] = None,
+    session_id: str = Depends(get_session_id)
+) -> JobResponse:
+  return await submit_job("user_stories.generate", request, callback_url,
+                          session_id)
+
+
+@app.post("/jobs/user_stories/modify", response_model=JobResponse,
+          status_code=202)
+async def user_stories_modification_job(
+    request: UserStoryUpdateRequest,
+    callback_url: Optional[str] = None,
+    session_id: str = Depends(get_session_id)
+) -> JobResponse:
+  return await submit_job("user_stories.modify", request, callback_url,
+                          session_id)
+
+
+@app.post("/jobs/data_model/generate", response_model=JobResponse,
+          status_code=202)
+async def data_model_generation_job(
+    data_model_requirement: DataModelGenerateRequest,
+    callback_url: Optional[str] = None,
+    session_id: str = Depends(get_session_id)
+) -> JobResponse:
+  return await submit_job("data_model.generate", data_model_requirement,
+                          callback_url, session_id)
+
+
+@app.post("/jobs/data_model/modify", response_model=JobResponse,
+          status_code=202)
+async def data_model_modification_job(
+    data_model_requirement: DataModelGenerateRequest,
+    callback_url: Optional[str] = None,
+    session_id: str = Depends(get_session_id)
+) -> JobResponse:
+  return await submit_job("data_model.modify", data_model_requirement,
+                          callback_url, session_id)
+
+
+@app.get("/jobs", response_model=List[JobResponse])
+async def jobs_querier(status: Optional[JobStatus] = None) -> List[JobResponse]:
+  return [JobResponse.from_record(record)
+          for record in job_manager.list_jobs(status)]
+
+
+@app.get("/jobs/stats")
+async def jobs_stats() -> dict:
+  return job_manager.stats()
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def job_querier(job_id: str) -> JobResponse:
+  try:
+    return JobResponse.from_record(job_manager.get(job_id))
+  except JobNotFoundError:
+    raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def job_cancellation(job_id: str) -> JobResponse:
+  try:
+    return JobResponse.from_record(await job_manager.cancel(job_id))
+  except JobNotFoundError:
+    raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+  except JobStateError as e:
+    raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/jobs/{job_id}/retry", response_model=JobResponse)
+async def job_retry(job_id: str) -> JobResponse:
+  try:
+    return JobResponse.from_record(await job_manager.retry(job_id))
+  except JobNotFoundError:
+    raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+  except JobQueueFullError as e:
+    raise HTTPException(status_code=503, detail=str(e))
+  except JobStateError as e:
+    raise HTTPException(status_code=409, detail=str(e))
+
+
 if __name__ == "__main__":
   import uvicorn
 
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.logger.logger import get_logger
+from app.storage.outcome_store import OutcomeStore
+
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_DOCUMENTS = 256
+
+DocumentKey = Tuple[str, str]
+
+
+@dataclass
+class CachedDocument:
+  """
+  缓存中的文档：content 为 None 表示文档不存在；
+  derived 保存由内容派生的对象（如校验后的 pydantic 对象），内容变化时整体失效
+  """
+  content: Optional[str]
+  etag: Optional[str]
+  derived: Dict[Any, Any] = field(default_factory=dict)
+
+
+class CachedOutcomeStore(OutcomeStore):
+  """
+  在任意存储后端前加一层进程内的热点文档缓存：
+  - 读取命中时不访问后端，写入时替换缓存条目，派生对象随之失效
+  - write_behind_seconds 大于 0 时写入先进入缓存，由后台任务在该时间内批量落盘，
+    进程崩溃最多丢失这段时间内的写入；为 0 时直接写穿
+  缓存只在单个进程内有效，多进程部署时应关闭写回并避免跨进程共享会话
+  """
+
+  def __init__(
+      self,
+      backend: OutcomeStore,
+      max_documents: int = DEFAULT_CACHE_DOCUMENTS,
+      write_behind_seconds: float = 0.0
+  ):
+    super().__init__()
+    self.backend = backend
+    self.max_documents = max(1, max_documents)
+    self.write_behind_seconds = write_behind_seconds
+
+    self._entries: "OrderedDict[DocumentKey, CachedDocument]" = OrderedDict()
+    self._dirty: Set[DocumentKey] = set()
+    self._flushing: Set[DocumentKey] = set()
+    self._flusher: Optional[asyncio.Task] = None
+    self._flush_lock: Optional[asyncio.Lock] = None
+    self._counters = {"hits": 0, "misses": 0, "writes": 0, "flushes": 0,
+                      "flushed_documents": 0, "flush_errors": 0, "evictions": 0}
+
+
+  async def read(self, session_id: str, document: str) -> Optional[str]:
+    return (await self.read_entry(session_id, document)).content
+
+
+  async def read_entry(self, session_id: str, document: str) -> CachedDocument:
+    """
+    读取文档的缓存条目，未命中时从后端加载
+    """
+    key = (session_id, document)
+    entry = self._entries.get(key)
+    if entry is not None:
+      self._entries.move_to_end(key)
+      self._counters["hits"] += 1
+      return entry
+    self._counters["misses"] += 1
+    content = await self.backend.read(session_id, document)
+    # 加载期间可能有新的写入，以缓存中的条目为准
+    entry = self._entries.get(key)
+    if entry is None:
+      entry = self._put(key, content)
+    return entry
+
+
+  async def write(self, session_id: str, document: str, content: str) -> None:
+    key = (session_id, document)
+    self._counters["writes"] += 1
+    if self.write_behind_seconds <= 0:
+      await self.backend.write(session_id, document, content)
+      self._put(key, content)
+      return
+    self._put(key, content)
+    self._dirty.add(key)
+    self._ensure_flusher()
+
+
+  async def flush(self) -> None:
+    """
+    把所有尚未落盘的写入写入后端，失败的文档保留在待写集合中等待下次重试
+    """
+    if not self._dirty:
+      return
+    if self._flush_lock is None:
+      self._flush_lock = asyncio.Lock()
+    async with self._flush_lock:
+      pending = {key: self._entries[key].content for key in self._dirty}
+      self._flushing, self._dirty = set(pending), set()
+      self._counters["flushes"] += 1
+      written: Set[DocumentKey] = set()
+      try:
+        for key, content in pending.items():
+          try:
+            await self.backend.write(key[0], key[1], content)
+            written.add(key)
+            self._counters["flushed_documents"] += 1
+          except Exception as e:
+            self._counters["flush_errors"] += 1
+            logger.error("会话 %s 的文档 %s 写回失败：%s", key[0], key[1], e)
+      finally:
+        # 失败或因取消而未写入的文档放回待写集合
+        self._dirty |= set(pending) - written
+        self._flushing = set()
+
+
+  async def close(self) -> None:
+    flusher, self._flusher = self._flusher, None
+    if flusher is not None:
+      if self._flush_lock is None:
+        self._flush_lock = asyncio.Lock()
+      # 等正在进行的写回结束，只取消两次写回之间的等待
+      async with self._flush_lock:
+        flusher.cancel()
+      with suppress(asyncio.CancelledError):
+        await flusher
+    await self.flush()
+    await self.backend.close()
+
+
+  def stats(self) -> Dict[str, Any]:
+    lookups = self._counters["hits"] + self._counters["misses"]
+    return {
+      **self._counters,
+      "documents": len(self._entries),
+      "dirty_documents": len(self._dirty),
+      "write_behind_seconds": self.write_behind_seconds,
+      "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+    }
+
+
+  def _put(self, key: DocumentKey, content: Optional[str]) -> CachedDocument:
+    entry = CachedDocument(content=content, etag=content_etag(content))
+    self._entries[key] = entry
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_documents:
+      # 尚未落盘的文档不能淘汰
+      victim = next((candidate for candidate in self._entries
+                     if candidate not in self._dirty
+                     and candidate not in self._flushing), None)
+      if victim is None:
+        break
+      del self._entries[victim]
+      self._counters["evictions"] += 1
+    return entry
+
+
+  def _ensure_flusher(self) -> None:
+    if self._flusher is None or self._flusher.done():
+      self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+
+  async def _flush_loop(self) -> None:
+    while self._dirty:
+      await asyncio.sleep(self.write_behind_seconds)
+      await self.flush()
+
+
+def content_etag(content: Optional[str]) -> Optional[str]:
+  if content is None:
+    return None
+  return '"' + hashlib.sha1(content.encode("utf-8")).hexdigest()[:20] + '"'
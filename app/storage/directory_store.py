@@ -0,0 +1,58 @@
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from app.storage.outcome_store import OutcomeStore
+
+DEFAULT_OUTCOME_ROOT = 'app/outcomes'
+
+
+class DirectoryOutcomeStore(OutcomeStore):
+  """
+  本地目录树存储：<root>/<session_id>/<document>.json
+  """
+
+  def __init__(self, root: str = DEFAULT_OUTCOME_ROOT):
+    super().__init__()
+    self.root = Path(root)
+
+
+  def document_path(self, session_id: str, document: str) -> Path:
+    return self.root / session_id / f"{document}.json"
+
+
+  async def read(self, session_id: str, document: str) -> Optional[str]:
+    return await asyncio.to_thread(self._read,
+                                   self.document_path(session_id, document))
+
+
+  async def write(self, session_id: str, document: str, content: str) -> None:
+    await asyncio.to_thread(self._write,
+                            self.document_path(session_id, document), content)
+
+
+  @staticmethod
+  def _read(path: Path) -> Optional[str]:
+    try:
+      return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+      return None
+
+
+  @staticmethod
+  def _write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.",
+                                     suffix=".tmp")
+    try:
+      with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+      os.replace(temp_path, path)
+    except BaseException:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+      raise
@@ -0,0 +1,141 @@
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from app.logger.logger import get_logger
+from app.storage.outcome_store import OutcomeStore
+from app.storage.store_registry import outcome_store
+from app.utils.json_patch import apply_json_patch, make_json_patch
+
+logger = get_logger(__name__)
+
+DEFAULT_SNAPSHOT_INTERVAL = 10
+
+
+class VersionNotFoundError(KeyError):
+  pass
+
+
+class DraftVersioning:
+  """
+  草稿的版本记录：每次写入只保存相对上一版本的结构化补丁，每隔若干版本保存一次完整快照。
+  版本索引存放在文档 <document>.versions 中，各版本内容存放在 <document>.v<n> 中。
+  """
+
+  def __init__(self, store: OutcomeStore,
+      snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+    self.store = store
+    self.snapshot_interval = max(1, snapshot_interval)
+
+
+  async def record(
+      self,
+      session_id: str,
+      document: str,
+      previous: Optional[Any],
+      content: Any
+  ) -> Optional[int]:
+    """
+    记录一次草稿写入，调用方需持有该文档的锁
+    :param previous: 写入前的草稿内容，不存在时为 None
+    :param content: 写入后的草稿内容
+    :return: 新版本号，内容未变化时返回 None
+    """
+    index = await self._load_index(session_id, document)
+    if index and previous == content:
+      return None
+
+    version = index[-1]["version"] + 1 if index else 1
+    patch = make_json_patch(previous, content) if index and previous is not None else None
+    use_snapshot = (
+        patch is None
+        or (version - 1) % self.snapshot_interval == 0
+        or len(_dumps(patch)) >= len(_dumps(content))
+    )
+
+    if use_snapshot:
+      payload = {"snapshot": content}
+      entry = {"version": version, "created_at": time.time(),
+               "kind": "snapshot", "operations": 0}
+    else:
+      payload = {"patch": patch}
+      entry = {"version": version, "created_at": time.time(),
+               "kind": "patch", "operations": len(patch)}
+
+    await self.store.write(session_id, _version_document(document, version),
+                           _dumps(payload))
+    index.append(entry)
+    await self.store.write(session_id, _index_document(document), _dumps(index))
+    logger.info("会话 %s 的文档 %s 记录版本 %s（%s）", session_id, document,
+                version, entry['kind'])
+    return version
+
+
+  async def list_versions(self, session_id: str,
+      document: str) -> List[Dict[str, Any]]:
+    return await self._load_index(session_id, document)
+
+
+  async def get_version(self, session_id: str, document: str,
+      version: int) -> Any:
+    """
+    从最近的快照开始依次应用补丁，还原指定版本的内容
+    """
+    index = await self._load_index(session_id, document)
+    if not any(entry["version"] == version for entry in index):
+      raise VersionNotFoundError(f"文档 {document} 不存在版本 {version}")
+
+    base = max(entry["version"] for entry in index
+               if entry["kind"] == "snapshot" and entry["version"] <= version)
+    content = None
+    for current in range(base, version + 1):
+      payload = await self._load_payload(session_id, document, current)
+      if "snapshot" in payload:
+        content = payload["snapshot"]
+      else:
+        content = apply_json_patch(content, payload["patch"])
+    return content
+
+
+  async def diff_versions(self, session_id: str, document: str,
+      from_version: int, to_version: int) -> List[Dict[str, Any]]:
+    old = await self.get_version(session_id, document, from_version)
+    new = await self.get_version(session_id, document, to_version)
+    return make_json_patch(old, new)
+
+
+  async def _load_index(self, session_id: str,
+      document: str) -> List[Dict[str, Any]]:
+    content = await self.store.read(session_id, _index_document(document))
+    return json.loads(content) if content else []
+
+
+  async def _load_payload(self, session_id: str, document: str,
+      version: int) -> Dict[str, Any]:
+    content = await self.store.read(session_id,
+                                    _version_document(document, version))
+    if content is None:
+      raise VersionNotFoundError(f"文档 {document} 的版本 {version} 内容缺失")
+    return json.loads(content)
+
+
+def _index_document(document: str) -> str:
+  return f"{document}.versions"
+
+
+def _version_document(document: str, version: int) -> str:
+  return f"{document}.v{version}"
+
+
+def _dumps(content: Any) -> str:
+  return json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+
+
+# 全局实例
+# 版本记录很少被读取，直接读写存储后端，不占用热点缓存、也不挤出正在编辑的草稿
+draft_versioning = DraftVersioning(
+    outcome_store.backend,
+    snapshot_interval=int(os.environ.get("DRAFT_SNAPSHOT_INTERVAL",
+                                         DEFAULT_SNAPSHOT_INTERVAL))
+)
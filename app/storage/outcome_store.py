@@ -0,0 +1,47 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+from weakref import WeakValueDictionary
+
+
+class OutcomeStore(ABC):
+  """
+  草稿与成果的存储接口，文档以 (session_id, document) 为键，内容为 json 文本
+  """
+
+  def __init__(self):
+    # 只以弱引用保存，没有协程持有或等待的锁随之释放，不随会话数增长
+    self._locks: "WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = \
+      WeakValueDictionary()
+
+
+  def lock(self, session_id: str, document: str) -> asyncio.Lock:
+    """
+    获取某个文档的异步锁，同一文档的读-改-写需要在锁内完成
+    """
+    key = (session_id, document)
+    lock = self._locks.get(key)
+    if lock is None:
+      lock = self._locks[key] = asyncio.Lock()
+    return lock
+
+
+  @abstractmethod
+  async def read(self, session_id: str, document: str) -> Optional[str]:
+    """
+    读取文档
+    :return: 文档的 json 文本，不存在时返回 None
+    """
+
+
+  @abstractmethod
+  async def write(self, session_id: str, document: str, content: str) -> None:
+    """
+    原子地写入文档，写入过程中的读取只会看到旧内容或新内容
+    """
+
+
+  async def close(self) -> None:
+    """
+    释放存储占用的资源，应用关闭时调用
+    """
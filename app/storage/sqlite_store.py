@@ -0,0 +1,120 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from app.storage.outcome_store import OutcomeStore
+
+DEFAULT_OUTCOME_DB_PATH = 'app/outcomes/outcomes.sqlite3'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_BUSY_TIMEOUT_SECONDS = 5.0
+
+
+class SQLiteConnectionPool:
+  """
+  SQLite 连接池：WAL 模式下多个连接可以同时读，写入仍由 SQLite 串行化。
+  连接按需创建，最多 size 个，取不到空闲连接时阻塞等待
+  """
+
+  def __init__(self, db_path: str, size: int = DEFAULT_POOL_SIZE,
+      busy_timeout: float = DEFAULT_BUSY_TIMEOUT_SECONDS):
+    self.db_path = db_path
+    self.size = max(1, size)
+    self.busy_timeout = busy_timeout
+    self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+    self._all: List[sqlite3.Connection] = []
+    self._lock = threading.Lock()
+
+
+  @contextmanager
+  def connection(self) -> Iterator[sqlite3.Connection]:
+    conn = self._acquire()
+    try:
+      yield conn
+    finally:
+      self._idle.put(conn)
+
+
+  def close(self) -> None:
+    with self._lock:
+      connections, self._all = self._all, []
+    for conn in connections:
+      conn.close()
+
+
+  def _acquire(self) -> sqlite3.Connection:
+    try:
+      return self._idle.get_nowait()
+    except queue.Empty:
+      pass
+    with self._lock:
+      if len(self._all) < self.size:
+        conn = self._connect()
+        self._all.append(conn)
+        return conn
+    return self._idle.get()
+
+
+  def _connect(self) -> sqlite3.Connection:
+    conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                           check_same_thread=False)
+    # WAL 让读不阻塞写；NORMAL 在 WAL 下只在检查点时 fsync，断电最多丢失最近的提交
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteOutcomeStore(OutcomeStore):
+  """
+  嵌入式 SQLite 存储，每个 (session_id, document) 一行；读写在线程池中执行，不阻塞事件循环
+  """
+
+  def __init__(self, db_path: str = DEFAULT_OUTCOME_DB_PATH,
+      pool_size: int = DEFAULT_POOL_SIZE):
+    super().__init__()
+    self.db_path = db_path
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    self._pool = SQLiteConnectionPool(db_path, pool_size)
+    with self._pool.connection() as conn, conn:
+      conn.execute(
+          "CREATE TABLE IF NOT EXISTS outcomes ("
+          "session_id TEXT NOT NULL, document TEXT NOT NULL, "
+          "content TEXT NOT NULL, updated_at REAL NOT NULL, "
+          "PRIMARY KEY (session_id, document))"
+      )
+
+
+  async def read(self, session_id: str, document: str) -> Optional[str]:
+    return await asyncio.to_thread(self._read, session_id, document)
+
+
+  async def write(self, session_id: str, document: str, content: str) -> None:
+    await asyncio.to_thread(self._write, session_id, document, content)
+
+
+  async def close(self) -> None:
+    await asyncio.to_thread(self._pool.close)
+
+
+  def _read(self, session_id: str, document: str) -> Optional[str]:
+    with self._pool.connection() as conn:
+      row = conn.execute(
+          "SELECT content FROM outcomes WHERE session_id = ? AND document = ?",
+          (session_id, document)
+      ).fetchone()
+    return row[0] if row else None
+
+
+  def _write(self, session_id: str, document: str, content: str) -> None:
+    with self._pool.connection() as conn, conn:
+      conn.execute(
+          "INSERT INTO outcomes (session_id, document, content, updated_at) "
+          "VALUES (?, ?, ?, ?) "
+          "ON CONFLICT (session_id, document) DO UPDATE SET "
+          "content = excluded.content, updated_at = excluded.updated_at",
+          (session_id, document, content, time.time())
+      )
@@ -0,0 +1,50 @@
+import os
+
+from app.logger.logger import get_logger
+from app.storage.cached_store import CachedOutcomeStore, \
+  DEFAULT_CACHE_DOCUMENTS
+from app.storage.directory_store import DirectoryOutcomeStore, \
+  DEFAULT_OUTCOME_ROOT
+from app.storage.outcome_store import OutcomeStore
+from app.storage.sqlite_store import SQLiteOutcomeStore, \
+  DEFAULT_OUTCOME_DB_PATH, DEFAULT_POOL_SIZE
+
+logger = get_logger(__name__)
+
+
+def build_outcome_store() -> CachedOutcomeStore:
+  """
+  构建带热点缓存的草稿与成果存储，缓存大小与写回时间由 OUTCOME_CACHE_DOCUMENTS、
+  OUTCOME_WRITE_BEHIND_SECONDS 配置，默认写穿
+  """
+  backend = build_backend_store()
+  write_behind = float(os.environ.get("OUTCOME_WRITE_BEHIND_SECONDS", 0))
+  if write_behind > 0:
+    logger.info("草稿与成果延迟写回，最多延迟 %s 秒落盘", write_behind)
+  return CachedOutcomeStore(
+      backend,
+      max_documents=int(os.environ.get("OUTCOME_CACHE_DOCUMENTS",
+                                       DEFAULT_CACHE_DOCUMENTS)),
+      write_behind_seconds=write_behind,
+  )
+
+
+def build_backend_store() -> OutcomeStore:
+  """
+  按环境变量 OUTCOME_STORE_BACKEND（directory | sqlite）构建草稿与成果的存储后端
+  """
+  backend = os.environ.get("OUTCOME_STORE_BACKEND", "directory").lower()
+  if backend == "directory":
+    root = os.environ.get("OUTCOME_STORE_ROOT", DEFAULT_OUTCOME_ROOT)
+    logger.info("使用目录存储草稿与成果：%s", root)
+    return DirectoryOutcomeStore(root)
+  if backend == "sqlite":
+    db_path = os.environ.get("OUTCOME_STORE_DB_PATH", DEFAULT_OUTCOME_DB_PATH)
+    pool_size = int(os.environ.get("OUTCOME_STORE_POOL_SIZE", DEFAULT_POOL_SIZE))
+    logger.info("使用 SQLite 存储草稿与成果：%s，连接池 %s", db_path, pool_size)
+    return SQLiteOutcomeStore(db_path, pool_size)
+  raise ValueError(f"不支持的存储后端：{backend}")
+
+
+# 全局实例
+outcome_store = build_outcome_store()
@@ -0,0 +1,17 @@
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, Field
+
+
+class DraftVersion(BaseModel):
+  version: int = Field(description="Version number, starting from 1")
+  created_at: float = Field(description="Unix time when the version was written")
+  kind: str = Field(description="snapshot or patch")
+  operations: int = Field(description="Number of patch operations (0 for snapshots)")
+
+
+class DraftVersionDiff(BaseModel):
+  from_version: int
+  to_version: int
+  patch: List[Dict[str, Any]] = Field(
+    description="JSON patch (RFC 6902) turning from_version into to_version")
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 
-from app.logger.logger import logger
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 def base_model_to_json(model: BaseModel) -> str:
@@ -0,0 +1,27 @@
+import json
+import os
+from typing import Any, Optional
+
+DEFAULT_BATCH_MAX_CONCURRENCY = 4
+# 单个批量请求最多包含的条目数，超出时请求校验失败，避免一次请求占满 llm 配额
+MAX_BATCH_ITEMS = 20
+
+
+def resolve_max_concurrency(requested: Optional[int]) -> int:
+  """
+  计算批量生成的并发上限，请求值不能超过环境变量 BATCH_MAX_CONCURRENCY
+  :param requested: 请求中指定的并发数，为空时使用上限
+  :return: 实际使用的并发数
+  """
+  ceiling = int(os.environ.get("BATCH_MAX_CONCURRENCY",
+                               DEFAULT_BATCH_MAX_CONCURRENCY))
+  if requested is None:
+    return ceiling
+  return max(1, min(requested, ceiling))
+
+
+def format_ndjson_line(data: Any) -> str:
+  """
+  将单条批量结果编码为一行 NDJSON
+  """
+  return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
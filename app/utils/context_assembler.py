@@ -0,0 +1,172 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.history_manager import get_history_manager
+from app.logger.logger import get_logger
+from app.utils.token_estimator import estimate_tokens
+
+logger = get_logger(__name__)
+
+DEFAULT_DRAFT_TOKEN_BUDGET = 3000
+DEFAULT_HISTORY_TOKEN_BUDGET = 400
+HISTORY_RECORD_LIMIT = 5
+NO_HISTORY_TEXT = "暂无历史修改记录。"
+# 要求中出现这些词时可能删除、替换或统一修改没有点名的条目（如“删除所有审计表”
+# “给所有实体加上 created_at 字段”），不精简草稿；英文按整词匹配，避免 install 命中 all
+UNNAMED_ITEM_KEYWORDS = ("删", "去掉", "去除", "移除", "不要", "不需要", "合并", "拆分",
+                         "替换", "改名", "重命名", "所有", "每个", "每一个", "全部",
+                         "各个", "一律", "统一")
+UNNAMED_ITEM_PATTERN = re.compile(
+    r"\b(remove|delete|drop|merge|split|replace|rename|all|every|each)\b",
+    re.IGNORECASE)
+
+
+@dataclass
+class AssembledContext:
+  """
+  修改链的提示词输入，以及与旧做法（完整缩进草稿）相比的 token 估算
+  """
+  inputs: Dict[str, str]
+  baseline_tokens: int
+  condensed: List[str] = field(default_factory=list)
+
+  @property
+  def assembled_tokens(self) -> int:
+    return sum(estimate_tokens(value) for value in self.inputs.values())
+
+  @property
+  def tokens_saved(self) -> int:
+    return max(0, self.baseline_tokens - self.assembled_tokens)
+
+
+class ContextSavingsCounter:
+  """
+  统计上下文组装为各工作流节省的 token 数
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats: Dict[str, Dict[str, int]] = {}
+
+
+  def record(self, workflow: str, context: AssembledContext) -> None:
+    with self._lock:
+      stats = self._stats.setdefault(workflow, {
+        "calls": 0, "condensed_calls": 0, "baseline_tokens": 0,
+        "assembled_tokens": 0, "tokens_saved": 0,
+      })
+      stats["calls"] += 1
+      stats["condensed_calls"] += 1 if context.condensed else 0
+      stats["baseline_tokens"] += context.baseline_tokens
+      stats["assembled_tokens"] += context.assembled_tokens
+      stats["tokens_saved"] += context.tokens_saved
+
+
+  def stats(self) -> Dict[str, Dict[str, int]]:
+    with self._lock:
+      return {workflow: dict(stats) for workflow, stats in self._stats.items()}
+
+
+def draft_token_budget() -> int:
+  return int(os.environ.get("CONTEXT_DRAFT_TOKEN_BUDGET",
+                            DEFAULT_DRAFT_TOKEN_BUDGET))
+
+
+def minify_json(data: Any) -> str:
+  return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def mentioned_names(instruction: str,
+    aliases: Dict[str, Iterable[str]]) -> Set[str]:
+  """
+  找出用户要求中提到的条目
+  :param instruction: 用户的自然语言要求
+  :param aliases: 条目名到其各种称呼（名称、标题等）的映射
+  :return: 被提到的条目名
+  """
+  lowered = instruction.lower()
+  return {name for name, names in aliases.items()
+          if any(alias and alias.lower() in lowered for alias in names)}
+
+
+def may_affect_unnamed_items(instruction: str) -> bool:
+  """
+  判断要求是否可能删除、替换或统一修改没有点名的条目；此时模型必须看到完整草稿，
+  否则精简条目在还原时会丢掉模型对它们的修改，或补回用户要删除的条目
+  """
+  return any(keyword in instruction for keyword in UNNAMED_ITEM_KEYWORDS) \
+      or UNNAMED_ITEM_PATTERN.search(instruction) is not None
+
+
+def changed_names(before: List[Dict[str, Any]], after: List[Dict[str, Any]],
+    key: str) -> List[str]:
+  """
+  按 key 对齐修改前后的条目，返回新增、删除或内容有变化的条目名
+  """
+  before_items = {item.get(key): item for item in before}
+  after_items = {item.get(key): item for item in after}
+  changed = [name for name, item in after_items.items()
+             if before_items.get(name) != item]
+  changed += [name for name in before_items if name not in after_items]
+  return changed
+
+
+def load_history_text(session_id: str, workflow: str,
+    budget_tokens: int = DEFAULT_HISTORY_TOKEN_BUDGET) -> str:
+  """
+  读取该会话中某个工作流最近的修改记录，从最新的记录开始保留，超出预算的旧记录被丢弃
+  :param session_id: 会话 id
+  :param workflow: 工作流名，user_stories 或 data_model
+  :param budget_tokens: 历史记录可占用的 token 上限
+  :return: 历史记录文本
+  """
+  records = get_history_manager(session_id).load_history_record(
+      limit=HISTORY_RECORD_LIMIT * 4) or []
+  records = [record for record in records
+             if record.get("message", {}).get("workflow") == workflow]
+
+  lines: List[str] = []
+  used = 0
+  for record in reversed(records[-HISTORY_RECORD_LIMIT:]):
+    message = record["message"]
+    changed = "、".join(message.get("changed", [])) or "无"
+    line = (f"- {record.get('time_stamp', '')[:19]} "
+            f"要求：{message.get('instruction', '')}；变更：{changed}")
+    cost = estimate_tokens(line)
+    if used + cost > budget_tokens:
+      break
+    lines.insert(0, line)
+    used += cost
+  return "\n".join(lines) if lines else NO_HISTORY_TEXT
+
+
+async def record_modification(
+    session_id: str,
+    workflow: str,
+    instruction: str,
+    changed: List[str],
+    context: AssembledContext
+) -> None:
+  """
+  记录一次修改的摘要，供后续修改作为对话历史使用，同时统计节省的 token
+  """
+  context_savings.record(workflow, context)
+  logger.info("会话 %s 的 %s 修改上下文约 %s tokens，较完整草稿节省约 "
+              "%s tokens，精简条目 %s 个", session_id, workflow,
+              context.assembled_tokens, context.tokens_saved,
+              len(context.condensed))
+  await get_history_manager(session_id).save_history_record({
+    "workflow": workflow,
+    "instruction": instruction,
+    "changed": changed,
+    "prompt_tokens": context.assembled_tokens,
+    "tokens_saved": context.tokens_saved,
+  })
+
+
+# 全局实例
+context_savings = ContextSavingsCounter()
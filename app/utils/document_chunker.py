@@ -0,0 +1,109 @@
+import os
+import re
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+from app.utils.token_estimator import estimate_tokens
+
+T = TypeVar("T")
+
+DEFAULT_CHUNK_TOKENS = 6000
+DEFAULT_CHUNK_CONCURRENCY = 4
+
+# markdown 标题、“第一章 / 第2节”、“1. / 1.2 / 一、” 这类编号开头的行视为章节开头
+HEADING_PATTERN = re.compile(
+    r"^\s*(#{1,6}\s+\S"
+    r"|第[0-9一二三四五六七八九十百]+[章节部分篇条]"
+    r"|[0-9]+(\.[0-9]+)*[.、．]?\s+\S"
+    r"|[一二三四五六七八九十]+[、．.]\s*\S)"
+)
+SENTENCE_END_PATTERN = re.compile(r"(?<=[。！？；.!?;])")
+
+
+def chunk_token_budget() -> int:
+  """
+  单个分块的 token 上限，超过该值的需求文档会被分块并发生成
+  """
+  return int(os.environ.get("GENERATION_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS))
+
+
+def chunk_max_concurrency() -> int:
+  return int(os.environ.get("GENERATION_CHUNK_CONCURRENCY",
+                            DEFAULT_CHUNK_CONCURRENCY))
+
+
+def split_sections(text: str, max_tokens: int) -> List[str]:
+  """
+  按章节标题切分文档，再把相邻的小章节合并到不超过 max_tokens 的分块中；
+  单个章节过长时依次按段落、句子切分
+  :param text: 原始文档
+  :param max_tokens: 每个分块的 token 上限
+  :return: 分块列表，文档不超过上限时只有一个分块
+  """
+  text = text.strip()
+  if not text:
+    return []
+  if estimate_tokens(text) <= max_tokens:
+    return [text]
+
+  pieces: List[str] = []
+  for section in _split_by_headings(text):
+    pieces.extend(_split_oversized(section, max_tokens))
+  return pack_items(pieces, estimate_tokens, max_tokens, separator="\n\n")
+
+
+def pack_items(
+    items: Sequence[T],
+    cost: Callable[[T], int],
+    max_tokens: int,
+    separator: Optional[str] = None
+) -> List:
+  """
+  按顺序把条目装入不超过 max_tokens 的分组
+  :param items: 待分组的条目
+  :param cost: 计算单个条目 token 数的函数
+  :param max_tokens: 每组的 token 上限，单个条目超过上限时独占一组
+  :param separator: 不为空时把每组条目用它拼接成字符串
+  :return: 分组列表
+  """
+  groups: List[List[T]] = []
+  used = 0
+  for item in items:
+    item_cost = cost(item)
+    if groups and used + item_cost <= max_tokens:
+      groups[-1].append(item)
+      used += item_cost
+    else:
+      groups.append([item])
+      used = item_cost
+  if separator is None:
+    return groups
+  return [separator.join(group) for group in groups]
+
+
+def _split_by_headings(text: str) -> List[str]:
+  sections: List[List[str]] = [[]]
+  for line in text.splitlines():
+    if HEADING_PATTERN.match(line) and any(part.strip() for part in sections[-1]):
+      sections.append([])
+    sections[-1].append(line)
+  return ["\n".join(lines).strip() for lines in sections if "".join(lines).strip()]
+
+
+def _split_oversized(section: str, max_tokens: int) -> List[str]:
+  if estimate_tokens(section) <= max_tokens:
+    return [section]
+  paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", section)
+                if paragraph.strip()]
+  if len(paragraphs) > 1:
+    pieces = []
+    for paragraph in paragraphs:
+      pieces.extend(_split_oversized(paragraph, max_tokens))
+    return pack_items(pieces, estimate_tokens, max_tokens, separator="\n\n")
+
+  sentences = [sentence for sentence in SENTENCE_END_PATTERN.split(section)
+               if sentence.strip()]
+  if len(sentences) > 1:
+    return pack_items(sentences, estimate_tokens, max_tokens, separator="")
+  # 没有可用的断句位置时按字符硬切
+  step = max(1, len(section) * max_tokens // estimate_tokens(section))
+  return [section[start:start + step] for start in range(0, len(section), step)]
@@ -0,0 +1,17 @@
+from dotenv import load_dotenv
+
+_loaded = False
+
+
+def load_env() -> None:
+  """
+  加载 .env，进程内只执行一次；已设置的环境变量优先，不会被覆盖
+  """
+  global _loaded
+  if not _loaded:
+    load_dotenv()
+    _loaded = True
+
+
+# 各模块的全局实例在导入时读取环境变量，导入本模块即加载，入口处应最先导入
+load_env()
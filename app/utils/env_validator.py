@@ -2,10 +2,15 @@ import os
 
 from fastapi import HTTPException
 
-from app.logger.logger import logger
+from app.LLMs.model_registry import FAKE_LLM_BACKEND, llm_backend
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 def env_varies_validator():
+  if llm_backend() == FAKE_LLM_BACKEND:
+    return
   if not os.getenv("OPENAI_API_KEY"):
     logger.error("环境变量中未设置 OPENAI_API_KEY")
     raise HTTPException(status_code=500,
@@ -0,0 +1,68 @@
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict
+
+from app.logger.context import current_request_id
+from app.logger.logger import get_logger
+
+REQUEST_ID_HEADER = b"x-request-id"
+REQUEST_ID_PATTERN = re.compile(rb"^[A-Za-z0-9_.-]{1,64}$")
+
+access_logger = get_logger("app.access")
+
+
+class RequestLoggingMiddleware:
+  """
+  纯 ASGI 中间件：沿用请求头中的 X-Request-Id 或生成新的请求 id，请求内的日志都带上它，
+  并在响应头中返回；响应体发送完毕后记录一条访问日志，耗时等字段可在 JSON 日志中直接检索
+  """
+
+  def __init__(self, app: Callable):
+    self.app = app
+
+
+  async def __call__(self, scope: Dict[str, Any], receive: Callable,
+      send: Callable) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    request_id = dict(scope["headers"]).get(REQUEST_ID_HEADER, b"")
+    if not REQUEST_ID_PATTERN.match(request_id):
+      request_id = uuid.uuid4().hex.encode("latin-1")
+    started = time.perf_counter()
+    status = {"code": 500}
+    logged = False
+
+    def log_access() -> None:
+      nonlocal logged
+      if logged:
+        return
+      logged = True
+      duration_ms = round((time.perf_counter() - started) * 1000, 3)
+      route = getattr(scope.get("route"), "path", None)
+      access_logger.info("%s %s %s %.1fms", scope["method"], scope["path"],
+                         status["code"], duration_ms, extra={
+                           "http_method": scope["method"],
+                           "http_route": route,
+                           "http_status": status["code"],
+                           "duration_ms": duration_ms,
+                         })
+
+    async def send_with_request_id(message: Dict[str, Any]) -> None:
+      if message["type"] == "http.response.start":
+        status["code"] = message["status"]
+        message["headers"] = list(message.get("headers", [])) + [
+          (REQUEST_ID_HEADER, request_id)]
+      await send(message)
+      if message["type"] == "http.response.body" \
+          and not message.get("more_body", False):
+        log_access()
+
+    token = current_request_id.set(request_id.decode("latin-1"))
+    try:
+      await self.app(scope, receive, send_with_request_id)
+    finally:
+      log_access()
+      current_request_id.reset(token)
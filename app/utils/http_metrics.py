@@ -0,0 +1,62 @@
+import time
+from typing import Any, Callable, Dict
+
+from app.utils.metrics import metrics
+
+UNMATCHED_ROUTE = "unmatched"
+
+http_requests = metrics.counter(
+    "http_requests", "按路由与状态码统计的请求数", ("method", "route", "status"))
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "请求从进入到响应体发送完毕的耗时",
+    ("method", "route"))
+http_requests_in_flight = metrics.gauge(
+    "http_requests_in_flight", "正在处理的请求数")
+
+
+class HttpMetricsMiddleware:
+  """
+  纯 ASGI 中间件：按路由模板（而不是实际路径）记录请求数与耗时，避免标签基数随会话或任务 id 增长；
+  流式响应记录到最后一块响应体发送完毕为止
+  """
+
+  def __init__(self, app: Callable):
+    self.app = app
+
+
+  async def __call__(self, scope: Dict[str, Any], receive: Callable,
+      send: Callable) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    started = time.perf_counter()
+    status = {"code": 500}
+    observed = False
+
+    def observe() -> None:
+      nonlocal observed
+      if observed:
+        return
+      observed = True
+      route = scope.get("route")
+      route_path = getattr(route, "path", UNMATCHED_ROUTE)
+      http_requests.inc(method=scope["method"], route=route_path,
+                        status=str(status["code"]))
+      http_request_seconds.observe(time.perf_counter() - started,
+                                   method=scope["method"], route=route_path)
+
+    async def send_with_metrics(message: Dict[str, Any]) -> None:
+      if message["type"] == "http.response.start":
+        status["code"] = message["status"]
+      await send(message)
+      if message["type"] == "http.response.body" \
+          and not message.get("more_body", False):
+        observe()
+
+    http_requests_in_flight.inc()
+    try:
+      await self.app(scope, receive, send_with_metrics)
+    finally:
+      http_requests_in_flight.dec()
+      observe()
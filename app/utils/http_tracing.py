@@ -0,0 +1,65 @@
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.tracing import current_span, tracer
+
+SESSION_HEADER = b"x-session-id"
+TRACEPARENT_HEADER = b"traceparent"
+
+
+class TracingMiddleware:
+  """
+  纯 ASGI 中间件：为每个请求创建根 span 并设为当前 span，链调用与存储读写的 span 都挂在它下面；
+  沿用请求头中的 W3C traceparent，并在响应头中返回 traceparent 与 X-Trace-Id 便于对照日志。
+  未开启追踪时直接透传
+  """
+
+  def __init__(self, app: Callable):
+    self.app = app
+
+
+  async def __call__(self, scope: Dict[str, Any], receive: Callable,
+      send: Callable) -> None:
+    if scope["type"] != "http" or not tracer.enabled:
+      await self.app(scope, receive, send)
+      return
+
+    headers = dict(scope["headers"])
+    span = tracer.start_root(
+        f"{scope['method']} {scope['path']}",
+        traceparent=_header(headers, TRACEPARENT_HEADER),
+        attributes={
+          "http.request.method": scope["method"],
+          "url.path": scope["path"],
+          "session.id": _header(headers, SESSION_HEADER),
+        })
+
+    async def send_with_trace(message: Dict[str, Any]) -> None:
+      if message["type"] == "http.response.start":
+        span.set_attribute("http.response.status_code", message["status"])
+        if message["status"] >= 500:
+          span.status = "error"
+        message["headers"] = list(message.get("headers", [])) + [
+          (TRACEPARENT_HEADER, span.traceparent.encode("latin-1")),
+          (b"x-trace-id", span.trace_id.encode("latin-1")),
+        ]
+      await send(message)
+
+    token = current_span.set(span)
+    try:
+      await self.app(scope, receive, send_with_trace)
+    except BaseException as e:
+      span.record_error(e)
+      raise
+    finally:
+      current_span.reset(token)
+      # 路由匹配后才知道路由模板，用它命名 span，便于按接口聚合
+      route = getattr(scope.get("route"), "path", None)
+      if route is not None:
+        span.name = f"{scope['method']} {route}"
+        span.set_attribute("http.route", route)
+      tracer.finish(span)
+
+
+def _header(headers: Dict[bytes, bytes], name: bytes) -> Optional[str]:
+  value = headers.get(name)
+  return value.decode("latin-1") if value is not None else None
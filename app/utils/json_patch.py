@@ -0,0 +1,115 @@
+import copy
+import json
+from difflib import SequenceMatcher
+from typing import Any, Dict, List
+
+
+def make_json_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+  """
+  计算把 old 变为 new 的结构化补丁（RFC 6902 的 add / remove / replace 子集）
+  列表按元素内容对齐，中间插入或删除一个元素只会产生一条操作
+  :param old: 旧的 json 值
+  :param new: 新的 json 值
+  :param path: 当前位置的 JSON Pointer
+  :return: 补丁操作列表
+  """
+  if old == new:
+    return []
+
+  if isinstance(old, dict) and isinstance(new, dict):
+    ops = []
+    for key in old:
+      if key not in new:
+        ops.append({"op": "remove", "path": _join(path, key)})
+    for key, value in new.items():
+      if key not in old:
+        ops.append({"op": "add", "path": _join(path, key), "value": value})
+      else:
+        ops.extend(make_json_patch(old[key], value, _join(path, key)))
+    return ops
+
+  if isinstance(old, list) and isinstance(new, list):
+    return _make_list_patch(old, new, path)
+
+  return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_json_patch(document: Any, ops: List[Dict[str, Any]]) -> Any:
+  """
+  将补丁应用到 json 值上，不修改传入的对象
+  :param document: 原始 json 值
+  :param ops: make_json_patch 生成的补丁
+  :return: 应用补丁后的新 json 值
+  """
+  result = copy.deepcopy(document)
+  for op in ops:
+    tokens = _split(op["path"])
+    if not tokens:
+      if op["op"] == "remove":
+        raise ValueError("不能删除文档根节点")
+      result = copy.deepcopy(op["value"])
+      continue
+
+    parent = result
+    for token in tokens[:-1]:
+      parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+    last = tokens[-1]
+
+    if isinstance(parent, list):
+      index = len(parent) if last == "-" else int(last)
+      if op["op"] == "add":
+        parent.insert(index, copy.deepcopy(op["value"]))
+      elif op["op"] == "remove":
+        del parent[index]
+      elif op["op"] == "replace":
+        parent[index] = copy.deepcopy(op["value"])
+      else:
+        raise ValueError(f"不支持的补丁操作：{op['op']}")
+    else:
+      if op["op"] in ("add", "replace"):
+        parent[last] = copy.deepcopy(op["value"])
+      elif op["op"] == "remove":
+        del parent[last]
+      else:
+        raise ValueError(f"不支持的补丁操作：{op['op']}")
+  return result
+
+
+def _make_list_patch(old: List[Any], new: List[Any],
+    path: str) -> List[Dict[str, Any]]:
+  old_keys = [_element_key(item) for item in old]
+  new_keys = [_element_key(item) for item in new]
+  matcher = SequenceMatcher(a=old_keys, b=new_keys, autojunk=False)
+
+  # 按从左到右的顺序处理，处理到某一段时列表前 j1 个元素已与 new 一致，
+  # 旧元素 old[i1:i2] 正位于 j1 开始的位置
+  ops = []
+  for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    if tag == "equal":
+      continue
+    paired = min(i2 - i1, j2 - j1)
+    for offset in range(paired):
+      ops.extend(make_json_patch(old[i1 + offset], new[j1 + offset],
+                                 _join(path, j1 + offset)))
+    for _ in range((i2 - i1) - paired):
+      ops.append({"op": "remove", "path": _join(path, j1 + paired)})
+    for offset in range(paired, j2 - j1):
+      ops.append({"op": "add", "path": _join(path, j1 + offset),
+                  "value": new[j1 + offset]})
+  return ops
+
+
+def _element_key(item: Any) -> str:
+  return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def _join(path: str, token: Any) -> str:
+  escaped = str(token).replace("~", "~0").replace("/", "~1")
+  return f"{path}/{escaped}"
+
+
+def _split(path: str) -> List[str]:
+  if path == "":
+    return []
+  return [token.replace("~1", "/").replace("~0", "~")
+          for token in path.split("/")[1:]]
@@ -0,0 +1,268 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+METRIC_PREFIX = "llmdc_"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 覆盖从微秒级的本地处理到分钟级的 llm 调用
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+  """
+  按标签值分别记录的指标，标签值按 labelnames 的顺序以关键字参数传入
+  """
+  kind = "untyped"
+
+  def __init__(self, name: str, documentation: str,
+      labelnames: Sequence[str] = ()):
+    self.name = METRIC_PREFIX + name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._lock = threading.Lock()
+
+
+  def _key(self, labels: Dict[str, str]) -> LabelValues:
+    return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+
+  def samples(self) -> List[Tuple[str, LabelValues, float]]:
+    raise NotImplementedError
+
+
+  def sample_labelnames(self, sample_name: str) -> Tuple[str, ...]:
+    return self.labelnames
+
+
+class Counter(Metric):
+  kind = "counter"
+
+  def __init__(self, name: str, documentation: str,
+      labelnames: Sequence[str] = ()):
+    super().__init__(name, documentation, labelnames)
+    self._values: Dict[LabelValues, float] = {}
+
+
+  def inc(self, amount: float = 1.0, **labels: str) -> None:
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0.0) + amount
+
+
+  def samples(self) -> List[Tuple[str, LabelValues, float]]:
+    with self._lock:
+      return [(self.name + "_total", key, value)
+              for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+  kind = "gauge"
+
+  def __init__(self, name: str, documentation: str,
+      labelnames: Sequence[str] = ()):
+    super().__init__(name, documentation, labelnames)
+    self._values: Dict[LabelValues, float] = {}
+
+
+  def set(self, value: float, **labels: str) -> None:
+    with self._lock:
+      self._values[self._key(labels)] = value
+
+
+  def inc(self, amount: float = 1.0, **labels: str) -> None:
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0.0) + amount
+
+
+  def dec(self, amount: float = 1.0, **labels: str) -> None:
+    self.inc(-amount, **labels)
+
+
+  def samples(self) -> List[Tuple[str, LabelValues, float]]:
+    with self._lock:
+      return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class CallbackGauge(Metric):
+  """
+  抓取时才调用 collect 读取当前值，用于各组件已有的 stats()，平时没有任何开销
+  """
+  kind = "gauge"
+
+  def __init__(self, name: str, documentation: str,
+      labelnames: Sequence[str],
+      collect: Callable[[], Dict[LabelValues, float]]):
+    super().__init__(name, documentation, labelnames)
+    self.collect = collect
+
+
+  def samples(self) -> List[Tuple[str, LabelValues, float]]:
+    return [(self.name, tuple(str(value) for value in key), float(value))
+            for key, value in self.collect().items()]
+
+
+class Histogram(Metric):
+  kind = "histogram"
+
+  def __init__(self, name: str, documentation: str,
+      labelnames: Sequence[str] = (),
+      buckets: Sequence[float] = DEFAULT_BUCKETS):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+    # 每组标签值：各桶的计数（最后一个为 +Inf）、总和
+    self._counts: Dict[LabelValues, List[int]] = {}
+    self._sums: Dict[LabelValues, float] = {}
+
+
+  def observe(self, value: float, **labels: str) -> None:
+    key = self._key(labels)
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      counts = self._counts.get(key)
+      if counts is None:
+        counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+        self._sums[key] = 0.0
+      counts[index] += 1
+      self._sums[key] += value
+
+
+  def samples(self) -> List[Tuple[str, LabelValues, float]]:
+    samples = []
+    with self._lock:
+      for key, counts in self._counts.items():
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+          cumulative += count
+          samples.append((self.name + "_bucket", key + (_format_bound(bound),),
+                          float(cumulative)))
+        samples.append((self.name + "_sum", key, self._sums[key]))
+        samples.append((self.name + "_count", key, float(cumulative)))
+    return samples
+
+
+  def sample_labelnames(self, sample_name: str) -> Tuple[str, ...]:
+    if sample_name.endswith("_bucket"):
+      return self.labelnames + ("le",)
+    return self.labelnames
+
+
+class MetricsRegistry:
+  """
+  进程内的指标注册表，按 Prometheus 文本格式（0.0.4）输出
+  """
+
+  def __init__(self):
+    self._metrics: Dict[str, Metric] = {}
+    self._lock = threading.Lock()
+
+
+  def counter(self, name: str, documentation: str,
+      labelnames: Sequence[str] = ()) -> Counter:
+    return self._register(Counter(name, documentation, labelnames))
+
+
+  def gauge(self, name: str, documentation: str,
+      labelnames: Sequence[str] = ()) -> Gauge:
+    return self._register(Gauge(name, documentation, labelnames))
+
+
+  def histogram(self, name: str, documentation: str,
+      labelnames: Sequence[str] = (),
+      buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return self._register(Histogram(name, documentation, labelnames, buckets))
+
+
+  def callback_gauge(self, name: str, documentation: str,
+      labelnames: Sequence[str],
+      collect: Callable[[], Dict[LabelValues, float]]) -> CallbackGauge:
+    return self._register(CallbackGauge(name, documentation, labelnames,
+                                        collect))
+
+
+  def render(self) -> str:
+    with self._lock:
+      metrics = list(self._metrics.values())
+    lines = []
+    for metric in metrics:
+      lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+      lines.append(f"# TYPE {metric.name} {metric.kind}")
+      for sample_name, label_values, value in metric.samples():
+        labelnames = metric.sample_labelnames(sample_name)
+        lines.append(f"{sample_name}{_format_labels(labelnames, label_values)} "
+                     f"{_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+  def _register(self, metric: Metric):
+    with self._lock:
+      if metric.name in self._metrics:
+        raise ValueError(f"指标 {metric.name} 已注册")
+      self._metrics[metric.name] = metric
+    return metric
+
+
+def _format_labels(labelnames: Sequence[str], values: LabelValues) -> str:
+  if not labelnames:
+    return ""
+  pairs = ",".join(f'{name}="{_escape_label(value)}"'
+                   for name, value in zip(labelnames, values))
+  return "{" + pairs + "}"
+
+
+def _escape_label(value: str) -> str:
+  return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(text: str) -> str:
+  return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_bound(bound: float) -> str:
+  return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+  if math.isinf(value):
+    return "+Inf" if value > 0 else "-Inf"
+  return repr(float(value))
+
+
+# 全局实例
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "stage_duration_seconds",
+    "请求处理各阶段的耗时：prompt_render、llm、parse、validate、repair、"
+    "storage_read、storage_write、serialise 等",
+    ("component", "stage"))
+
+
+@contextmanager
+def stage_timer(component: str, stage: str) -> Iterator[None]:
+  """
+  记录一个处理阶段的耗时，异常退出时同样记录
+  :param component: 所属的链、工作流或文档名
+  :param stage: 阶段名
+  """
+  started = time.perf_counter()
+  try:
+    yield
+  finally:
+    stage_seconds.observe(time.perf_counter() - started,
+                          component=component, stage=stage)
+
+
+def observe_stage(component: str, stage: str, started: float,
+    ended: Optional[float] = None) -> None:
+  """
+  按 time.perf_counter() 的起止时间记录阶段耗时，用于无法包在 with 语句中的阶段
+  """
+  ended = time.perf_counter() if ended is None else ended
+  stage_seconds.observe(ended - started, component=component, stage=stage)
@@ -1,43 +1,114 @@
 import json
-from pathlib import Path
+from dataclasses import dataclass
+from typing import Type, TypeVar
 
-import aiofiles
+from pydantic import BaseModel
 
-from app.logger.logger import logger
+from app.logger.logger import get_logger
+from app.utils.metrics import stage_timer
+from app.utils.tracing import tracer
+from app.storage.draft_versions import draft_versioning
+from app.storage.store_registry import outcome_store
 
+logger = get_logger(__name__)
 
-def outcome_querier(outcome_path: Path) -> str:
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass
+class DocumentView:
+  """
+  文档校验后的对象、序列化好的响应体与 ETag，文档不变时重复使用
+  """
+  model: BaseModel
+  body: bytes
+  etag: str
+
+
+async def outcome_querier(session_id: str, document: str) -> str:
   try:
-    with open(outcome_path, "r", encoding='utf-8') as f:
-      logger.info(f"开始获取路径为 {outcome_path} 的草稿")
-      content = f.read()
-      outcome = json.loads(content)
-      formatted_outcome = json.dumps(outcome, indent=2, ensure_ascii=False)
-      logger.info(f"成功获取路径为 {outcome_path} 的草稿")
-      return formatted_outcome
+    logger.info("开始获取会话 %s 的文档 %s", session_id, document)
+    with tracer.span("outcome.read", attributes=_span_attributes(
+        session_id, document)) as span, stage_timer(document, "storage_read"):
+      content = await outcome_store.read(session_id, document)
+      if span is not None:
+        span.set_attribute("outcome.found", content is not None)
+    if content is None:
+      raise FileNotFoundError(f"会话 {session_id} 中不存在文档 {document}")
+    logger.info("成功获取会话 %s 的文档 %s", session_id, document)
+    # 文档由 outcome_writer 序列化写入，直接返回原文，由调用方解析一次即可
+    return content
   except FileNotFoundError as e:
-    logger.error(f"{e}")
-    raise e
-  except json.decoder.JSONDecodeError as e:
-    logger.error(f"{e}")
+    logger.error("%s", e)
     raise e
   except Exception as e:
-    logger.error(f"{e}")
+    logger.error("%s", e)
     raise e
 
 
-async def outcome_writer(outcome_path: Path, content: dict) -> None:
+async def outcome_view(
+    session_id: str,
+    document: str,
+    response_model: Type[M]
+) -> DocumentView:
+  """
+  读取文档并按 response_model 校验，结果缓存在文档的缓存条目上，文档被写入后自动失效
+  :raises FileNotFoundError: 文档不存在
+  """
+  with tracer.span("outcome.view", attributes=_span_attributes(
+      session_id, document)) as span:
+    with stage_timer(document, "storage_read"):
+      entry = await outcome_store.read_entry(session_id, document)
+    if entry.content is None:
+      raise FileNotFoundError(f"会话 {session_id} 中不存在文档 {document}")
+    view = entry.derived.get(response_model)
+    if span is not None:
+      span.set_attribute("outcome.view_cached", view is not None)
+    if view is None:
+      with stage_timer(document, "deserialise"):
+        model = response_model.model_validate_json(entry.content)
+      with stage_timer(document, "serialise"):
+        body = model.model_dump_json().encode("utf-8")
+      view = DocumentView(model=model, body=body, etag=entry.etag)
+      entry.derived[response_model] = view
+    return view
+
+
+async def outcome_writer(
+    session_id: str,
+    document: str,
+    content: dict,
+    versioned: bool = False
+) -> None:
   try:
-    async with aiofiles.open(outcome_path, "w", encoding='utf-8') as f:
-      logger.info(f"开始向路径为 {outcome_path} 的文件写入内容")
-      await f.write(json.dumps(content, indent=2, ensure_ascii=False))
-      logger.info(f"成功向路径为 {outcome_path} 的文件写入内容")
-  except FileNotFoundError as e:
-    logger.error(f"{e}")
-    raise e
-  except json.decoder.JSONDecodeError as e:
-    logger.error(f"{e}")
+    logger.info("开始向会话 %s 的文档 %s 写入内容", session_id, document)
+    with stage_timer(document, "serialise"):
+      serialized = json.dumps(content, indent=2, ensure_ascii=False)
+    with tracer.span("outcome.write", attributes={
+      **_span_attributes(session_id, document),
+      "outcome.versioned": versioned,
+      "outcome.bytes": len(serialized),
+    }):
+      async with outcome_store.lock(session_id, document):
+        previous = None
+        if versioned:
+          with stage_timer(document, "storage_read"):
+            previous_content = await outcome_store.read(session_id, document)
+          previous = json.loads(previous_content) if previous_content else None
+        with stage_timer(document, "storage_write"):
+          await outcome_store.write(session_id, document, serialized)
+        if versioned:
+          with stage_timer(document, "version_record"):
+            await draft_versioning.record(session_id, document, previous,
+                                          json.loads(serialized))
+    logger.info("成功向会话 %s 的文档 %s 写入内容", session_id, document)
+  except TypeError as e:
+    logger.error("%s", e)
     raise e
   except Exception as e:
-    logger.error(f"{e}")
-    raise e
\ No newline at end of file
+    logger.error("%s", e)
+    raise e
+
+
+def _span_attributes(session_id: str, document: str) -> dict:
+  return {"session.id": session_id, "outcome.document": document}
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple, Type, Union
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import BaseModel, ValidationError
+
+from app.LLMs.chain_runner import run_chain
+from app.logger.logger import get_logger
+from app.utils.metrics import stage_timer
+from app.utils.schema_verifier import SchemaViolation, collect_schema_violations, \
+  json_path
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_REPAIR_ROUNDS = 2
+
+# 片段的位置：(列表字段名, 下标)，整个文档用 ("", -1) 表示
+Fragment = Tuple[str, int]
+WHOLE_DOCUMENT: Fragment = ("", -1)
+
+
+class StructuredOutputRepairer:
+  """
+  校验并修复 llm 的结构化输出：
+  先做确定性的本地修正，仍不合法时只把出错的片段（如某个实体）连同错误发给 llm 修复，
+  而不是重新生成整个文档
+  """
+
+  def __init__(
+      self,
+      name: str,
+      response_model: Type[BaseModel],
+      schema: dict,
+      local_fixer: Callable[[Dict[str, Any]], Dict[str, Any]],
+      repair_chain: Callable[[], Runnable],
+      fragment_keys: Tuple[str, ...],
+      max_rounds: int = DEFAULT_MAX_REPAIR_ROUNDS,
+      workflow: str = ""
+  ):
+    """
+    :param name: 用于日志与统计的名称
+    :param response_model: 最终输出的 pydantic 模型
+    :param schema: 校验用的 json schema
+    :param local_fixer: 确定性的本地修正函数
+    :param repair_chain: 返回修复链的无参函数（如 LazyChain），链输入 fragment / errors /
+      fragment_schema，输出修正后的片段；需要修复时才构建
+    :param fragment_keys: 可以按元素单独修复的列表字段
+    :param max_rounds: llm 修复的最大轮数
+    :param workflow: 指标中记录修复耗时所用的工作流名
+    """
+    self.name = name
+    self.response_model = response_model
+    self.schema = schema
+    self.local_fixer = local_fixer
+    self.repair_chain = repair_chain
+    self.fragment_keys = fragment_keys
+    self.max_rounds = max_rounds
+    self.workflow = workflow or name
+
+    self._lock = threading.Lock()
+    self._stats = {"outputs": 0, "valid": 0, "local_repaired": 0,
+                   "llm_repaired": 0, "failed": 0, "repaired_fragments": 0}
+
+
+  async def repair(self, llm_output: Any) -> BaseModel:
+    """
+    :param llm_output: include_raw 的结构化输出字典、pydantic 对象或普通字典
+    :return: 校验通过的 response_model 对象
+    :raises ValueError: 修复后仍不合法
+    """
+    with stage_timer(self.workflow, "repair"):
+      return await self._repair(llm_output)
+
+
+  async def _repair(self, llm_output: Any) -> BaseModel:
+    data = extract_output_data(llm_output)
+    self._count("outputs")
+
+    fixed = self.local_fixer(data)
+    violations = self._violations(fixed)
+    if not violations:
+      self._count("valid" if fixed == data else "local_repaired")
+      return self.response_model.model_validate(fixed)
+    data = fixed
+
+    for round_index in range(1, self.max_rounds + 1):
+      fragments = self._group_by_fragment(violations)
+      logger.info("%s 第 %s 轮修复：%s 处错误，涉及 %s 个片段", self.name,
+                  round_index, len(violations), len(fragments))
+      data = await self._repair_fragments(data, fragments)
+      data = self.local_fixer(data)
+      violations = self._violations(data)
+      if not violations:
+        self._count("llm_repaired")
+        return self.response_model.model_validate(data)
+
+    self._count("failed")
+    detail = "; ".join(f"{v.json_path}: {v.message}" for v in violations[:20])
+    raise ValueError(f"{self.name} 结构修复失败: {detail}")
+
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return dict(self._stats)
+
+
+  def _violations(self, data: Dict[str, Any]) -> List[SchemaViolation]:
+    violations = collect_schema_violations(data, self.schema)
+    if violations:
+      return violations
+    try:
+      self.response_model.model_validate(data)
+      return []
+    except ValidationError as e:
+      return [SchemaViolation(tuple(error["loc"]), error["msg"])
+              for error in e.errors()]
+
+
+  def _group_by_fragment(
+      self,
+      violations: List[SchemaViolation]
+  ) -> Dict[Fragment, List[SchemaViolation]]:
+    fragments: Dict[Fragment, List[SchemaViolation]] = defaultdict(list)
+    for violation in violations:
+      path = violation.path
+      if len(path) >= 2 and path[0] in self.fragment_keys \
+          and isinstance(path[1], int):
+        fragments[(path[0], path[1])].append(
+            SchemaViolation(path[2:], violation.message))
+      else:
+        fragments[WHOLE_DOCUMENT].append(violation)
+    # 整个文档出错时逐个修复片段没有意义
+    if WHOLE_DOCUMENT in fragments:
+      return {WHOLE_DOCUMENT: list(violations)}
+    return fragments
+
+
+  async def _repair_fragments(
+      self,
+      data: Dict[str, Any],
+      fragments: Dict[Fragment, List[SchemaViolation]]
+  ) -> Dict[str, Any]:
+    locations = list(fragments)
+    chain_inputs = []
+    for key, index in locations:
+      fragment = data if key == "" else data[key][index]
+      fragment_schema = self.schema if key == "" else \
+        self.schema["properties"][key]["items"]
+      chain_inputs.append({
+        "fragment": _dumps(fragment),
+        "errors": "\n".join(f"- {v.json_path}: {v.message}"
+                            for v in fragments[(key, index)]),
+        "fragment_schema": _dumps(fragment_schema),
+      })
+
+    repair_chain = self.repair_chain()
+    outcomes = await asyncio.gather(
+        *(run_chain(repair_chain, chain_input) for chain_input in chain_inputs),
+        return_exceptions=True)
+    repaired = json.loads(json.dumps(data))
+    for (key, index), outcome in zip(locations, outcomes):
+      if isinstance(outcome, Exception) or not isinstance(outcome, dict):
+        logger.error("%s 片段 %s 修复失败：%s", self.name,
+                     json_path((key, index)), outcome)
+        continue
+      if key == "":
+        repaired = outcome
+      else:
+        repaired[key][index] = outcome
+      self._count("repaired_fragments")
+    return repaired
+
+
+  def _count(self, name: str) -> None:
+    with self._lock:
+      self._stats[name] += 1
+
+
+def extract_output_data(llm_output: Any) -> Dict[str, Any]:
+  """
+  从结构化输出中取出 json 数据，解析失败时退回到原始消息
+  :param llm_output: include_raw=True 的输出字典、pydantic 对象或普通字典
+  """
+  if isinstance(llm_output, BaseModel):
+    return llm_output.model_dump(mode="json")
+  if isinstance(llm_output, dict) and "raw" in llm_output \
+      and "parsing_error" in llm_output:
+    parsed = llm_output.get("parsed")
+    if parsed is not None:
+      return extract_output_data(parsed)
+    return _raw_message_data(llm_output["raw"])
+  if isinstance(llm_output, dict):
+    return llm_output
+  raise ValueError(f"无法识别的结构化输出类型：{type(llm_output).__name__}")
+
+
+def _raw_message_data(raw: Union[AIMessage, Any]) -> Dict[str, Any]:
+  tool_calls = getattr(raw, "tool_calls", None)
+  if tool_calls:
+    return tool_calls[0]["args"]
+  content = getattr(raw, "content", raw)
+  if isinstance(content, list):
+    content = "".join(part.get("text", "") if isinstance(part, dict) else str(part)
+                      for part in content)
+  try:
+    data = parse_json_markdown(content)
+  except Exception as e:
+    raise ValueError(f"llm 输出不是有效的 JSON：{e}")
+  if not isinstance(data, dict):
+    raise ValueError("llm 输出的 JSON 不是对象")
+  return data
+
+
+def _dumps(content: Any) -> str:
+  return json.dumps(content, ensure_ascii=False, separators=(",", ":"))
@@ -1,6 +1,91 @@
 import json
-from typing import Union, Tuple
-from jsonschema import validate, ValidationError
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from jsonschema.validators import validator_for
+
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+  import fastjsonschema
+except ImportError:
+  fastjsonschema = None
+
+# 错误信息中最多列出的错误条数
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class SchemaViolation:
+  path: Tuple[Union[str, int], ...]
+  message: str
+
+  @property
+  def json_path(self) -> str:
+    return json_path(self.path)
+
+
+class CompiledSchema:
+  """
+  编译好的 JSON Schema 验证器。
+  元模式只在编译时检查一次；安装了 fastjsonschema 时用生成的代码快速判断是否合法，
+  只有不合法时才用 jsonschema 一次性收集全部错误。
+  """
+
+  def __init__(self, schema: dict):
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    self.schema = schema
+    self.validator = validator_class(schema)
+    self.fast_check: Optional[Callable[[Any], Any]] = None
+    if fastjsonschema is not None:
+      try:
+        self.fast_check = fastjsonschema.compile(schema)
+      except Exception as e:
+        logger.error("fastjsonschema 编译失败，改用 jsonschema：%s", e)
+
+
+  def violations(self, data: Any) -> List[SchemaViolation]:
+    """
+    :param data: 待验证的数据
+    :return: 所有错误及其位置，合法时为空列表
+    """
+    if self.fast_check is not None:
+      try:
+        self.fast_check(data)
+        return []
+      except fastjsonschema.JsonSchemaException:
+        pass
+    errors = sorted(self.validator.iter_errors(data),
+                    key=lambda error: list(map(str, error.absolute_path)))
+    return [SchemaViolation(tuple(error.absolute_path), error.message)
+            for error in errors]
+
+
+class SchemaValidatorRegistry:
+  """
+  按 schema 对象缓存编译好的验证器，同一个 schema 只编译一次
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._compiled: Dict[int, CompiledSchema] = {}
+
+
+  def register(self, schema: dict) -> CompiledSchema:
+    compiled = self._compiled.get(id(schema))
+    # 缓存中保留 schema 的引用，id 不会被其他对象复用
+    if compiled is not None and compiled.schema is schema:
+      return compiled
+    with self._lock:
+      compiled = self._compiled.get(id(schema))
+      if compiled is None or compiled.schema is not schema:
+        compiled = CompiledSchema(schema)
+        self._compiled[id(schema)] = compiled
+      return compiled
 
 
 def validate_json_str(
@@ -8,7 +93,7 @@ def validate_json_str(
     valid_schema: dict
 ) -> Tuple[bool, str]:
   """
-  验证用户故事JSON是否符合指定模式
+  验证用户故事JSON是否符合指定模式，一次返回全部错误及其 JSON 路径
 
   参数:
       input_data: 要验证的数据 (JSON字符串或字典)
@@ -31,19 +116,36 @@ def validate_json_str(
     if not isinstance(valid_schema, dict):
       return False, "验证模板必须是字典类型"
 
-    validate(instance=data, schema=valid_schema)
-    return True, "JSON 符合模板结构"
+    errors = [f"{violation.json_path}: {violation.message}"
+              for violation in collect_schema_violations(data, valid_schema)]
+    if not errors:
+      return True, "JSON 符合模板结构"
 
-  except ValidationError as e:
-    error_path = ".".join(
-      map(str, e.absolute_path)) if e.absolute_path else "根对象"
-    error_msg = f"字段 '{error_path}': {e.message}"
-    return False, f"结构验证失败: {error_msg}"
+    reported = "; ".join(errors[:MAX_REPORTED_ERRORS])
+    if len(errors) > MAX_REPORTED_ERRORS:
+      reported += f"; 另有 {len(errors) - MAX_REPORTED_ERRORS} 处错误"
+    return False, f"结构验证失败（共 {len(errors)} 处）: {reported}"
 
   except Exception as e:
     return False, f"验证过程中发生意外错误: {str(e)}"
 
 
+def collect_schema_violations(data: Any,
+    valid_schema: dict) -> List[SchemaViolation]:
+  return schema_validators.register(valid_schema).violations(data)
+
+
+def json_path(path: Tuple[Union[str, int], ...]) -> str:
+  rendered = "$"
+  for token in path:
+    rendered += f"[{token}]" if isinstance(token, int) else f".{token}"
+  return rendered
+
+
+# 全局实例
+schema_validators = SchemaValidatorRegistry()
+
+
 if __name__ == "__main__":
   from app.schemas.user_story_shemas import USER_STORY_VALIDATION_SCHEMA
   from app.schemas.data_entity_schemas import DATA_ENTITY_VALIDATION_SCHEMA
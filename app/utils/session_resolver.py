@@ -0,0 +1,38 @@
+import re
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SESSION_ID = "default"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# 由中间件或任务队列设置，用于在链调用中按会话记录用量
+current_session_id: ContextVar[str] = ContextVar("current_session_id",
+                                                 default=DEFAULT_SESSION_ID)
+
+
+def get_session_id(
+    x_session_id: str = Header(default=DEFAULT_SESSION_ID)
+) -> str:
+  """
+  从请求头 X-Session-Id 获取项目/会话 id，未提供时使用 default 会话
+  """
+  if not SESSION_ID_PATTERN.match(x_session_id):
+    logger.error("非法的会话 id：%s", x_session_id)
+    raise HTTPException(status_code=400,
+                        detail="X-Session-Id 只能包含字母、数字、下划线和连字符，且不超过 64 个字符")
+  return x_session_id
+
+
+def session_id_or_default(value: Optional[str]) -> str:
+  """
+  非法或未提供的会话 id 记为 default，只用于统计，不做校验
+  """
+  if value and SESSION_ID_PATTERN.match(value):
+    return value
+  return DEFAULT_SESSION_ID
@@ -0,0 +1,70 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+def format_sse(event: str, data: Any) -> str:
+  """
+  将数据编码为一条 Server-Sent Events 消息
+  :param event: 事件名
+  :param data: 可被 json 序列化的数据
+  :return: SSE 文本
+  """
+  payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+  return f"event: {event}\ndata: {payload}\n\n"
+
+
+class CompletedItemTracker:
+  """
+  跟踪 llm 流式输出中逐步增长的 json 对象，找出其中已经闭合的列表元素。
+
+  JsonOutputParser 在流式模式下每次产出的都是累计的部分对象，列表中除最后一个
+  元素外都已完整；当列表后面的键开始出现或流结束时，最后一个元素也随之完整。
+  """
+
+  def __init__(self, list_keys: Sequence[str]):
+    self.list_keys = list(list_keys)
+    self.latest: Dict[str, Any] = {}
+    self._emitted = {key: 0 for key in self.list_keys}
+
+
+  def feed(self, partial: Optional[Dict[str, Any]]) -> List[Tuple[str, Dict]]:
+    """
+    输入最新的累计部分对象
+    :param partial: JsonOutputParser 产出的部分对象
+    :return: 本次新闭合的 (列表键, 元素) 列表
+    """
+    if not isinstance(partial, dict):
+      return []
+    self.latest = partial
+
+    completed = []
+    for position, key in enumerate(self.list_keys):
+      items = partial.get(key)
+      if not isinstance(items, list):
+        continue
+      later_key_started = any(later in partial
+                              for later in self.list_keys[position + 1:])
+      closed_count = len(items) if later_key_started else len(items) - 1
+      completed.extend(self._take(key, items, closed_count))
+    return completed
+
+
+  def flush(self) -> List[Tuple[str, Dict]]:
+    """
+    流结束时调用，返回剩余未产出的元素
+    """
+    completed = []
+    for key in self.list_keys:
+      items = self.latest.get(key)
+      if isinstance(items, list):
+        completed.extend(self._take(key, items, len(items)))
+    return completed
+
+
+  def _take(self, key: str, items: List[Any],
+      closed_count: int) -> List[Tuple[str, Dict]]:
+    start = self._emitted[key]
+    if closed_count <= start:
+      return []
+    self._emitted[key] = closed_count
+    return [(key, item) for item in items[start:closed_count]]
@@ -0,0 +1,17 @@
+import math
+import re
+
+# 中日韩字符与全角标点大致一个字符一个 token，其余文本大致四个字符一个 token
+CJK_PATTERN = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+  """
+  不依赖分词器粗略估算文本的 token 数
+  :param text: 待估算的文本
+  :return: 估算的 token 数
+  """
+  if not text:
+    return 0
+  cjk_count = len(CJK_PATTERN.findall(text))
+  return cjk_count + math.ceil((len(text) - cjk_count) / 4)
@@ -0,0 +1,422 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SAMPLE_RATIO = 0.1
+DEFAULT_TRACE_DIR = 'app/traces'
+DEFAULT_OTLP_ENDPOINT = "http://127.0.0.1:4318/v1/traces"
+DEFAULT_SERVICE_NAME = "llm-deep-craft"
+DEFAULT_QUEUE_SIZE = 2048
+DEFAULT_EXPORT_INTERVAL_SECONDS = 5.0
+TRACEPARENT_PATTERN = re.compile(
+    r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# OTLP 中的 SpanKind 与状态码
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_CODES = {"unset": 0, "ok": 1, "error": 2}
+
+
+@dataclass
+class Span:
+  """
+  一次操作的追踪记录，字段与 OpenTelemetry 的 span 对应；未采样的 span 只保留 id 用于传播
+  """
+  name: str
+  trace_id: str
+  span_id: str
+  parent_span_id: Optional[str]
+  sampled: bool
+  kind: str = "internal"
+  start_ns: int = field(default_factory=time.time_ns)
+  end_ns: Optional[int] = None
+  attributes: Dict[str, Any] = field(default_factory=dict)
+  status: str = "unset"
+  status_message: str = ""
+
+  def set_attribute(self, key: str, value: Any) -> None:
+    if self.sampled and value is not None:
+      self.attributes[key] = value
+
+
+  def record_error(self, error: BaseException) -> None:
+    if self.sampled:
+      self.status = "error"
+      self.status_message = str(error)
+      self.attributes["exception.type"] = type(error).__name__
+
+
+  @property
+  def traceparent(self) -> str:
+    return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {
+      "name": self.name,
+      "trace_id": self.trace_id,
+      "span_id": self.span_id,
+      "parent_span_id": self.parent_span_id,
+      "kind": self.kind,
+      "start_ns": self.start_ns,
+      "end_ns": self.end_ns,
+      "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3)
+      if self.end_ns else None,
+      "attributes": self.attributes,
+      "status": self.status,
+      "status_message": self.status_message,
+    }
+
+
+# 当前请求或任务中正在进行的 span
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span",
+                                                      default=None)
+
+
+class SpanExporter:
+  """
+  导出器在线程中被调用，可以执行阻塞 I/O
+  """
+
+  def export(self, spans: List[Span]) -> None:
+    raise NotImplementedError
+
+
+class JsonFileSpanExporter(SpanExporter):
+  """
+  按天写入 JSON Lines 文件，每行一个 span
+  """
+
+  def __init__(self, directory: str = DEFAULT_TRACE_DIR):
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+
+  def export(self, spans: List[Span]) -> None:
+    path = os.path.join(self.directory,
+                        f"traces-{datetime.now().strftime('%Y%m%d')}.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+      for span in spans:
+        f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+class OtlpHttpSpanExporter(SpanExporter):
+  """
+  以 OTLP/HTTP JSON 格式发送到本地的 OpenTelemetry Collector
+  """
+
+  def __init__(self, endpoint: str = DEFAULT_OTLP_ENDPOINT,
+      service_name: str = DEFAULT_SERVICE_NAME, timeout: float = 5.0):
+    self.endpoint = endpoint
+    self.service_name = service_name
+    self.timeout = timeout
+
+
+  def export(self, spans: List[Span]) -> None:
+    response = httpx.post(self.endpoint, json=self.payload(spans),
+                          timeout=self.timeout)
+    response.raise_for_status()
+
+
+  def payload(self, spans: List[Span]) -> Dict[str, Any]:
+    return {"resourceSpans": [{
+      "resource": {"attributes": _otlp_attributes(
+          {"service.name": self.service_name})},
+      "scopeSpans": [{
+        "scope": {"name": self.service_name},
+        "spans": [{
+          "traceId": span.trace_id,
+          "spanId": span.span_id,
+          "parentSpanId": span.parent_span_id or "",
+          "name": span.name,
+          "kind": SPAN_KINDS.get(span.kind, 1),
+          "startTimeUnixNano": str(span.start_ns),
+          "endTimeUnixNano": str(span.end_ns or span.start_ns),
+          "attributes": _otlp_attributes(span.attributes),
+          "status": {"code": STATUS_CODES[span.status],
+                     "message": span.status_message},
+        } for span in spans],
+      }],
+    }]}
+
+
+class Tracer:
+  """
+  进程内的追踪器：
+  - 请求入口按 sample_ratio 决定是否采样，携带 traceparent 的请求沿用上游的采样决定
+  - 未采样的请求只生成 trace id，不创建子 span，开销可以忽略
+  - 结束的 span 放入有界队列，由后台任务按间隔批量导出，队列满时丢弃并计数
+  """
+
+  def __init__(
+      self,
+      exporter: Optional[SpanExporter] = None,
+      sample_ratio: float = DEFAULT_SAMPLE_RATIO,
+      max_queue_size: int = DEFAULT_QUEUE_SIZE,
+      export_interval_seconds: float = DEFAULT_EXPORT_INTERVAL_SECONDS
+  ):
+    self.exporter = exporter
+    self.sample_ratio = max(0.0, min(1.0, sample_ratio))
+    self.export_interval_seconds = export_interval_seconds
+
+    self._queue: Deque[Span] = deque(maxlen=max(1, max_queue_size))
+    self._lock = threading.Lock()
+    self._flusher: Optional[asyncio.Task] = None
+    self._counters = {"traces": 0, "sampled_traces": 0, "spans": 0,
+                      "exported_spans": 0, "dropped_spans": 0,
+                      "export_errors": 0}
+
+
+  @property
+  def enabled(self) -> bool:
+    return self.exporter is not None
+
+
+  def start_root(
+      self,
+      name: str,
+      traceparent: Optional[str] = None,
+      kind: str = "server",
+      attributes: Optional[Dict[str, Any]] = None
+  ) -> Span:
+    """
+    开始一个请求或后台任务的根 span
+    :param traceparent: 上游传入的 W3C traceparent，格式不对时忽略
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+      trace_id, parent_span_id, sampled = parent
+    else:
+      trace_id, parent_span_id = _random_id(16), None
+      sampled = random.random() < self.sample_ratio
+    sampled = sampled and self.enabled
+    self._count("traces")
+    if sampled:
+      self._count("sampled_traces")
+    span = Span(name=name, trace_id=trace_id, span_id=_random_id(8),
+                parent_span_id=parent_span_id, sampled=sampled, kind=kind)
+    for key, value in (attributes or {}).items():
+      span.set_attribute(key, value)
+    return span
+
+
+  def start_span(
+      self,
+      name: str,
+      parent: Optional[Span] = None,
+      kind: str = "internal",
+      attributes: Optional[Dict[str, Any]] = None
+  ) -> Optional[Span]:
+    """
+    :param parent: 父 span，默认取当前上下文中的 span
+    :return: 父 span 未采样或不存在时返回 None
+    """
+    parent = parent or current_span.get()
+    if parent is None or not parent.sampled:
+      return None
+    span = Span(name=name, trace_id=parent.trace_id, span_id=_random_id(8),
+                parent_span_id=parent.span_id, sampled=True, kind=kind)
+    if attributes:
+      span.attributes.update({key: value for key, value in attributes.items()
+                              if value is not None})
+    return span
+
+
+  def finish(self, span: Optional[Span]) -> None:
+    if span is None or not span.sampled:
+      return
+    span.end_ns = time.time_ns()
+    with self._lock:
+      if len(self._queue) == self._queue.maxlen:
+        self._counters["dropped_spans"] += 1
+      self._queue.append(span)
+      self._counters["spans"] += 1
+    self._ensure_flusher()
+
+
+  @contextmanager
+  def span(
+      self,
+      name: str,
+      attributes: Optional[Dict[str, Any]] = None,
+      kind: str = "internal"
+  ) -> Iterator[Optional[Span]]:
+    """
+    在当前 span 下创建子 span 并设为当前 span；未采样时不做任何事，返回 None
+    """
+    span = self.start_span(name, kind=kind, attributes=attributes)
+    if span is None:
+      yield None
+      return
+    token = current_span.set(span)
+    try:
+      yield span
+    except BaseException as e:
+      span.record_error(e)
+      raise
+    finally:
+      current_span.reset(token)
+      self.finish(span)
+
+
+  @contextmanager
+  def root_span(
+      self,
+      name: str,
+      attributes: Optional[Dict[str, Any]] = None,
+      kind: str = "internal"
+  ) -> Iterator[Optional[Span]]:
+    """
+    为没有请求上下文的后台任务创建根 span；未开启追踪时不做任何事，返回 None
+    """
+    if not self.enabled:
+      yield None
+      return
+    span = self.start_root(name, kind=kind, attributes=attributes)
+    token = current_span.set(span)
+    try:
+      yield span
+    except BaseException as e:
+      span.record_error(e)
+      raise
+    finally:
+      current_span.reset(token)
+      self.finish(span)
+
+
+  async def flush(self) -> None:
+    with self._lock:
+      spans = list(self._queue)
+      self._queue.clear()
+    if not spans or self.exporter is None:
+      return
+    try:
+      await asyncio.to_thread(self.exporter.export, spans)
+      self._count("exported_spans", len(spans))
+    except Exception as e:
+      self._count("export_errors")
+      self._count("dropped_spans", len(spans))
+      logger.error("导出 %s 个 span 失败：%s", len(spans), e)
+
+
+  async def close(self) -> None:
+    if self._flusher is not None:
+      self._flusher.cancel()
+      self._flusher = None
+    await self.flush()
+
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+        **self._counters,
+        "enabled": self.enabled,
+        "exporter": type(self.exporter).__name__ if self.exporter else None,
+        "sample_ratio": self.sample_ratio,
+        "queued_spans": len(self._queue),
+      }
+
+
+  def _count(self, name: str, amount: int = 1) -> None:
+    with self._lock:
+      self._counters[name] += amount
+
+
+  def _ensure_flusher(self) -> None:
+    if self._flusher is not None and not self._flusher.done():
+      return
+    try:
+      loop = asyncio.get_running_loop()
+    except RuntimeError:
+      # 同步调用（如线程中的 invoke）没有事件循环，留给下一次异步调用或关闭时导出
+      return
+    self._flusher = loop.create_task(self._flush_loop())
+
+
+  async def _flush_loop(self) -> None:
+    while self._queue:
+      await asyncio.sleep(self.export_interval_seconds)
+      await self.flush()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+  """
+  :return: (trace id, 上游 span id, 是否采样)，格式不对或 id 全为 0 时返回 None
+  """
+  if not header:
+    return None
+  match = TRACEPARENT_PATTERN.match(header.strip().lower())
+  if match is None:
+    return None
+  trace_id, span_id, flags = match.groups()
+  if trace_id == "0" * 32 or span_id == "0" * 16:
+    return None
+  return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def _random_id(size: int) -> str:
+  return os.urandom(size).hex()
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+  converted = []
+  for key, value in attributes.items():
+    if isinstance(value, bool):
+      typed = {"boolValue": value}
+    elif isinstance(value, int):
+      typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+      typed = {"doubleValue": value}
+    else:
+      typed = {"stringValue": str(value)}
+    converted.append({"key": key, "value": typed})
+  return converted
+
+
+def build_tracer() -> Tracer:
+  """
+  按环境变量 TRACE_EXPORTER（none | json | otlp）创建追踪器，默认关闭；
+  TRACE_SAMPLE_RATIO 控制没有上游 traceparent 的请求的采样比例
+  """
+  exporter_name = os.environ.get("TRACE_EXPORTER", "none").lower()
+  service_name = os.environ.get("TRACE_SERVICE_NAME", DEFAULT_SERVICE_NAME)
+  if exporter_name == "json":
+    exporter = JsonFileSpanExporter(os.environ.get("TRACE_JSON_DIR",
+                                                   DEFAULT_TRACE_DIR))
+  elif exporter_name == "otlp":
+    exporter = OtlpHttpSpanExporter(
+        os.environ.get("TRACE_OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT),
+        service_name)
+  elif exporter_name == "none":
+    exporter = None
+  else:
+    raise ValueError(f"未知的 TRACE_EXPORTER：{exporter_name}，可选 none、json、otlp")
+
+  sample_ratio = float(os.environ.get("TRACE_SAMPLE_RATIO", DEFAULT_SAMPLE_RATIO))
+  if exporter is not None:
+    logger.info("链路追踪已开启：导出到 %s，采样比例 %s", exporter_name, sample_ratio)
+  return Tracer(
+      exporter=exporter,
+      sample_ratio=sample_ratio,
+      max_queue_size=int(os.environ.get("TRACE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+      export_interval_seconds=float(os.environ.get(
+          "TRACE_EXPORT_INTERVAL_SECONDS", DEFAULT_EXPORT_INTERVAL_SECONDS)),
+  )
+
+
+# 全局实例
+tracer = build_tracer()
@@ -1,111 +1,406 @@
 import json
-from pathlib import Path
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, \
+  Optional
 
-import aiofiles
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 
-from app.LLMs.LLM import llm
-from app.logger.logger import logger
+from app.LLMs.chain_registry import chain_registry
+from app.LLMs.model_registry import ModelTier
+from app.LLMs.model_router import routed_llm
+from app.LLMs.chain_runner import run_chain, run_chain_as_completed, \
+  stream_chain
+from app.LLMs.similarity_cache import build_similarity_cache
+from app.logger.logger import get_logger
 from app.utils.base_model_converter import base_model_to_dict
-from app.utils.outcome_handler import outcome_querier
-from app.utils.schema_verifier import validate_json_str
+from app.utils.context_assembler import changed_names, minify_json, \
+  record_modification
+from app.utils.document_chunker import chunk_max_concurrency
+from app.utils.metrics import stage_timer
+from app.utils.output_repair import StructuredOutputRepairer, \
+  extract_output_data
+from app.utils.outcome_handler import outcome_querier, outcome_writer
+from app.utils.schema_verifier import schema_validators, validate_json_str
+from app.utils.session_resolver import DEFAULT_SESSION_ID
+from app.utils.sse_stream import CompletedItemTracker, format_sse
 from app.work_flow.data_model.chain.prompts.data_model_prompts import \
-  DATA_MODEL_GENERATION_PROMPT, DATA_MODEL_MODIFICATION_PROMPT, \
-  JSON_TO_MD_PROMPT
+  DATA_MODEL_GENERATION_PROMPT, DATA_MODEL_INCREMENTAL_PROMPT, \
+  DATA_MODEL_MODIFICATION_PROMPT, DATA_MODEL_REPAIR_PROMPT, JSON_TO_MD_PROMPT
 from app.work_flow.data_model.chain.prompts.data_model_templates import \
   DATA_ENTITY_VALIDATION_SCHEMA
 from app.work_flow.data_model.schemas.dto_schemas.data_model_requests import \
   DataModelGenerateRequest, DataModelRequest
 from app.work_flow.data_model.schemas.dto_schemas.data_model_response import \
   DataModelResponse
+from app.work_flow.data_model.service.chunking_service import \
+  cluster_stories, merge_data_models, story_cluster_budget
+from app.work_flow.data_model.service.context_service import WORKFLOW, \
+  assemble_data_model_context, restore_condensed_entities
+from app.work_flow.data_model.service.markdown_service import \
+  render_data_model_md
+from app.work_flow.data_model.service.outcomes_service import DRAFT_DOCUMENT
+from app.work_flow.data_model.service.provenance_service import \
+  IncrementalPlan, incremental_chain_input, load_incremental_plan, \
+  splice_data_model, write_data_model_provenance
+from app.work_flow.data_model.service.repair_service import fix_data_model
+from app.work_flow.user_story.schemas.domain_schemas.user_story_domains import \
+  UserStories
 
+logger = get_logger(__name__)
 
-draft_path = Path("./work_flow/data_model/outcomes/draft")
-draft_file_path = draft_path / "data_model_draft.json"
 
+# 链在首次使用或启动预热时才构建
+# include_raw 保留原始输出，解析失败时交给修复流程而不是直接报错
+data_model_generation_chain = chain_registry.register(
+    "data_model.generate",
+    lambda: DATA_MODEL_GENERATION_PROMPT
+            | routed_llm(ModelTier.Strong, DataModelResponse, include_raw=True))
 
-data_model_generation_chain = (
-    DATA_MODEL_GENERATION_PROMPT
-    | llm.with_structured_output(DataModelResponse)
-)
+# 用户故事小幅变更时只重新设计受影响的实体
+data_model_incremental_chain = chain_registry.register(
+    "data_model.incremental",
+    lambda: DATA_MODEL_INCREMENTAL_PROMPT
+            | routed_llm(ModelTier.Standard, DataModelResponse, include_raw=True))
 
+data_model_modification_chain = chain_registry.register(
+    "data_model.modify",
+    lambda: DATA_MODEL_MODIFICATION_PROMPT
+            | routed_llm(ModelTier.Standard, DataModelResponse, include_raw=True))
 
-data_model_modification_chain = (
-  DATA_MODEL_MODIFICATION_PROMPT
-  | llm.with_structured_output(DataModelResponse)
-)
+# 流式链以 json schema 字典作为结构，输出由 JsonOutputParser 逐步解析为部分对象
+data_model_generation_stream_chain = chain_registry.register(
+    "data_model.generate_stream",
+    lambda: DATA_MODEL_GENERATION_PROMPT
+            | routed_llm(ModelTier.Strong, DataModelResponse.model_json_schema()))
+
+data_model_modification_stream_chain = chain_registry.register(
+    "data_model.modify_stream",
+    lambda: DATA_MODEL_MODIFICATION_PROMPT
+            | routed_llm(ModelTier.Standard, DataModelResponse.model_json_schema()))
+
+json_to_md_chain = chain_registry.register(
+    "data_model.json_to_md",
+    lambda: JSON_TO_MD_PROMPT | routed_llm(ModelTier.Light) | StrOutputParser())
+
+data_model_repair_chain = chain_registry.register(
+    "data_model.repair",
+    lambda: DATA_MODEL_REPAIR_PROMPT | routed_llm(ModelTier.Light)
+            | JsonOutputParser())
+
+# 启动时编译校验用的 schema，之后每次校验直接复用
+schema_validators.register(DATA_ENTITY_VALIDATION_SCHEMA)
 
-json_to_md_chain = (
-  JSON_TO_MD_PROMPT
-  | llm
-  | StrOutputParser()
+# 用户故事与额外要求相近时直接复用之前的生成结果，未开启时为 None
+data_model_similarity_cache = build_similarity_cache("数据模型")
+
+data_model_repairer = StructuredOutputRepairer(
+    name="数据模型",
+    response_model=DataModelResponse,
+    schema=DATA_ENTITY_VALIDATION_SCHEMA,
+    local_fixer=fix_data_model,
+    repair_chain=data_model_repair_chain,
+    fragment_keys=("entities", "relationships"),
+    workflow=WORKFLOW,
 )
 
 
 async def generate_data_model_draft(
-    data_model_requirement: DataModelGenerateRequest
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = DEFAULT_SESSION_ID
 ) -> DataModelResponse:
   logger.info("开始根据用户故事生成数据模型")
-  human_requirements = data_model_requirement.human_requirements
-  if human_requirements == "":
-    human_requirements = "用户无额外要求，直接生成数据模型即可。"
-  user_story_result = data_model_requirement.user_story_result
-  data_model_result = await data_model_generation_chain.ainvoke(
-      {
-        "user_story_result": user_story_result,
-        "user_requirements": human_requirements,
-      }
-  )
-
-  data_model_dict = data_model_format_verifier(data_model_result)
-  await write_data_model_draft(data_model_dict)
+  stories = data_model_requirement.user_story_result.model_dump(mode="json")["stories"]
+  plan = await load_incremental_plan(
+      session_id, stories, data_model_requirement.human_requirements) \
+    if data_model_requirement.incremental else None
+  if plan is not None:
+    data_model_result = await regenerate_affected_entities(data_model_requirement,
+                                                           plan)
+    data_model_dict = data_model_format_verifier(data_model_result)
+    await write_data_model_draft(data_model_dict, session_id)
+    await write_data_model_provenance(stories, data_model_dict,
+                                      data_model_requirement.human_requirements,
+                                      session_id)
+    logger.info("数据模型增量更新完成")
+    return data_model_result
+
+  requirement_text = "\n".join((
+    minify_json(data_model_requirement.user_story_result.model_dump(mode="json")),
+    data_model_requirement.human_requirements,
+  ))
+  hit = await data_model_similarity_cache.lookup(session_id, requirement_text) \
+    if data_model_similarity_cache is not None else None
+  if hit is not None:
+    data_model_result = DataModelResponse.model_validate(hit.result)
+    data_model_dict = data_model_format_verifier(data_model_result)
+  else:
+    clusters = cluster_stories(stories, story_cluster_budget())
+    if len(clusters) > 1:
+      data_model_result = await generate_data_model_by_clusters(
+          data_model_requirement, clusters)
+    else:
+      data_model_result = await data_model_repairer.repair(
+          await run_chain(data_model_generation_chain(),
+                          generation_chain_input(data_model_requirement))
+      )
+    data_model_dict = data_model_format_verifier(data_model_result)
+    if data_model_similarity_cache is not None:
+      await data_model_similarity_cache.store(session_id, requirement_text,
+                                              data_model_dict)
+  await write_data_model_draft(data_model_dict, session_id)
+  await write_data_model_provenance(stories, data_model_dict,
+                                    data_model_requirement.human_requirements,
+                                    session_id)
   logger.info("数据模型生成完成")
 
   return data_model_result
 
 
-async def modify_data_model_draft(
-    data_model_requirement: DataModelGenerateRequest
+async def regenerate_affected_entities(
+    data_model_requirement: DataModelGenerateRequest,
+    plan: IncrementalPlan
+) -> DataModelResponse:
+  """
+  只把变更的用户故事与受影响的实体发给 llm，生成结果与未变更的实体拼接成完整的数据模型；
+  只删除了用户故事时不调用 llm
+  :param data_model_requirement: 原始的生成请求
+  :param plan: 增量计划
+  :return: 拼接后的数据模型
+  """
+  diff = plan.diff
+  logger.info("用户故事新增 %s 个、修改 %s 个、删除 %s 个，重新设计实体 %s 个，"
+              "删除实体 %s 个", len(diff.added), len(diff.changed),
+              len(diff.removed), len(plan.affected), len(plan.dropped))
+  regenerated = None
+  if plan.needs_llm:
+    human_requirements = generation_chain_input(
+        data_model_requirement)["user_requirements"]
+    # 部分结果中的关系会指向未变更的实体，拼接后再整体修复
+    regenerated = extract_output_data(
+        await run_chain(data_model_incremental_chain(),
+                        incremental_chain_input(plan, human_requirements)))
+  return await data_model_repairer.repair(splice_data_model(plan, regenerated))
+
+
+async def generate_data_model_by_clusters(
+    data_model_requirement: DataModelGenerateRequest,
+    clusters: List[List[dict]]
 ) -> DataModelResponse:
+  """
+  用户故事过多时按相似度分组并发生成数据模型，再按实体名合并；
+  合并结果再经过修复流程，去掉分组之间对不上的关系
+  :param data_model_requirement: 原始的生成请求
+  :param clusters: 分组后的用户故事
+  :return: 合并后的数据模型
+  """
+  logger.info("用户故事较多，分为 %s 组并发生成数据模型", len(clusters))
+  chain_inputs = [
+    generation_chain_input(DataModelGenerateRequest(
+        user_story_result=UserStories.model_validate({"stories": cluster}),
+        human_requirements=data_model_requirement.human_requirements))
+    for cluster in clusters
+  ]
+  cluster_results: List[Optional[dict]] = [None] * len(clusters)
+  async with aclosing(run_chain_as_completed(
+      data_model_generation_chain(),
+      chain_inputs,
+      chunk_max_concurrency()
+  )) as outcomes:
+    async for index, outcome in outcomes:
+      if isinstance(outcome, Exception):
+        logger.error("第 %s 组用户故事生成数据模型失败：%s", index + 1, outcome)
+        raise outcome
+      cluster_results[index] = (
+          await data_model_repairer.repair(outcome)).model_dump(mode="json")
+  return await data_model_repairer.repair(merge_data_models(cluster_results))
+
+
+async def generate_data_model_batch(
+    data_model_requirements: List[DataModelGenerateRequest],
+    max_concurrency: int
+) -> AsyncIterator[Dict[str, Any]]:
+  """
+  并发生成多个数据模型，按完成顺序逐条返回；单条失败不影响其他条目，也不写入草稿
+  """
+  logger.info("开始批量生成数据模型，共 %s 条，并发上限 %s",
+              len(data_model_requirements), max_concurrency)
+  chain_inputs = [generation_chain_input(requirement)
+                  for requirement in data_model_requirements]
+  async with aclosing(run_chain_as_completed(
+      data_model_generation_chain(),
+      chain_inputs,
+      max_concurrency
+  )) as outcomes:
+    async for index, outcome in outcomes:
+      try:
+        if isinstance(outcome, Exception):
+          raise outcome
+        data_model_result = await data_model_repairer.repair(outcome)
+        yield {"index": index, "ok": True,
+               "result": data_model_format_verifier(data_model_result)}
+      except Exception as e:
+        logger.error("批量生成数据模型第 %s 条失败：%s", index, e)
+        yield {"index": index, "ok": False, "error": str(e)}
+  logger.info("数据模型批量生成结束")
+
+
+def generation_chain_input(
+    data_model_requirement: DataModelGenerateRequest
+) -> Dict[str, Any]:
   human_requirements = data_model_requirement.human_requirements
-  user_story_result = data_model_requirement.user_story_result
-  data_model_draft = outcome_querier(draft_file_path)
-  logger.info("开始根据用户自然语言的需求修改数据模型草稿")
-  modified_data_model_result = await (data_model_modification_chain
-                                      .ainvoke({
-    "user_story_result": user_story_result,
-    "data_model_draft": data_model_draft,
+  if human_requirements == "":
+    human_requirements = "用户无额外要求，直接生成数据模型即可。"
+  return {
+    "user_story_result": data_model_requirement.user_story_result,
     "user_requirements": human_requirements,
-  }))
-  data_model_format_verifier(modified_data_model_result)
+  }
+
+
+async def modify_data_model_draft(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = DEFAULT_SESSION_ID
+) -> DataModelResponse:
+  data_model_draft = json.loads(await outcome_querier(session_id, DRAFT_DOCUMENT))
+  context = await assemble_data_model_context(data_model_requirement,
+                                              data_model_draft, session_id)
+  logger.info("开始根据用户自然语言的需求修改数据模型草稿")
+  modified_data_model_result = await data_model_repairer.repair(
+      await run_chain(data_model_modification_chain(), context.inputs))
+  modified_data_model_result = restore_condensed_entities(
+      modified_data_model_result, data_model_draft, context.condensed)
+  modified_data_model_dict = data_model_format_verifier(modified_data_model_result)
+  await record_modification(
+      session_id, WORKFLOW, data_model_requirement.human_requirements,
+      changed_names(data_model_draft.get("entities", []),
+                    modified_data_model_dict["entities"], "name"),
+      context)
   logger.info("成功根据用户自然语言的需求修改数据模型草稿")
   return modified_data_model_result
 
 
-async def write_data_model_draft(data_model_dict: dict) -> None:
-  logger.info("开始记录数据模型的草稿")
+async def stream_data_model_generation(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = DEFAULT_SESSION_ID
+) -> AsyncIterator[str]:
+  logger.info("开始根据用户故事流式生成数据模型")
+  stories = data_model_requirement.user_story_result.model_dump(mode="json")["stories"]
+
+  async def on_result(data_model_dict: dict) -> None:
+    # 草稿已整体替换，溯源也要随之更新，否则下次增量生成会按旧的对应关系拼接
+    await write_data_model_provenance(stories, data_model_dict,
+                                      data_model_requirement.human_requirements,
+                                      session_id)
+
+  async for event in _stream_data_model(
+      data_model_generation_stream_chain(),
+      generation_chain_input(data_model_requirement),
+      session_id,
+      write_draft=True,
+      on_result=on_result
+  ):
+    yield event
+  logger.info("数据模型流式生成结束")
+
 
-  draft_path.mkdir(parents=True, exist_ok=True)
+async def stream_data_model_modification(
+    data_model_requirement: DataModelGenerateRequest,
+    session_id: str = DEFAULT_SESSION_ID
+) -> AsyncIterator[str]:
+  logger.info("开始根据用户自然语言的需求流式修改数据模型草稿")
+  try:
+    data_model_draft = json.loads(await outcome_querier(session_id, DRAFT_DOCUMENT))
+    context = await assemble_data_model_context(
+        data_model_requirement, data_model_draft, session_id,
+        allow_condense=False)
+  except Exception as e:
+    yield format_sse("error", {"detail": str(e)})
+    return
+
+  async def on_result(data_model_dict: dict) -> None:
+    await record_modification(
+        session_id, WORKFLOW, data_model_requirement.human_requirements,
+        changed_names(data_model_draft.get("entities", []),
+                      data_model_dict["entities"], "name"),
+        context)
+
+  async for event in _stream_data_model(
+      data_model_modification_stream_chain(),
+      context.inputs,
+      session_id,
+      write_draft=False,
+      on_result=on_result
+  ):
+    yield event
+  logger.info("数据模型草稿流式修改结束")
 
+
+async def _stream_data_model(
+    chain,
+    chain_input: Dict[str, Any],
+    session_id: str,
+    write_draft: bool,
+    on_result: Optional[Callable[[dict], Awaitable[None]]] = None
+) -> AsyncIterator[str]:
+  """
+  每个 DataEntity / EntityRelationship 闭合后立即推送，流结束后再统一校验并写入草稿
+  :param on_result: 校验通过后对完整结果的回调
+  """
+  tracker = CompletedItemTracker(["entities", "relationships"])
+  event_names = {"entities": "entity", "relationships": "relationship"}
   try:
-    async with aiofiles.open(draft_file_path, "w", encoding="utf-8") as f:
-      content = json.dumps(data_model_dict, indent=2, ensure_ascii=False)
-      await f.write(content)
+    async for partial in stream_chain(chain, chain_input):
+      for key, item in tracker.feed(partial):
+        yield format_sse(event_names[key], item)
+    for key, item in tracker.flush():
+      yield format_sse(event_names[key], item)
+
+    data_model_result = await data_model_repairer.repair(tracker.latest)
+    data_model_dict = data_model_format_verifier(data_model_result)
+    if write_draft:
+      await write_data_model_draft(data_model_dict, session_id)
+    if on_result is not None:
+      await on_result(data_model_dict)
+    yield format_sse("done", data_model_dict)
+  except Exception as e:
+    logger.error("数据模型流式输出失败：%s", e)
+    yield format_sse("error", {"detail": str(e)})
+
+
+async def write_data_model_draft(
+    data_model_dict: dict,
+    session_id: str
+) -> None:
+  logger.info("开始记录数据模型的草稿")
+
+  try:
+    await outcome_writer(session_id, DRAFT_DOCUMENT, data_model_dict,
+                         versioned=True)
   except OSError as e:
-    logger.error(f"写入用户故事草稿文件失败：{e}")
+    logger.error("写入数据模型草稿文件失败：%s", e)
 
 
-async def data_model_json_to_md(data_models: DataModelRequest) -> str:
+async def data_model_json_to_md(
+    data_models: DataModelRequest,
+    polish: bool = False
+) -> str:
   logger.info("开始将数据模型的 json 转为 md 格式")
+  if not polish:
+    md_result = render_data_model_md(data_models)
+    logger.info("成功在本地将数据模型的 json 转为 md 格式")
+    return md_result
+
   data_models_json = base_model_to_dict(data_models)
-  md_result = await json_to_md_chain.ainvoke({"result_json": data_models_json})
+  md_result = await run_chain(json_to_md_chain(),
+                            {"result_json": data_models_json})
   logger.info("成功将数据模型的 json 转为 md 格式")
   return md_result
 
 
 def data_model_format_verifier(llm_result: DataModelResponse) -> dict:
   result_dict = base_model_to_dict(llm_result)
-  if not validate_json_str(result_dict, DATA_ENTITY_VALIDATION_SCHEMA):
-    logger.error("生成的数据模型格式错误")
-    raise ValueError("生成的实体格式错误")
+  with stage_timer(WORKFLOW, "validate"):
+    is_valid, info_str = validate_json_str(result_dict, DATA_ENTITY_VALIDATION_SCHEMA)
+  if not is_valid:
+    logger.error("生成的数据模型格式错误：%s", info_str)
+    raise ValueError(f"生成的实体格式错误：{info_str}")
   return result_dict
\ No newline at end of file
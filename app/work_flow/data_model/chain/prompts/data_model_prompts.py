@@ -22,9 +22,6 @@ DATA_MODEL_GENERATION_PROMPT = ChatPromptTemplate.from_messages([
 
 6. 说明或描述的内容应当使用中文。
 
-## 用户故事
-{{user_story_result}}
-
 输出必须是符合DataModelResponse模式的有效JSON对象。
 
 ## 输出格式（JSON）
@@ -34,8 +31,12 @@ DATA_MODEL_GENERATION_PROMPT = ChatPromptTemplate.from_messages([
 {examples}""".format(
         schema=DATA_ENTITY_SCHEMA,
         examples=DATA_ENTITY_SCHEMA_EXAMPLES
-    ).replace("{{user_story_result}}", "{user_story_result}")),
-    ("human", """User Requirements:
+    )),
+    # 会变化的内容放在静态的系统提示词之后，使系统提示词可以被服务端的前缀缓存命中
+    ("human", """## 用户故事
+{user_story_result}
+
+User Requirements:
 {user_requirements}
 
 根据这些故事，生成数据模型。
@@ -62,11 +63,51 @@ DATA_MODEL_MODIFICATION_PROMPT = ChatPromptTemplate.from_messages([
 
 6. 说明或描述的内容应当使用中文。
 
-## 用户故事
-{{user_story_result}}
+输出必须是符合DataModelResponse模式的有效JSON对象。
+
+## 输出格式（JSON）
+{schema}
+
+## 示例输出
+{examples}""".format(
+        schema=DATA_ENTITY_SCHEMA,
+        examples=DATA_ENTITY_SCHEMA_EXAMPLES
+    )),
+    ("human", """## 用户故事
+{user_story_result}
 
 ## 数据模型草稿
-{{data_model_draft}}
+{data_model_draft}
+
+## 历史修改记录
+{conversation_history}
+
+User Requirements:
+{user_requirements}
+
+根据这些故事，生成数据模型。
+""")
+])
+
+
+DATA_MODEL_INCREMENTAL_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """您是一位资深的数据库架构师。
+
+用户故事发生了部分变更，您的目标是只更新受这些变更影响的实体，其余实体保持不变。
+
+请遵循以下规则：
+
+1. 只输出受影响的实体以及为新增或修改的用户故事新建的实体，不要输出其他实体。
+
+2. 受影响的实体如果只服务于被删除的用户故事，则不要输出该实体。
+
+3. 定义具有适当数据类型的字段，新建实体的字段命名应与已有实体保持一致。
+
+4. 只输出至少一端是所输出实体的关系；关系可以指向未变更的实体，但不能修改未变更实体的字段。
+
+5. 规范化数据库设计（至少达到3NF），实体使用帕斯卡命名法，字段使用蛇形命名法。
+
+6. 说明或描述的内容应当使用中文。
 
 输出必须是符合DataModelResponse模式的有效JSON对象。
 
@@ -77,16 +118,42 @@ DATA_MODEL_MODIFICATION_PROMPT = ChatPromptTemplate.from_messages([
 {examples}""".format(
         schema=DATA_ENTITY_SCHEMA,
         examples=DATA_ENTITY_SCHEMA_EXAMPLES
-    ).replace("{{user_story_result}}", "{user_story_result}")
-     .replace("{{data_model_draft}}", "{data_model_draft}")),
-    ("human", """User Requirements:
+    )),
+    ("human", """## 未变更的实体（仅供建立关系时参考）
+{unchanged_entities}
+
+## 受影响的实体（当前定义）
+{affected_entities}
+
+## 新增或修改的用户故事
+{changed_stories}
+
+## 被删除的用户故事（功能名）
+{removed_stories}
+
+User Requirements:
 {user_requirements}
 
-根据这些故事，生成数据模型。
+根据变更的用户故事，更新受影响的实体。
 """)
 ])
 
 
+DATA_MODEL_REPAIR_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """您是一位资深的数据库架构师。下面的 JSON 片段取自一个数据模型，但不符合给定的结构。
+
+请只修正列出的错误，保持其余内容不变，只输出修正后的 JSON 片段，不要输出任何解释。
+
+## 片段应符合的结构（JSON Schema）
+{fragment_schema}"""),
+    ("human", """## 错误
+{errors}
+
+## 片段
+{fragment}""")
+])
+
+
 JSON_TO_MD_PROMPT = ChatPromptTemplate.from_messages([
     ("system", """
 你是一个专业的技术文档生成器。请将以下符合指定结构的 JSON 数据转换为清晰、结构良好、对人类友好的 Markdown 文档。严格遵循以下规则：
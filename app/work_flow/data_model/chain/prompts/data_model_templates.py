@@ -122,71 +122,65 @@ DATA_ENTITY_VALIDATION_SCHEMA = {
   "$schema": "http://json-schema.org/draft-07/schema#",
   "title": "DataModelResponseValidation",
   "type": "object",
+  "required": ["entities", "relationships"],
   "properties": {
-    "data_model_response": {
-      "type": "object",
-      "required": ["entities", "relationships"],
-      "properties": {
-        "entities": {
-          "type": "array",
-          "items": {
-            "type": "object",
-            "required": ["name", "title", "type", "properties"],
-            "properties": {
-              "name": {"type": "string"},
-              "title": {"type": "string"},
-              "type": {"enum": ["table", "view", "logical"]},
+    "entities": {
+      "type": "array",
+      "items": {
+        "type": "object",
+        "required": ["name", "title", "type", "properties"],
+        "properties": {
+          "name": {"type": "string"},
+          "title": {"type": "string"},
+          "type": {"enum": ["table", "view", "logical"]},
+          "properties": {
+            "type": "array",
+            "items": {
+              "type": "object",
+              "required": [
+                "name", "label", "type", "length", "accuracy",
+                "required", "is_primary_key", "is_associated"
+              ],
               "properties": {
-                "type": "array",
-                "items": {
-                  "type": "object",
-                  "required": [
-                    "name", "label", "type", "length", "accuracy",
-                    "required", "is_primary_key", "is_associated"
-                  ],
-                  "properties": {
-                    "name": {"type": "string"},
-                    "label": {"type": "string"},
-                    "type": {"type": "string"},
-                    "length": {"type": "integer", "minimum": 0},
-                    "accuracy": {"type": "integer", "minimum": 0},
-                    "required": {"type": "boolean"},
-                    "description": {"type": ["string", "null"]},
-                    "is_primary_key": {"type": "boolean"},
-                    "is_associated": {"type": "boolean"}
-                  }
-                }
+                "name": {"type": "string"},
+                "label": {"type": "string"},
+                "type": {"type": "string"},
+                "length": {"type": "integer", "minimum": 0},
+                "accuracy": {"type": "integer", "minimum": 0},
+                "required": {"type": "boolean"},
+                "description": {"type": ["string", "null"]},
+                "is_primary_key": {"type": "boolean"},
+                "is_associated": {"type": "boolean"}
               }
             }
           }
-        },
-        "relationships": {
-          "type": "array",
-          "items": {
-            "type": "object",
-            "required": ["entity", "related_entity", "cardinality", "relations"],
-            "properties": {
-              "entity": {"type": "string"},
-              "related_entity": {"type": "string"},
-              "cardinality": {
-                "enum": ["one_to_one", "many_to_many", "many_to_one", "one_to_many"]
-              },
-              "relations": {
-                "type": "array",
-                "items": {
-                  "type": "object",
-                  "required": ["property", "related_property"],
-                  "properties": {
-                    "property": {"type": "string"},
-                    "related_property": {"type": "string"}
-                  }
-                }
+        }
+      }
+    },
+    "relationships": {
+      "type": "array",
+      "items": {
+        "type": "object",
+        "required": ["entity", "related_entity", "cardinality", "relations"],
+        "properties": {
+          "entity": {"type": "string"},
+          "related_entity": {"type": "string"},
+          "cardinality": {
+            "enum": ["one_to_one", "many_to_many", "many_to_one", "one_to_many"]
+          },
+          "relations": {
+            "type": "array",
+            "items": {
+              "type": "object",
+              "required": ["property", "related_property"],
+              "properties": {
+                "property": {"type": "string"},
+                "related_property": {"type": "string"}
               }
             }
           }
         }
       }
     }
-  },
-  "required": ["data_model_response"]
+  }
 }
\ No newline at end of file
@@ -1,17 +1,28 @@
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, Field, model_validator
 
-from app.logger.logger import logger
+from app.logger.logger import get_logger
+from app.utils.batch_stream import MAX_BATCH_ITEMS
 from app.work_flow.data_model.schemas.domain_schemas.data_model_domains import \
   DataEntity, EntityRelationship
 from app.work_flow.user_story.schemas.domain_schemas.user_story_domains import \
   UserStories
 
+logger = get_logger(__name__)
+
 
 class DataModelGenerateRequest(BaseModel):
   user_story_result: UserStories
   human_requirements: str
+  # 为 False 时忽略已有草稿，始终完整重新生成
+  incremental: bool = True
+
+
+class DataModelBatchGenerateRequest(BaseModel):
+  items: List[DataModelGenerateRequest] = Field(min_length=1,
+                                                max_length=MAX_BATCH_ITEMS)
+  max_concurrency: Optional[int] = Field(default=None, ge=1)
 
 
 class DataModelRequest(BaseModel):
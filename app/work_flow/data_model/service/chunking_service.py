@@ -0,0 +1,155 @@
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.LLMs.similarity_cache import HashedNgramVectorizer, SparseVector, \
+  cosine_similarity
+from app.logger.logger import get_logger
+from app.utils.context_assembler import minify_json
+from app.utils.document_chunker import chunk_token_budget, pack_items
+from app.utils.token_estimator import estimate_tokens
+
+logger = get_logger(__name__)
+
+DEFAULT_STORY_CLUSTER_THRESHOLD = 0.2
+
+_vectorizer = HashedNgramVectorizer()
+
+
+def story_cluster_budget() -> int:
+  """
+  每个用户故事分组的 token 上限；数据模型的输出比输入的故事大得多，因此取分块上限的一半
+  """
+  return chunk_token_budget() // 2
+
+
+def story_cluster_threshold() -> float:
+  return float(os.environ.get("STORY_CLUSTER_THRESHOLD",
+                              DEFAULT_STORY_CLUSTER_THRESHOLD))
+
+
+def cluster_stories(
+    stories: List[Dict[str, Any]],
+    max_tokens: int,
+    threshold: Optional[float] = None
+) -> List[List[Dict[str, Any]]]:
+  """
+  按文本相似度把用户故事分组，使涉及同一批实体的故事尽量落在同一组；
+  每组不超过 max_tokens，过小的组再按顺序合并，减少调用次数
+  :param stories: 用户故事字典列表
+  :param max_tokens: 每组的 token 上限
+  :param threshold: 加入已有分组所需的最低相似度，默认取环境变量 STORY_CLUSTER_THRESHOLD
+  :return: 分组后的用户故事，故事总量不超过上限时只有一组
+  """
+  threshold = story_cluster_threshold() if threshold is None else threshold
+  costs = [estimate_tokens(minify_json(story)) for story in stories]
+  if sum(costs) <= max_tokens:
+    return [list(stories)] if stories else []
+
+  clusters: List[List[int]] = []
+  centroids: List[Dict[int, float]] = []
+  used: List[int] = []
+  for index, story in enumerate(stories):
+    vector = _vectorizer.vectorize(_story_text(story))
+    best, best_score = None, threshold
+    for cluster_index, centroid in enumerate(centroids):
+      if used[cluster_index] + costs[index] > max_tokens:
+        continue
+      score = cosine_similarity(vector, _normalized(centroid))
+      if score >= best_score:
+        best, best_score = cluster_index, score
+    if best is None:
+      clusters.append([])
+      centroids.append({})
+      used.append(0)
+      best = len(clusters) - 1
+    clusters[best].append(index)
+    used[best] += costs[index]
+    for feature, weight in vector.items():
+      centroids[best][feature] = centroids[best].get(feature, 0.0) + weight
+
+  packed = pack_items(clusters, lambda cluster: sum(costs[i] for i in cluster),
+                      max_tokens)
+  return [[stories[i] for cluster in group for i in cluster] for group in packed]
+
+
+def merge_data_models(cluster_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+  """
+  合并各分组生成的数据模型：同名实体（忽略大小写与下划线）合并为一个并补充缺少的字段，
+  关系按两端实体去重，反向的同一关系只保留一条
+  :param cluster_results: 按分组顺序排列的数据模型字典
+  :return: 合并后的数据模型字典
+  """
+  entities: List[Dict[str, Any]] = []
+  by_key: Dict[str, Dict[str, Any]] = {}
+  canonical_names: Dict[str, str] = {}
+  merged_entities = 0
+
+  for result in cluster_results:
+    for entity in result.get("entities", []):
+      key = entity_key(entity.get("name", ""))
+      kept = by_key.get(key)
+      if kept is None:
+        kept = dict(entity, properties=list(entity.get("properties", [])))
+        by_key[key] = kept
+        entities.append(kept)
+        canonical_names[key] = kept["name"]
+        continue
+      merged_entities += 1
+      property_names = {entity_key(prop.get("name", ""))
+                        for prop in kept["properties"]}
+      for prop in entity.get("properties", []):
+        if entity_key(prop.get("name", "")) not in property_names:
+          property_names.add(entity_key(prop.get("name", "")))
+          kept["properties"].append(prop)
+
+  relationships: List[Dict[str, Any]] = []
+  by_pair: Dict[Tuple[str, str], Dict[str, Any]] = {}
+  for result in cluster_results:
+    for relationship in result.get("relationships", []):
+      relationship = dict(relationship,
+                          relations=list(relationship.get("relations", [])))
+      for key in ("entity", "related_entity"):
+        name = relationship.get(key, "")
+        relationship[key] = canonical_names.get(entity_key(name), name)
+      pair = (entity_key(relationship["entity"]),
+              entity_key(relationship["related_entity"]))
+      kept = by_pair.get(pair)
+      if kept is None and (pair[1], pair[0]) in by_pair:
+        # 反向描述的同一关系，换成已保留关系的方向后再合并字段对应
+        kept = by_pair[(pair[1], pair[0])]
+        relationship["relations"] = [
+          {"property": relation.get("related_property"),
+           "related_property": relation.get("property")}
+          for relation in relationship["relations"]]
+      if kept is None:
+        by_pair[pair] = relationship
+        relationships.append(relationship)
+        continue
+      existing = {(relation.get("property"), relation.get("related_property"))
+                  for relation in kept["relations"]}
+      for relation in relationship["relations"]:
+        if (relation.get("property"), relation.get("related_property")) \
+            not in existing:
+          kept["relations"].append(relation)
+
+  logger.info("合并 %s 个分组的数据模型：实体 %s 个（合并重复 %s 个），关系 %s 个",
+              len(cluster_results), len(entities), merged_entities,
+              len(relationships))
+  return {"entities": entities, "relationships": relationships}
+
+
+def entity_key(name: str) -> str:
+  return re.sub(r"[\s_\-]+", "", name).lower()
+
+
+def _story_text(story: Dict[str, Any]) -> str:
+  return " ".join(str(story.get(key, "")) for key in
+                  ("function_name", "action", "value"))
+
+
+def _normalized(vector: Dict[int, float]) -> SparseVector:
+  norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+  return {feature: weight / norm for feature, weight in vector.items()} \
+    if norm else {}
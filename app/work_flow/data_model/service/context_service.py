@@ -0,0 +1,134 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.context_assembler import AssembledContext, draft_token_budget, \
+  load_history_text, may_affect_unnamed_items, mentioned_names, minify_json
+from app.utils.token_estimator import estimate_tokens
+from app.work_flow.data_model.schemas.domain_schemas.data_model_domains import \
+  DataEntity
+from app.work_flow.data_model.schemas.dto_schemas.data_model_requests import \
+  DataModelGenerateRequest
+from app.work_flow.data_model.schemas.dto_schemas.data_model_response import \
+  DataModelResponse
+
+WORKFLOW = "data_model"
+CONDENSED_NOTE = ("说明：为节省篇幅，以下实体与本次修改无关，仅列出了概要："
+                  "{names}。请在输出中保留这些实体（name 不变），"
+                  "系统会自动还原其完整定义。")
+
+
+async def assemble_data_model_context(
+    data_model_requirement: DataModelGenerateRequest,
+    draft: Dict[str, Any],
+    session_id: str,
+    allow_condense: bool = True
+) -> AssembledContext:
+  """
+  组装数据模型修改链的输入：压缩的草稿、压缩的用户故事与该会话最近的修改记录
+  :param data_model_requirement: 修改请求
+  :param draft: 当前的数据模型草稿
+  :param session_id: 会话 id
+  :param allow_condense: 是否允许精简无关实体，流式修改会直接推送模型输出，因此不精简
+  :return: 组装好的上下文
+  """
+  instruction = data_model_requirement.human_requirements
+  user_story_result = data_model_requirement.user_story_result
+  budget = draft_token_budget() if allow_condense else None
+  draft_text, condensed = condense_data_model_draft(draft, instruction, budget)
+
+  baseline_tokens = sum(estimate_tokens(text) for text in (
+    json.dumps(draft, indent=2, ensure_ascii=False),
+    str(user_story_result),
+    instruction,
+  ))
+  return AssembledContext(
+      inputs={
+        "user_story_result": minify_json(user_story_result.model_dump(mode="json")),
+        "data_model_draft": draft_text,
+        "conversation_history": await asyncio.to_thread(load_history_text,
+                                                        session_id, WORKFLOW),
+        "user_requirements": instruction,
+      },
+      baseline_tokens=baseline_tokens,
+      condensed=condensed,
+  )
+
+
+def condense_data_model_draft(
+    draft: Dict[str, Any],
+    instruction: str,
+    budget: Optional[int] = None
+) -> Tuple[str, List[str]]:
+  """
+  草稿超出预算、要求点名了实体且不会删除或统一修改其余实体时，只保留要求中提到的实体
+  及与其直接关联的实体的完整定义，其余实体先精简为字段名列表，仍超出预算时只保留名称与标题
+  :return: 草稿文本与被精简的实体名
+  """
+  full_text = minify_json(draft)
+  if budget is None or may_affect_unnamed_items(instruction) \
+      or estimate_tokens(full_text) <= budget:
+    return full_text, []
+
+  entities = draft.get("entities", [])
+  relationships = draft.get("relationships", [])
+  mentioned = mentioned_names(instruction, {
+    entity["name"]: (entity["name"], entity.get("title", ""))
+    for entity in entities
+  })
+  if not mentioned:
+    return full_text, []
+  touched = set(mentioned)
+  for relationship in relationships:
+    if relationship.get("entity") in mentioned or \
+        relationship.get("related_entity") in mentioned:
+      touched.update((relationship.get("entity"),
+                      relationship.get("related_entity")))
+
+  condensed = [entity["name"] for entity in entities
+               if entity["name"] not in touched]
+  if not condensed:
+    return full_text, []
+
+  def render(keep_properties: bool) -> str:
+    view_entities = []
+    for entity in entities:
+      if entity["name"] in touched:
+        view_entities.append(entity)
+        continue
+      view = {"name": entity["name"], "title": entity.get("title", "")}
+      if keep_properties:
+        view["type"] = entity.get("type")
+        view["properties"] = [prop["name"] for prop in entity.get("properties", [])]
+      view_entities.append(view)
+    note = CONDENSED_NOTE.format(names="、".join(condensed))
+    return note + "\n" + minify_json({"entities": view_entities,
+                                      "relationships": relationships})
+
+  draft_text = render(keep_properties=True)
+  if estimate_tokens(draft_text) > budget:
+    draft_text = render(keep_properties=False)
+  return draft_text, condensed
+
+
+def restore_condensed_entities(
+    data_model_result: DataModelResponse,
+    draft: Dict[str, Any],
+    condensed: List[str]
+) -> DataModelResponse:
+  """
+  用草稿中的完整定义替换模型输出里被精简的实体，模型遗漏的精简实体也一并补回；
+  要求可能删除或统一修改实体时不会精简草稿，因此补回的不会是用户要删除或要修改的实体
+  """
+  if not condensed:
+    return data_model_result
+  originals = {entity["name"]: entity for entity in draft.get("entities", [])
+               if entity["name"] in condensed}
+
+  entities = []
+  for entity in data_model_result.entities:
+    original = originals.pop(entity.name, None)
+    entities.append(DataEntity.model_validate(original) if original else entity)
+  entities.extend(DataEntity.model_validate(original)
+                  for original in originals.values())
+  return data_model_result.model_copy(update={"entities": entities})
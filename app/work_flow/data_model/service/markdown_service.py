@@ -0,0 +1,73 @@
+from typing import List, Optional
+
+from app.work_flow.data_model.schemas.domain_schemas.data_model_domains import \
+  DataEntity, EntityRelationship
+from app.work_flow.data_model.schemas.dto_schemas.data_model_requests import \
+  DataModelRequest
+
+TABLE_HEADER = "| 字段名 | 标签 | 类型 | 长度 | 精度 | 必填 | 主键 | 关联字段 | 描述 |"
+TABLE_DIVIDER = "|--------|------|------|------|------|------|------|----------|------|"
+
+
+def render_data_model_md(data_models: DataModelRequest) -> str:
+  """
+  按 JSON_TO_MD_PROMPT 约定的模版在本地将数据模型渲染为 Markdown，不经过 llm
+  :param data_models: 数据模型
+  :return: Markdown 文本
+  """
+  lines = ["### 数据模型", ""]
+
+  for entity in data_models.entities:
+    lines.extend(_render_entity(entity))
+
+  relationship_lines = [_render_relationship(relationship)
+                        for relationship in data_models.relationships]
+  if relationship_lines:
+    lines.extend(relationship_lines)
+    lines.append("")
+
+  return "\n".join(lines).rstrip() + "\n"
+
+
+def _render_entity(entity: DataEntity) -> List[str]:
+  lines = [f"#### {_escape_cell(entity.title or entity.name)}", ""]
+  if not entity.properties:
+    return lines
+
+  lines.append(TABLE_HEADER)
+  lines.append(TABLE_DIVIDER)
+  for prop in entity.properties:
+    cells = [
+      prop.name,
+      prop.label,
+      prop.type,
+      _positive_or_blank(prop.length),
+      _positive_or_blank(prop.accuracy),
+      str(prop.required),
+      str(prop.is_primary_key),
+      str(prop.is_associated),
+      prop.description,
+    ]
+    lines.append("| " + " | ".join(_escape_cell(cell) for cell in cells) + " |")
+  lines.append("")
+  return lines
+
+
+def _render_relationship(relationship: EntityRelationship) -> str:
+  sentence = (f"{relationship.entity} 与 {relationship.related_entity} "
+              f"之间是 {relationship.cardinality.value} 关系。")
+  if relationship.relations:
+    pairs = "、".join(f"{relation.property} ↔ {relation.related_property}"
+                     for relation in relationship.relations)
+    sentence += f"通过 {pairs} 关联。"
+  return sentence
+
+
+def _positive_or_blank(value: int) -> str:
+  return str(value) if value and value > 0 else ""
+
+
+def _escape_cell(value: Optional[str]) -> str:
+  if value is None:
+    return ""
+  return str(value).replace("|", "\\|").replace("\r", " ").replace("\n", " ")
@@ -1,61 +1,109 @@
-from pathlib import Path
+from typing import List
 
-from app.logger.logger import logger
-from app.utils.outcome_handler import outcome_querier, outcome_writer
+from app.logger.logger import get_logger
+from app.storage.draft_versions import draft_versioning
+from app.storage.version_schemas import DraftVersion, DraftVersionDiff
+from app.utils.outcome_handler import DocumentView, outcome_view, \
+  outcome_writer
 from app.utils.schema_verifier import validate_json_str
 from app.work_flow.data_model.chain.prompts.data_model_templates import \
   DATA_ENTITY_VALIDATION_SCHEMA
 from app.work_flow.data_model.schemas.dto_schemas.data_model_requests import \
-  DataModelGenerateRequest, DataModelSaveRequest, DataModelRequest
+  DataModelSaveRequest, DataModelRequest
 from app.work_flow.data_model.schemas.dto_schemas.data_model_response import \
   DataModelResponse
 
-draft_path = Path("./work_flow/data_model/outcomes/draft")
-draft_file_path = draft_path / "data_model_draft.json"
-result_path = Path("./work_flow/data_model/outcomes/result")
-result_file_path = result_path / "data_model_result.json"
+logger = get_logger(__name__)
 
-def query_data_model_draft() -> DataModelResponse:
+DRAFT_DOCUMENT = "data_model_draft"
+RESULT_DOCUMENT = "data_model_result"
+# 草稿中每个实体来自哪些用户故事，用于增量重新生成
+PROVENANCE_DOCUMENT = "data_model_provenance"
+
+async def query_data_model_draft(session_id: str) -> DocumentView:
   logger.info("开始获取数据模型草稿")
-  draft_content = outcome_querier(draft_file_path)
-  draft = DataModelResponse.model_validate_json(draft_content)
+  view = await outcome_view(session_id, DRAFT_DOCUMENT, DataModelResponse)
   logger.info("成功获取数据模型草稿")
-  return draft
+  return view
 
-def query_data_model_result() -> DataModelResponse:
+async def query_data_model_result(session_id: str) -> DocumentView:
   logger.info("开始获取数据模型成果")
-  result_content = outcome_querier(result_file_path)
-  result = DataModelResponse.model_validate_json(result_content)
-  logger.info("成功获取用户故事成果")
-  return result
+  view = await outcome_view(session_id, RESULT_DOCUMENT, DataModelResponse)
+  logger.info("成功获取数据模型成果")
+  return view
 
 
-async def update_data_model_draft(modified_draft: DataModelRequest) -> None:
+async def update_data_model_draft(
+    modified_draft: DataModelRequest,
+    session_id: str
+) -> None:
   logger.info("开始上传被修改的数据模型草稿")
   content = modified_draft.model_dump(include={"entities", "relationships"}, mode="json")
   is_success, info_str = validate_json_str(content, DATA_ENTITY_VALIDATION_SCHEMA)
   if not is_success:
     logger.error(info_str)
-  await outcome_writer(draft_file_path, content)
+  await outcome_writer(session_id, DRAFT_DOCUMENT, content, versioned=True)
   logger.info("成功修改数据模型草稿")
 
 
-async def save_data_model_draft(request: DataModelSaveRequest) -> None:
+async def save_data_model_draft(
+    request: DataModelSaveRequest,
+    session_id: str
+) -> None:
   if request.save_as_draft:
     logger.info("保存草稿")
-    draft_path.mkdir(parents=True, exist_ok=True)
-    await outcome_writer(draft_file_path,
+    await outcome_writer(session_id, DRAFT_DOCUMENT,
                          request.model_dump(
                              include={"entities", "relationships"},
                              mode="json"
-                         ))
+                         ),
+                         versioned=True)
   elif request.save_as_result:
     logger.info("将草稿储存为成果")
-    result_path.mkdir(parents=True, exist_ok=True)
-    await outcome_writer(result_file_path,
+    await outcome_writer(session_id, RESULT_DOCUMENT,
                          request.model_dump(
                              include={"entities", "relationships"},
                              mode="json"
                          ))
   else:
-    logger.info("放弃储存草稿")
\ No newline at end of file
+    logger.info("放弃储存草稿")
+
+
+async def list_data_model_draft_versions(session_id: str) -> List[DraftVersion]:
+  logger.info("开始获取数据模型草稿的版本列表")
+  versions = await draft_versioning.list_versions(session_id, DRAFT_DOCUMENT)
+  return [DraftVersion.model_validate(version) for version in versions]
+
+
+async def query_data_model_draft_version(
+    session_id: str,
+    version: int
+) -> DataModelResponse:
+  logger.info("开始获取数据模型草稿的第 %s 版", version)
+  content = await draft_versioning.get_version(session_id, DRAFT_DOCUMENT,
+                                               version)
+  return DataModelResponse.model_validate(content)
+
+
+async def diff_data_model_draft_versions(
+    session_id: str,
+    from_version: int,
+    to_version: int
+) -> DraftVersionDiff:
+  logger.info("开始比较数据模型草稿的第 %s 版与第 %s 版", from_version, to_version)
+  patch = await draft_versioning.diff_versions(session_id, DRAFT_DOCUMENT,
+                                               from_version, to_version)
+  return DraftVersionDiff(from_version=from_version, to_version=to_version,
+                          patch=patch)
+
+
+async def restore_data_model_draft_version(
+    session_id: str,
+    version: int
+) -> DataModelResponse:
+  logger.info("开始将数据模型草稿恢复到第 %s 版", version)
+  content = await draft_versioning.get_version(session_id, DRAFT_DOCUMENT,
+                                               version)
+  await outcome_writer(session_id, DRAFT_DOCUMENT, content, versioned=True)
+  logger.info("成功将数据模型草稿恢复到第 %s 版", version)
+  return DataModelResponse.model_validate(content)
\ No newline at end of file
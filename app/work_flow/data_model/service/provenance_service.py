@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.logger.logger import get_logger
+from app.utils.context_assembler import mentioned_names, minify_json
+from app.utils.outcome_handler import outcome_querier, outcome_writer
+from app.work_flow.data_model.service.chunking_service import entity_key, \
+  merge_data_models
+from app.work_flow.data_model.service.outcomes_service import DRAFT_DOCUMENT, \
+  PROVENANCE_DOCUMENT
+
+logger = get_logger(__name__)
+
+DEFAULT_INCREMENTAL_MAX_RATIO = 0.5
+NONE_TEXT = "无"
+
+
+@dataclass
+class StoryDiff:
+  added: List[Dict[str, Any]] = field(default_factory=list)
+  changed: List[Dict[str, Any]] = field(default_factory=list)
+  removed: List[str] = field(default_factory=list)
+  unchanged: List[str] = field(default_factory=list)
+
+  @property
+  def touched(self) -> List[Dict[str, Any]]:
+    return self.added + self.changed
+
+  @property
+  def size(self) -> int:
+    return len(self.added) + len(self.changed) + len(self.removed)
+
+
+@dataclass
+class IncrementalPlan:
+  """
+  增量重新生成的计划：affected 交给 llm 重新设计，dropped 只服务于被删除的故事，直接删除
+  """
+  draft: Dict[str, Any]
+  diff: StoryDiff
+  affected: List[str]
+  dropped: List[str]
+
+  @property
+  def needs_llm(self) -> bool:
+    return bool(self.diff.touched)
+
+
+def incremental_max_ratio() -> float:
+  """
+  变更的用户故事超过该比例时直接完整重新生成
+  """
+  return float(os.environ.get("DATA_MODEL_INCREMENTAL_MAX_RATIO",
+                              DEFAULT_INCREMENTAL_MAX_RATIO))
+
+
+def story_fingerprint(story: Dict[str, Any]) -> str:
+  return hashlib.sha256(minify_json(story).encode("utf-8")).hexdigest()[:16]
+
+
+def build_provenance(
+    stories: List[Dict[str, Any]],
+    data_model_dict: Dict[str, Any],
+    human_requirements: str
+) -> Dict[str, Any]:
+  """
+  记录生成草稿所用的用户故事，以及每个实体来自哪些故事：
+  故事的功能名、操作或价值中提到了实体的名称或标题，即认为该实体来自这个故事
+  :param stories: 生成草稿所用的用户故事
+  :param data_model_dict: 生成的数据模型
+  :param human_requirements: 生成时的额外要求
+  :return: 溯源文档
+  """
+  sources: Dict[str, List[str]] = {entity["name"]: []
+                                   for entity in data_model_dict["entities"]}
+  aliases = _entity_aliases(data_model_dict)
+  for story in stories:
+    for name in mentioned_names(_story_text(story), aliases):
+      sources[name].append(story["function_name"])
+  return {
+    "human_requirements": human_requirements,
+    "stories": {story["function_name"]: story_fingerprint(story)
+                for story in stories},
+    "entities": sources,
+  }
+
+
+def diff_stories(
+    provenance: Dict[str, Any],
+    stories: List[Dict[str, Any]]
+) -> StoryDiff:
+  """
+  按功能名对比生成草稿时的用户故事与当前的用户故事
+  """
+  previous: Dict[str, str] = provenance.get("stories", {})
+  diff = StoryDiff()
+  for story in stories:
+    fingerprint = previous.get(story["function_name"])
+    if fingerprint is None:
+      diff.added.append(story)
+    elif fingerprint != story_fingerprint(story):
+      diff.changed.append(story)
+    else:
+      diff.unchanged.append(story["function_name"])
+  current = {story["function_name"] for story in stories}
+  diff.removed = [name for name in previous if name not in current]
+  return diff
+
+
+def plan_incremental(
+    provenance: Dict[str, Any],
+    draft: Dict[str, Any],
+    stories: List[Dict[str, Any]],
+    human_requirements: str
+) -> Optional[IncrementalPlan]:
+  """
+  :return: 增量计划；用户故事与额外要求都没有变化（用户要求重新生成）、额外要求变化
+    或变更过多时返回 None，表示需要完整重新生成
+  """
+  if provenance.get("human_requirements") != human_requirements:
+    logger.info("额外要求有变化，完整重新生成数据模型")
+    return None
+  diff = diff_stories(provenance, stories)
+  if diff.size == 0:
+    logger.info("用户故事没有变化，按重新生成的要求完整生成数据模型")
+    return None
+  total = max(len(provenance.get("stories", {})), len(stories), 1)
+  if diff.size / total > incremental_max_ratio():
+    logger.info("%s/%s 个用户故事有变化，完整重新生成数据模型", diff.size, total)
+    return None
+
+  sources: Dict[str, List[str]] = provenance.get("entities", {})
+  draft_names = [entity["name"] for entity in draft.get("entities", [])]
+  touched_names = {story["function_name"] for story in diff.changed}
+  removed_names = set(diff.removed)
+
+  affected = set()
+  dropped = set()
+  for name in draft_names:
+    origins = set(sources.get(name, []))
+    if origins & touched_names:
+      affected.add(name)
+    elif origins and origins <= removed_names:
+      dropped.add(name)
+  # 新增或修改后的故事提到的已有实体也需要重新设计
+  aliases = _entity_aliases(draft)
+  for story in diff.touched:
+    affected.update(mentioned_names(_story_text(story), aliases))
+  dropped -= affected
+
+  return IncrementalPlan(
+      draft=draft,
+      diff=diff,
+      affected=[name for name in draft_names if name in affected],
+      dropped=[name for name in draft_names if name in dropped],
+  )
+
+
+async def load_incremental_plan(
+    session_id: str,
+    stories: List[Dict[str, Any]],
+    human_requirements: str
+) -> Optional[IncrementalPlan]:
+  """
+  读取当前草稿及其溯源文档并生成增量计划，没有可用的草稿时返回 None
+  """
+  try:
+    provenance = json.loads(await outcome_querier(session_id, PROVENANCE_DOCUMENT))
+    draft = json.loads(await outcome_querier(session_id, DRAFT_DOCUMENT))
+  except (FileNotFoundError, json.JSONDecodeError):
+    logger.info("会话 %s 没有可增量更新的数据模型草稿", session_id)
+    return None
+  return plan_incremental(provenance, draft, stories, human_requirements)
+
+
+def incremental_chain_input(
+    plan: IncrementalPlan,
+    user_requirements: str
+) -> Dict[str, str]:
+  affected = set(plan.affected)
+  affected_entities = [entity for entity in plan.draft.get("entities", [])
+                       if entity["name"] in affected]
+  unchanged_entities = [
+    {"name": entity["name"], "title": entity.get("title", ""),
+     "properties": [prop["name"] for prop in entity.get("properties", [])]}
+    for entity in plan.draft.get("entities", [])
+    if entity["name"] not in affected and entity["name"] not in plan.dropped
+  ]
+  return {
+    "changed_stories": minify_json(plan.diff.touched),
+    "removed_stories": "、".join(plan.diff.removed) or NONE_TEXT,
+    "affected_entities": minify_json(affected_entities)
+    if affected_entities else NONE_TEXT,
+    "unchanged_entities": minify_json(unchanged_entities)
+    if unchanged_entities else NONE_TEXT,
+    "user_requirements": user_requirements,
+  }
+
+
+def splice_data_model(
+    plan: IncrementalPlan,
+    regenerated: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+  """
+  把重新生成的实体拼回草稿：未受影响的实体与关系原样保留，
+  llm 输出中与未受影响实体同名的实体会被忽略
+  :param plan: 增量计划
+  :param regenerated: llm 重新生成的部分数据模型，只删除实体时为 None
+  :return: 拼接后的数据模型，关系可能引用已删除的实体，需要再经过修复
+  """
+  replaced = set(plan.affected) | set(plan.dropped)
+  kept = {
+    "entities": [entity for entity in plan.draft.get("entities", [])
+                 if entity["name"] not in replaced],
+    "relationships": [relationship
+                      for relationship in plan.draft.get("relationships", [])
+                      if relationship.get("entity") not in replaced
+                      and relationship.get("related_entity") not in replaced],
+  }
+  if regenerated is None:
+    return kept
+  kept_keys = {entity_key(entity["name"]) for entity in kept["entities"]}
+  fresh = {
+    "entities": [entity for entity in regenerated.get("entities") or []
+                 if isinstance(entity, dict)
+                 and entity_key(str(entity.get("name", ""))) not in kept_keys],
+    "relationships": [relationship
+                      for relationship in regenerated.get("relationships") or []
+                      if isinstance(relationship, dict)],
+  }
+  return merge_data_models([kept, fresh])
+
+
+async def write_data_model_provenance(
+    stories: List[Dict[str, Any]],
+    data_model_dict: Dict[str, Any],
+    human_requirements: str,
+    session_id: str
+) -> None:
+  try:
+    await outcome_writer(session_id, PROVENANCE_DOCUMENT,
+                         build_provenance(stories, data_model_dict,
+                                          human_requirements))
+  except OSError as e:
+    logger.error("写入数据模型溯源文件失败：%s", e)
+
+
+def _entity_aliases(data_model_dict: Dict[str, Any]) -> Dict[str, tuple]:
+  return {entity["name"]: (entity["name"], entity.get("title", ""))
+          for entity in data_model_dict.get("entities", [])}
+
+
+def _story_text(story: Dict[str, Any]) -> str:
+  return " ".join(str(story.get(key, "")) for key in
+                  ("function_name", "action", "value"))
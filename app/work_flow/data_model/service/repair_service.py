@@ -0,0 +1,149 @@
+import copy
+import re
+from typing import Any, Dict, Optional
+
+from app.logger.logger import get_logger
+from app.work_flow.data_model.schemas.domain_schemas.data_model_domains import \
+  Cardinalities, EntityType
+
+logger = get_logger(__name__)
+
+CARDINALITY_ALIASES = {
+  "1:1": Cardinalities.OneToOne, "1对1": Cardinalities.OneToOne,
+  "一对一": Cardinalities.OneToOne,
+  "1:n": Cardinalities.OneToMany, "1对多": Cardinalities.OneToMany,
+  "一对多": Cardinalities.OneToMany,
+  "n:1": Cardinalities.ManyToOne, "多对1": Cardinalities.ManyToOne,
+  "多对一": Cardinalities.ManyToOne,
+  "n:m": Cardinalities.ManyToMany, "m:n": Cardinalities.ManyToMany,
+  "n:n": Cardinalities.ManyToMany, "多对多": Cardinalities.ManyToMany,
+}
+
+ENTITY_TYPE_ALIASES = {
+  "表": EntityType.TYPE_TABLE, "数据表": EntityType.TYPE_TABLE,
+  "视图": EntityType.TYPE_VIEW,
+  "逻辑": EntityType.TYPE_LOGICAL, "逻辑实体": EntityType.TYPE_LOGICAL,
+}
+
+PROPERTY_DEFAULTS = {
+  "length": 0,
+  "accuracy": 0,
+  "required": False,
+  "description": None,
+  "is_primary_key": False,
+  "is_associated": False,
+}
+
+
+def fix_data_model(data_model: Dict[str, Any]) -> Dict[str, Any]:
+  """
+  对 llm 输出的数据模型做确定性的修正：规范枚举值、补全字段默认值、
+  修正或删除引用了不存在实体的关系。不会修改传入的对象
+  :param data_model: llm 输出的数据模型字典
+  :return: 修正后的数据模型字典
+  """
+  fixed = copy.deepcopy(data_model)
+  entities = [entity for entity in fixed.get("entities") or []
+              if isinstance(entity, dict)]
+  relationships = [relationship for relationship in fixed.get("relationships") or []
+                   if isinstance(relationship, dict)]
+
+  for entity in entities:
+    if not entity.get("title") and entity.get("name"):
+      entity["title"] = entity["name"]
+    entity_type = _normalize_entity_type(entity.get("type"))
+    if entity_type is not None:
+      entity["type"] = entity_type
+    properties = entity.get("properties")
+    if properties is None:
+      entity["properties"] = properties = []
+    for prop in properties:
+      if isinstance(prop, dict):
+        _fix_property(prop)
+
+  entity_names = {entity.get("name") for entity in entities}
+  lookup = {}
+  for entity in entities:
+    for alias in (entity.get("name"), entity.get("title")):
+      if isinstance(alias, str):
+        lookup.setdefault(alias.strip().lower(), entity.get("name"))
+
+  kept_relationships = []
+  for relationship in relationships:
+    cardinality = _normalize_cardinality(relationship.get("cardinality"))
+    if cardinality is not None:
+      relationship["cardinality"] = cardinality
+    if relationship.get("relations") is None:
+      relationship["relations"] = []
+
+    resolved = True
+    for key in ("entity", "related_entity"):
+      name = relationship.get(key)
+      if name in entity_names:
+        continue
+      matched = lookup.get(name.strip().lower()) if isinstance(name, str) else None
+      if matched is None:
+        resolved = False
+        break
+      relationship[key] = matched
+    if resolved or not entities:
+      kept_relationships.append(relationship)
+    else:
+      logger.info("删除引用了不存在实体的关系：%s - %s",
+                  relationship.get('entity'), relationship.get('related_entity'))
+
+  fixed["entities"] = entities
+  fixed["relationships"] = kept_relationships
+  return fixed
+
+
+def _fix_property(prop: Dict[str, Any]) -> None:
+  for key, default in PROPERTY_DEFAULTS.items():
+    if key not in prop:
+      prop[key] = default
+  if not prop.get("label") and prop.get("name"):
+    prop["label"] = prop["name"]
+  for key in ("length", "accuracy"):
+    value = prop[key]
+    if value is None:
+      prop[key] = 0
+    elif isinstance(value, str) and value.strip().isdigit():
+      prop[key] = int(value.strip())
+    elif isinstance(value, float) and value.is_integer():
+      prop[key] = int(value)
+    if isinstance(prop[key], int) and prop[key] < 0:
+      prop[key] = 0
+  for key in ("required", "is_primary_key", "is_associated"):
+    value = prop[key]
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+      prop[key] = value.strip().lower() == "true"
+    elif value is None:
+      prop[key] = False
+
+
+def _normalize_cardinality(value: Any) -> Optional[str]:
+  if not isinstance(value, str):
+    return None
+  compact = value.strip().replace(" ", "").lower()
+  if compact in CARDINALITY_ALIASES:
+    return CARDINALITY_ALIASES[compact].value
+  # OneToMany / one-to-many / ONE_TO_MANY / Cardinalities.OneToMany
+  snake = re.sub(r"(?<=[a-z])(?=[A-Z])", "_", value.strip().split(".")[-1])
+  snake = re.sub(r"[\s\-]+", "_", snake).lower()
+  if snake in {cardinality.value for cardinality in Cardinalities}:
+    return snake
+  return None
+
+
+def _normalize_entity_type(value: Any) -> Optional[str]:
+  if not isinstance(value, str):
+    return None
+  stripped = value.strip()
+  if stripped in ENTITY_TYPE_ALIASES:
+    return ENTITY_TYPE_ALIASES[stripped].value
+  # TYPE_TABLE / EntityType.TYPE_VIEW / Table
+  lowered = stripped.split(".")[-1].lower()
+  lowered = lowered[len("type_"):] if lowered.startswith("type_") else lowered
+  if lowered in {entity_type.value for entity_type in EntityType}:
+    return lowered
+  return None
@@ -54,6 +54,7 @@ USER_STORY_VALIDATION_SCHEMA = {
             "items": {
                 "type": "object",
                 "properties": {
+                    "function_name": {"type": "string"},
                     "role": {"type": "string"},
                     "action": {"type": "string"},
                     "value": {"type": "string"},
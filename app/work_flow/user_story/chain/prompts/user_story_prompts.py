@@ -43,10 +43,7 @@ STORY_UPDATE_PROMPT = ChatPromptTemplate.from_messages([
         # 用户故事生成协议
 
     您是一位经验丰富的产品经理。请在给出的用户故事草稿和用户的改进要求下修改用户故事的草稿，然后将用户故事草稿和新增填的用户故事一起输出。
-    
-    ## 用户故事草稿
-    
-    {{user_stories_draft}}
+
 
     ## 规则
 
@@ -71,8 +68,30 @@ STORY_UPDATE_PROMPT = ChatPromptTemplate.from_messages([
     {examples}""".format(
         schema=USER_STORY_SCHEMA,
         examples=USER_STORY_SCHEMA_EXAMPLES
-    ).replace("{{user_stories_draft}}","{user_stories_draft}")),
-    ("human", "User stories modification suggestions: {user_stories_modification_suggestions}")
+    )),
+    # 会变化的内容放在静态的系统提示词之后，使系统提示词可以被服务端的前缀缓存命中
+    ("human", """## 用户故事草稿
+{user_stories_draft}
+
+## 历史修改记录
+{conversation_history}
+
+User stories modification suggestions: {user_stories_modification_suggestions}""")
+])
+
+
+STORY_REPAIR_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """您是一位经验丰富的产品经理。下面的 JSON 片段取自一组用户故事，但不符合给定的结构。
+
+请只修正列出的错误，保持其余内容不变，文字内容使用汉字，只输出修正后的 JSON 片段，不要输出任何解释。
+
+## 片段应符合的结构（JSON Schema）
+{fragment_schema}"""),
+    ("human", """## 错误
+{errors}
+
+## 片段
+{fragment}""")
 ])
 
 
@@ -1,101 +1,322 @@
-from pathlib import Path
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, \
+  Optional
 
-import aiofiles
 import json
 
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 
-from app.logger.logger import logger
+from app.logger.logger import get_logger
 from app.work_flow.user_story.chain.prompts.user_stories_templates import \
   USER_STORY_VALIDATION_SCHEMA
 from app.work_flow.user_story.chain.prompts.user_story_prompts import \
-  STORY_GENERATION_PROMPT, STORY_UPDATE_PROMPT, JSON_TO_MD_PROMPT
-from app.LLMs.LLM import llm
+  STORY_GENERATION_PROMPT, STORY_UPDATE_PROMPT, STORY_REPAIR_PROMPT, \
+  JSON_TO_MD_PROMPT
+from app.LLMs.chain_registry import chain_registry
+from app.LLMs.model_registry import ModelTier
+from app.LLMs.model_router import routed_llm
+from app.LLMs.chain_runner import run_chain, run_chain_as_completed, \
+  stream_chain
+from app.LLMs.similarity_cache import build_similarity_cache
 from app.work_flow.user_story.schemas.dto_schemas.user_story_requests import \
   UserStoryGenerateRequest, UserStoryUpdateRequest, UserStoryRequest
 from app.work_flow.user_story.schemas.dto_schemas.user_story_response import \
   UserStoriesResponse
+from app.work_flow.user_story.service.chunking_service import \
+  merge_user_stories, section_requirements
+from app.work_flow.user_story.service.context_service import WORKFLOW, \
+  assemble_user_stories_context, restore_condensed_stories
+from app.work_flow.user_story.service.markdown_service import \
+  render_user_stories_md
+from app.work_flow.user_story.service.outcomes_service import DRAFT_DOCUMENT
+from app.work_flow.user_story.service.repair_service import fix_user_stories
 from app.utils.base_model_converter import base_model_to_dict
+from app.utils.context_assembler import changed_names, record_modification
+from app.utils.document_chunker import chunk_max_concurrency, \
+  chunk_token_budget, split_sections
 from app.utils.env_validator import env_varies_validator
-from app.utils.outcome_handler import outcome_querier
-from app.utils.schema_verifier import validate_json_str
+from app.utils.metrics import stage_timer
+from app.utils.outcome_handler import outcome_querier, outcome_writer
+from app.utils.output_repair import StructuredOutputRepairer
+from app.utils.session_resolver import DEFAULT_SESSION_ID
+from app.utils.schema_verifier import schema_validators, validate_json_str
+from app.utils.sse_stream import CompletedItemTracker, format_sse
 
+logger = get_logger(__name__)
 
-draft_path = Path("./work_flow/user_story/outcomes/draft")
-draft_file_path = draft_path / "user_stories_draft.json"
 
+# 链在首次使用或启动预热时才构建
+# include_raw 保留原始输出，解析失败时交给修复流程而不是直接报错
+generate_story_chain = chain_registry.register(
+    "user_stories.generate",
+    lambda: STORY_GENERATION_PROMPT
+            | routed_llm(ModelTier.Standard, UserStoriesResponse, include_raw=True))
 
-generate_story_chain = (
-    STORY_GENERATION_PROMPT
-    | llm.with_structured_output(UserStoriesResponse)
-)
+update_user_story_chain = chain_registry.register(
+    "user_stories.modify",
+    lambda: STORY_UPDATE_PROMPT
+            | routed_llm(ModelTier.Standard, UserStoriesResponse, include_raw=True))
 
-update_user_story_chain = (
-  STORY_UPDATE_PROMPT
-  | llm.with_structured_output(UserStoriesResponse)
-)
+# 流式链以 json schema 字典作为结构，输出由 JsonOutputParser 逐步解析为部分对象
+generate_story_stream_chain = chain_registry.register(
+    "user_stories.generate_stream",
+    lambda: STORY_GENERATION_PROMPT
+            | routed_llm(ModelTier.Standard, UserStoriesResponse.model_json_schema()))
 
-json_to_md_chain = (
-  JSON_TO_MD_PROMPT
-  | llm
-  | StrOutputParser()
+update_user_story_stream_chain = chain_registry.register(
+    "user_stories.modify_stream",
+    lambda: STORY_UPDATE_PROMPT
+            | routed_llm(ModelTier.Standard, UserStoriesResponse.model_json_schema()))
+
+json_to_md_chain = chain_registry.register(
+    "user_stories.json_to_md",
+    lambda: JSON_TO_MD_PROMPT | routed_llm(ModelTier.Light) | StrOutputParser())
+
+story_repair_chain = chain_registry.register(
+    "user_stories.repair",
+    lambda: STORY_REPAIR_PROMPT | routed_llm(ModelTier.Light) | JsonOutputParser())
+
+# 启动时编译校验用的 schema，之后每次校验直接复用
+schema_validators.register(USER_STORY_VALIDATION_SCHEMA)
+
+# 需求文本相近时直接复用之前的生成结果，未开启时为 None
+user_stories_similarity_cache = build_similarity_cache("用户故事")
+
+user_stories_repairer = StructuredOutputRepairer(
+    name="用户故事",
+    response_model=UserStoriesResponse,
+    schema=USER_STORY_VALIDATION_SCHEMA,
+    local_fixer=fix_user_stories,
+    repair_chain=story_repair_chain,
+    fragment_keys=("stories",),
+    workflow=WORKFLOW,
 )
 
 
 async def generate_user_stories(
-    user_stories_requirements: UserStoryGenerateRequest
+    user_stories_requirements: UserStoryGenerateRequest,
+    session_id: str = DEFAULT_SESSION_ID
 ) -> UserStoriesResponse:
   env_varies_validator()
   logger.info("开始生成用户故事")
-  stories_result = await (generate_story_chain
-                          .ainvoke({"user_stories_requirements": user_stories_requirements}))
-  stories_result_dict = user_story_format_verifier(stories_result)
-  await write_user_stories_draft(stories_result_dict)
+  requirements_text = user_stories_requirements.requirements
+  hit = await user_stories_similarity_cache.lookup(session_id, requirements_text) \
+    if user_stories_similarity_cache is not None else None
+  if hit is not None:
+    stories_result = UserStoriesResponse.model_validate(hit.result)
+    stories_result_dict = user_story_format_verifier(stories_result)
+  else:
+    sections = split_sections(requirements_text, chunk_token_budget())
+    if len(sections) > 1:
+      stories_result = await generate_user_stories_by_sections(sections)
+    else:
+      stories_result = await user_stories_repairer.repair(
+          await run_chain(generate_story_chain(),
+                          {"user_stories_requirements": user_stories_requirements}))
+    stories_result_dict = user_story_format_verifier(stories_result)
+    if user_stories_similarity_cache is not None:
+      await user_stories_similarity_cache.store(session_id, requirements_text,
+                                                stories_result_dict)
+  await write_user_stories_draft(stories_result_dict, session_id)
   logger.info("用户故事生成完成")
   return stories_result
 
 
+async def generate_user_stories_by_sections(
+    sections: List[str]
+) -> UserStoriesResponse:
+  """
+  需求文档过长时按章节分块并发生成用户故事，再合并去重；耗时取决于最大的分块而不是整篇文档
+  :param sections: 按顺序排列的需求分块
+  :return: 合并后的用户故事
+  """
+  logger.info("需求文档较长，分为 %s 个分块并发生成用户故事", len(sections))
+  chain_inputs = [
+    {"user_stories_requirements": UserStoryGenerateRequest(
+        requirements=section_requirements(section, index, len(sections)))}
+    for index, section in enumerate(sections)
+  ]
+  section_results: List[Optional[dict]] = [None] * len(sections)
+  async with aclosing(run_chain_as_completed(
+      generate_story_chain(),
+      chain_inputs,
+      chunk_max_concurrency()
+  )) as outcomes:
+    async for index, outcome in outcomes:
+      if isinstance(outcome, Exception):
+        logger.error("第 %s 个需求分块生成用户故事失败：%s", index + 1, outcome)
+        raise outcome
+      section_results[index] = (
+          await user_stories_repairer.repair(outcome)).model_dump(mode="json")
+  return UserStoriesResponse.model_validate(merge_user_stories(section_results))
+
+
+async def generate_user_stories_batch(
+    user_stories_requirements: List[UserStoryGenerateRequest],
+    max_concurrency: int
+) -> AsyncIterator[Dict[str, Any]]:
+  """
+  并发生成多份需求文档的用户故事，按完成顺序逐条返回；单条失败不影响其他条目，也不写入草稿
+  """
+  logger.info("开始批量生成用户故事，共 %s 条，并发上限 %s",
+              len(user_stories_requirements), max_concurrency)
+  chain_inputs = [{"user_stories_requirements": requirement}
+                  for requirement in user_stories_requirements]
+  async with aclosing(run_chain_as_completed(
+      generate_story_chain(),
+      chain_inputs,
+      max_concurrency
+  )) as outcomes:
+    async for index, outcome in outcomes:
+      try:
+        if isinstance(outcome, Exception):
+          raise outcome
+        stories_result = await user_stories_repairer.repair(outcome)
+        yield {"index": index, "ok": True,
+               "result": user_story_format_verifier(stories_result)}
+      except Exception as e:
+        logger.error("批量生成用户故事第 %s 条失败：%s", index, e)
+        yield {"index": index, "ok": False, "error": str(e)}
+  logger.info("用户故事批量生成结束")
+
+
 async def modify_user_stories_draft(
-    user_stories_requirements: UserStoryUpdateRequest
+    user_stories_requirements: UserStoryUpdateRequest,
+    session_id: str = DEFAULT_SESSION_ID
 ) -> UserStoriesResponse:
   env_varies_validator()
-  draft = outcome_querier(draft_file_path)
+  draft = json.loads(await outcome_querier(session_id, DRAFT_DOCUMENT))
+  context = await assemble_user_stories_context(user_stories_requirements,
+                                                draft, session_id)
   logger.info("开始根据草稿修改用户故事")
-  updated_user_stories_result = await (update_user_story_chain
-                                       .ainvoke({
-    "user_stories_draft": draft,
-    "user_stories_modification_suggestions": user_stories_requirements
-  }))
-  user_story_format_verifier(updated_user_stories_result)
+  updated_user_stories_result = await user_stories_repairer.repair(
+      await run_chain(update_user_story_chain(), context.inputs))
+  updated_user_stories_result = restore_condensed_stories(
+      updated_user_stories_result, draft, context.condensed)
+  updated_user_stories_dict = user_story_format_verifier(updated_user_stories_result)
+  await record_modification(
+      session_id, WORKFLOW, user_stories_requirements.requirements,
+      changed_names(draft.get("stories", []),
+                    updated_user_stories_dict["stories"], "function_name"),
+      context)
   logger.info("成功根据草稿修改用户故事")
   return updated_user_stories_result
 
 
-async def write_user_stories_draft(stories_result_dict: dict) -> None:
-  logger.info("开始记录用户故事的草稿")
+async def stream_user_stories_generation(
+    user_stories_requirements: UserStoryGenerateRequest,
+    session_id: str = DEFAULT_SESSION_ID
+) -> AsyncIterator[str]:
+  logger.info("开始流式生成用户故事")
+  async for event in _stream_user_stories(
+      generate_story_stream_chain(),
+      {"user_stories_requirements": user_stories_requirements},
+      session_id,
+      write_draft=True
+  ):
+    yield event
+  logger.info("用户故事流式生成结束")
 
-  draft_path.mkdir(parents=True, exist_ok=True)
 
+async def stream_user_stories_modification(
+    user_stories_requirements: UserStoryUpdateRequest,
+    session_id: str = DEFAULT_SESSION_ID
+) -> AsyncIterator[str]:
+  logger.info("开始根据草稿流式修改用户故事")
   try:
-    async with aiofiles.open(draft_file_path, "w", encoding="utf-8") as f:
-      content = json.dumps(stories_result_dict, indent=2, ensure_ascii=False)
-      await f.write(content)
+    draft = json.loads(await outcome_querier(session_id, DRAFT_DOCUMENT))
+    context = await assemble_user_stories_context(
+        user_stories_requirements, draft, session_id, allow_condense=False)
+  except Exception as e:
+    yield format_sse("error", {"detail": str(e)})
+    return
+
+  async def on_result(stories_result_dict: dict) -> None:
+    await record_modification(
+        session_id, WORKFLOW, user_stories_requirements.requirements,
+        changed_names(draft.get("stories", []),
+                      stories_result_dict["stories"], "function_name"),
+        context)
+
+  async for event in _stream_user_stories(
+      update_user_story_stream_chain(),
+      context.inputs,
+      session_id,
+      write_draft=False,
+      on_result=on_result
+  ):
+    yield event
+  logger.info("用户故事流式修改结束")
+
+
+async def _stream_user_stories(
+    chain,
+    chain_input: Dict[str, Any],
+    session_id: str,
+    write_draft: bool,
+    on_result: Optional[Callable[[dict], Awaitable[None]]] = None
+) -> AsyncIterator[str]:
+  """
+  每个 UserStory 闭合后立即作为 story 事件推送，流结束后再统一校验并写入草稿
+  :param on_result: 校验通过后对完整结果的回调
+  """
+  tracker = CompletedItemTracker(["stories"])
+  try:
+    env_varies_validator()
+    async for partial in stream_chain(chain, chain_input):
+      for _, story in tracker.feed(partial):
+        yield format_sse("story", story)
+    for _, story in tracker.flush():
+      yield format_sse("story", story)
+
+    stories_result = await user_stories_repairer.repair(tracker.latest)
+    stories_result_dict = user_story_format_verifier(stories_result)
+    if write_draft:
+      await write_user_stories_draft(stories_result_dict, session_id)
+    if on_result is not None:
+      await on_result(stories_result_dict)
+    yield format_sse("done", stories_result_dict)
+  except Exception as e:
+    logger.error("用户故事流式输出失败：%s", e)
+    yield format_sse("error", {"detail": str(e)})
+
+
+async def write_user_stories_draft(
+    stories_result_dict: dict,
+    session_id: str
+) -> None:
+  logger.info("开始记录用户故事的草稿")
+
+  try:
+    await outcome_writer(session_id, DRAFT_DOCUMENT, stories_result_dict,
+                         versioned=True)
   except OSError as e:
-    logger.error(f"写入用户故事草稿文件失败：{e}")
+    logger.error("写入用户故事草稿文件失败：%s", e)
 
 
-async def user_stories_json_to_md(user_stories: UserStoryRequest) -> str:
+async def user_stories_json_to_md(
+    user_stories: UserStoryRequest,
+    polish: bool = False
+) -> str:
   logger.info("开始将用户故事的 json 转为 md 格式")
+  if not polish:
+    md_result = render_user_stories_md(user_stories)
+    logger.info("成功在本地将用户故事的 json 转为 md 格式")
+    return md_result
+
   user_stories_json = base_model_to_dict(user_stories)
-  md_result = await json_to_md_chain.ainvoke({"result_json": user_stories_json})
+  md_result = await run_chain(json_to_md_chain(),
+                            {"result_json": user_stories_json})
   logger.info("成功将用户故事的 json 转为 md 格式")
   return md_result
 
 def user_story_format_verifier(llm_result: UserStoriesResponse) -> dict:
   result_dict = base_model_to_dict(llm_result)
-  if not validate_json_str(result_dict, USER_STORY_VALIDATION_SCHEMA):
-    logger.error("生成的用户故事格式错误")
-    raise ValueError("生成的用户故事格式错误")
+  with stage_timer(WORKFLOW, "validate"):
+    is_valid, info_str = validate_json_str(result_dict, USER_STORY_VALIDATION_SCHEMA)
+  if not is_valid:
+    logger.error("生成的用户故事格式错误：%s", info_str)
+    raise ValueError(f"生成的用户故事格式错误：{info_str}")
   return result_dict
 
 
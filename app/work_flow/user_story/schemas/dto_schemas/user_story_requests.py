@@ -1,16 +1,25 @@
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, Field, model_validator
 
-from app.logger.logger import logger
+from app.logger.logger import get_logger
+from app.utils.batch_stream import MAX_BATCH_ITEMS
 from app.work_flow.user_story.schemas.domain_schemas.user_story_domains import UserStory, \
   UserStories
 
+logger = get_logger(__name__)
+
 
 class UserStoryGenerateRequest(BaseModel):
   requirements: str
 
 
+class UserStoryBatchGenerateRequest(BaseModel):
+  items: List[UserStoryGenerateRequest] = Field(min_length=1,
+                                                max_length=MAX_BATCH_ITEMS)
+  max_concurrency: Optional[int] = Field(default=None, ge=1)
+
+
 class UserStoryUpdateRequest(BaseModel):
   requirements: str
 
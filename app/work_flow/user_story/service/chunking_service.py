@@ -0,0 +1,89 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from app.LLMs.similarity_cache import HashedNgramVectorizer, SparseVector, \
+  cosine_similarity
+from app.logger.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_STORY_DEDUP_THRESHOLD = 0.85
+SECTION_NOTE = ("（以下是完整需求文档的第 {index}/{total} 部分，"
+                "只需为本部分描述的功能生成用户故事）\n")
+
+_vectorizer = HashedNgramVectorizer()
+
+
+def story_dedup_threshold() -> float:
+  return float(os.environ.get("STORY_DEDUP_THRESHOLD",
+                              DEFAULT_STORY_DEDUP_THRESHOLD))
+
+
+def section_requirements(section: str, index: int, total: int) -> str:
+  """
+  给分块加上所在位置的说明，避免模型把一个分块当作完整需求
+  """
+  return SECTION_NOTE.format(index=index + 1, total=total) + section
+
+
+def merge_user_stories(
+    section_results: List[Dict[str, Any]],
+    threshold: Optional[float] = None
+) -> Dict[str, Any]:
+  """
+  合并各分块生成的用户故事：功能名相同，或角色、操作、价值的文本相似度不低于阈值的故事视为重复，
+  保留先出现的故事并合并验收标准
+  :param section_results: 按分块顺序排列的用户故事字典
+  :param threshold: 相似度阈值，默认取环境变量 STORY_DEDUP_THRESHOLD
+  :return: 合并后的用户故事字典
+  """
+  threshold = story_dedup_threshold() if threshold is None else threshold
+  merged: List[Dict[str, Any]] = []
+  vectors: List[SparseVector] = []
+  by_name: Dict[str, int] = {}
+  duplicates = 0
+
+  for result in section_results:
+    for story in result.get("stories", []):
+      key = _vectorizer.normalize(story.get("function_name", ""))
+      vector = _vectorizer.vectorize(_story_text(story))
+      index = by_name.get(key) if key else None
+      if index is None:
+        index = _most_similar(vector, vectors, threshold)
+      if index is not None:
+        _merge_criteria(merged[index], story)
+        duplicates += 1
+        continue
+      by_name[key] = len(merged)
+      merged.append(dict(story, acceptance_criteria=list(
+          story.get("acceptance_criteria", []))))
+      vectors.append(vector)
+
+  logger.info("合并 %s 个分块的用户故事：保留 %s 个，去重 %s 个",
+              len(section_results), len(merged), duplicates)
+  return {"stories": merged}
+
+
+def _story_text(story: Dict[str, Any]) -> str:
+  return " ".join(str(story.get(key, "")) for key in
+                  ("function_name", "role", "action", "value"))
+
+
+def _most_similar(vector: SparseVector, vectors: List[SparseVector],
+    threshold: float) -> Optional[int]:
+  best_index, best_score = None, threshold
+  for index, other in enumerate(vectors):
+    score = cosine_similarity(vector, other)
+    if score >= best_score:
+      best_index, best_score = index, score
+  return best_index
+
+
+def _merge_criteria(kept: Dict[str, Any], duplicate: Dict[str, Any]) -> None:
+  seen = {_vectorizer.normalize(criterion)
+          for criterion in kept["acceptance_criteria"]}
+  for criterion in duplicate.get("acceptance_criteria", []):
+    key = _vectorizer.normalize(criterion)
+    if key not in seen:
+      seen.add(key)
+      kept["acceptance_criteria"].append(criterion)
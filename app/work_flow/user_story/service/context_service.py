@@ -0,0 +1,119 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.context_assembler import AssembledContext, draft_token_budget, \
+  load_history_text, may_affect_unnamed_items, mentioned_names, minify_json
+from app.utils.token_estimator import estimate_tokens
+from app.work_flow.user_story.schemas.domain_schemas.user_story_domains import \
+  UserStory
+from app.work_flow.user_story.schemas.dto_schemas.user_story_requests import \
+  UserStoryUpdateRequest
+from app.work_flow.user_story.schemas.dto_schemas.user_story_response import \
+  UserStoriesResponse
+
+WORKFLOW = "user_stories"
+CONDENSED_NOTE = ("说明：为节省篇幅，以下用户故事与本次修改无关，仅列出了概要："
+                  "{names}。请在输出中保留这些用户故事（function_name 不变），"
+                  "系统会自动还原其完整内容。")
+
+
+async def assemble_user_stories_context(
+    user_stories_requirements: UserStoryUpdateRequest,
+    draft: Dict[str, Any],
+    session_id: str,
+    allow_condense: bool = True
+) -> AssembledContext:
+  """
+  组装用户故事修改链的输入：压缩的草稿与该会话最近的修改记录
+  :param user_stories_requirements: 修改请求
+  :param draft: 当前的用户故事草稿
+  :param session_id: 会话 id
+  :param allow_condense: 是否允许精简无关的用户故事，流式修改会直接推送模型输出，因此不精简
+  :return: 组装好的上下文
+  """
+  instruction = user_stories_requirements.requirements
+  budget = draft_token_budget() if allow_condense else None
+  draft_text, condensed = condense_user_stories_draft(draft, instruction, budget)
+
+  baseline_tokens = sum(estimate_tokens(text) for text in (
+    json.dumps(draft, indent=2, ensure_ascii=False),
+    str(user_stories_requirements),
+  ))
+  return AssembledContext(
+      inputs={
+        "user_stories_draft": draft_text,
+        "conversation_history": await asyncio.to_thread(load_history_text,
+                                                        session_id, WORKFLOW),
+        "user_stories_modification_suggestions": instruction,
+      },
+      baseline_tokens=baseline_tokens,
+      condensed=condensed,
+  )
+
+
+def condense_user_stories_draft(
+    draft: Dict[str, Any],
+    instruction: str,
+    budget: Optional[int] = None
+) -> Tuple[str, List[str]]:
+  """
+  草稿超出预算、要求点名了用户故事且不会删除或统一修改其余故事时，只保留要求中提到的
+  用户故事的完整内容，其余用户故事去掉价值与验收标准，仍超出预算时只保留功能名
+  :return: 草稿文本与被精简的功能名
+  """
+  full_text = minify_json(draft)
+  if budget is None or may_affect_unnamed_items(instruction) \
+      or estimate_tokens(full_text) <= budget:
+    return full_text, []
+
+  stories = draft.get("stories", [])
+  touched = mentioned_names(instruction, {
+    story["function_name"]: (story["function_name"],) for story in stories
+  })
+  condensed = [story["function_name"] for story in stories
+               if story["function_name"] not in touched]
+  if not touched or not condensed:
+    return full_text, []
+
+  def render(keep_action: bool) -> str:
+    view_stories = []
+    for story in stories:
+      if story["function_name"] in touched:
+        view_stories.append(story)
+      elif keep_action:
+        view_stories.append({"function_name": story["function_name"],
+                             "role": story.get("role", ""),
+                             "action": story.get("action", "")})
+      else:
+        view_stories.append({"function_name": story["function_name"]})
+    note = CONDENSED_NOTE.format(names="、".join(condensed))
+    return note + "\n" + minify_json({"stories": view_stories})
+
+  draft_text = render(keep_action=True)
+  if estimate_tokens(draft_text) > budget:
+    draft_text = render(keep_action=False)
+  return draft_text, condensed
+
+
+def restore_condensed_stories(
+    stories_result: UserStoriesResponse,
+    draft: Dict[str, Any],
+    condensed: List[str]
+) -> UserStoriesResponse:
+  """
+  用草稿中的完整内容替换模型输出里被精简的用户故事，模型遗漏的也一并补回；
+  要求可能删除或统一修改用户故事时不会精简草稿，因此补回的不会是用户要删除或要修改的用户故事
+  """
+  if not condensed:
+    return stories_result
+  originals = {story["function_name"]: story for story in draft.get("stories", [])
+               if story["function_name"] in condensed}
+
+  stories = []
+  for story in stories_result.stories:
+    original = originals.pop(story.function_name, None)
+    stories.append(UserStory.model_validate(original) if original else story)
+  stories.extend(UserStory.model_validate(original)
+                 for original in originals.values())
+  return stories_result.model_copy(update={"stories": stories})
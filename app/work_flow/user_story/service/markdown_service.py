@@ -0,0 +1,73 @@
+import unicodedata
+from typing import List, Tuple
+
+from app.work_flow.user_story.schemas.domain_schemas.user_story_domains import \
+  UserStory
+from app.work_flow.user_story.schemas.dto_schemas.user_story_requests import \
+  UserStoryRequest
+
+# llm 生成的字段常常自带句式前缀，渲染前去掉以免出现“作为 作为团队成员”
+ROLE_PREFIXES: Tuple[str, ...] = ("作为", "As a", "As an")
+ACTION_PREFIXES: Tuple[str, ...] = ("我想要", "我想", "I want to", "I want")
+VALUE_PREFIXES: Tuple[str, ...] = ("以便", "这样", "so that")
+
+
+def render_user_stories_md(user_stories: UserStoryRequest) -> str:
+  """
+  按 JSON_TO_MD_PROMPT 约定的模版在本地将用户故事渲染为 Markdown，不经过 llm
+  :param user_stories: 用户故事
+  :return: Markdown 文本
+  """
+  lines = ["## 用户故事", ""]
+
+  for story in user_stories.stories:
+    lines.extend(_render_story(story))
+
+  return "\n".join(lines).rstrip() + "\n"
+
+
+def _render_story(story: UserStory) -> List[str]:
+  role = _strip_prefix(story.role, ROLE_PREFIXES)
+  action = _strip_prefix(story.action, ACTION_PREFIXES)
+  value = _strip_prefix(story.value, VALUE_PREFIXES)
+
+  lines = []
+  if story.function_name:
+    lines.append(f"### 功能名：{_single_line(story.function_name)}")
+  lines.append(f"### 作为 {role}，我想要 {action}，以便 {value}")
+  lines.extend(f"- {_single_line(criterion)}"
+               for criterion in story.acceptance_criteria if criterion)
+  lines.append("")
+  return lines
+
+
+def _strip_prefix(text: str, prefixes: Tuple[str, ...]) -> str:
+  """
+  去掉句式前缀；较长的前缀优先，前缀之后必须是词的边界，
+  避免把 “As an admin” 当成 “As a” 截成 “n admin”
+  """
+  stripped = _single_line(text)
+  for prefix in sorted(prefixes, key=len, reverse=True):
+    if stripped.lower().startswith(prefix.lower()) \
+        and _is_boundary(prefix, stripped[len(prefix):len(prefix) + 1]):
+      return stripped[len(prefix):].lstrip(" ，,")
+  return stripped
+
+
+def _is_boundary(prefix: str, following: str) -> bool:
+  """
+  前缀之后为结尾、空白或标点时是边界；中文前缀之后直接接中文也是边界（中文不用空格分词），
+  但接“的”时前缀是定语的一部分，如“这样的用户”
+  """
+  if not following or following.isspace() \
+      or unicodedata.category(following).startswith("P"):
+    return True
+  return _is_cjk(prefix[-1]) and _is_cjk(following) and following != "的"
+
+
+def _is_cjk(char: str) -> bool:
+  return "\u4e00" <= char <= "\u9fff"
+
+
+def _single_line(text: str) -> str:
+  return " ".join(str(text).split())
@@ -1,6 +1,8 @@
-from pathlib import Path
+from typing import List
 
-from app.logger.logger import logger
+from app.logger.logger import get_logger
+from app.storage.draft_versions import draft_versioning
+from app.storage.version_schemas import DraftVersion, DraftVersionDiff
 from app.utils.base_model_converter import base_model_to_dict
 from app.work_flow.user_story.chain.prompts.user_stories_templates import \
   USER_STORY_VALIDATION_SCHEMA
@@ -8,49 +10,94 @@ from app.work_flow.user_story.schemas.dto_schemas.user_story_requests import \
   UserStoryRequest, UserStorySaveRequest
 from app.work_flow.user_story.schemas.dto_schemas.user_story_response import \
   UserStoriesResponse
-from app.utils.outcome_handler import outcome_querier, outcome_writer
+from app.utils.outcome_handler import DocumentView, outcome_view, \
+  outcome_writer
 from app.utils.schema_verifier import validate_json_str
 
-draft_path = Path("./work_flow/user_story/outcomes/draft")
-draft_file_path = draft_path / "user_stories_draft.json"
-result_path = Path("./work_flow/user_story/outcomes/result")
-result_file_path = result_path / "user_stories_result.json"
+logger = get_logger(__name__)
 
-def query_user_stories_draft() -> UserStoriesResponse:
+DRAFT_DOCUMENT = "user_stories_draft"
+RESULT_DOCUMENT = "user_stories_result"
+
+async def query_user_stories_draft(session_id: str) -> DocumentView:
   logger.info("开始获取用户故事草稿")
-  draft_content = outcome_querier(draft_file_path)
-  draft = UserStoriesResponse.model_validate_json(draft_content)
+  view = await outcome_view(session_id, DRAFT_DOCUMENT, UserStoriesResponse)
   logger.info("成功获取用户故事草稿")
-  return draft
+  return view
 
-def query_user_stories_result() -> UserStoriesResponse:
+async def query_user_stories_result(session_id: str) -> DocumentView:
   logger.info("开始获取用户故事成果")
-  result_content = outcome_querier(result_file_path)
-  result = UserStoriesResponse.model_validate_json(result_content)
+  view = await outcome_view(session_id, RESULT_DOCUMENT, UserStoriesResponse)
   logger.info("成功获取用户故事成果")
-  return result
+  return view
 
 
-async def update_user_stories_draft(modified_draft: UserStoryRequest) -> None:
+async def update_user_stories_draft(
+    modified_draft: UserStoryRequest,
+    session_id: str
+) -> None:
   logger.info("开始上传被修改的用户故事草稿")
   modified_draft_dict = base_model_to_dict(modified_draft)
   is_success, info_str = validate_json_str(modified_draft_dict, USER_STORY_VALIDATION_SCHEMA)
   if not is_success:
     logger.error(info_str)
-  await outcome_writer(draft_file_path, modified_draft_dict)
+  await outcome_writer(session_id, DRAFT_DOCUMENT, modified_draft_dict,
+                       versioned=True)
   logger.info("成功修改故事草稿")
 
 
-async def save_user_stories_draft(request: UserStorySaveRequest) -> None:
+async def save_user_stories_draft(
+    request: UserStorySaveRequest,
+    session_id: str
+) -> None:
   if request.save_as_draft:
     logger.info("保存草稿")
-    draft_path.mkdir(parents=True, exist_ok=True)
-    await outcome_writer(draft_file_path,
-                         request.user_stories_draft.model_dump())
+    await outcome_writer(session_id, DRAFT_DOCUMENT,
+                         request.user_stories_draft.model_dump(),
+                         versioned=True)
   elif request.save_as_result:
     logger.info("将草稿储存为成果")
-    result_path.mkdir(parents=True, exist_ok=True)
-    await outcome_writer(result_file_path,
+    await outcome_writer(session_id, RESULT_DOCUMENT,
                          request.user_stories_draft.model_dump())
   else:
-    logger.info("放弃储存草稿")
\ No newline at end of file
+    logger.info("放弃储存草稿")
+
+
+async def list_user_stories_draft_versions(session_id: str) -> List[DraftVersion]:
+  logger.info("开始获取用户故事草稿的版本列表")
+  versions = await draft_versioning.list_versions(session_id, DRAFT_DOCUMENT)
+  return [DraftVersion.model_validate(version) for version in versions]
+
+
+async def query_user_stories_draft_version(
+    session_id: str,
+    version: int
+) -> UserStoriesResponse:
+  logger.info("开始获取用户故事草稿的第 %s 版", version)
+  content = await draft_versioning.get_version(session_id, DRAFT_DOCUMENT,
+                                               version)
+  return UserStoriesResponse.model_validate(content)
+
+
+async def diff_user_stories_draft_versions(
+    session_id: str,
+    from_version: int,
+    to_version: int
+) -> DraftVersionDiff:
+  logger.info("开始比较用户故事草稿的第 %s 版与第 %s 版", from_version, to_version)
+  patch = await draft_versioning.diff_versions(session_id, DRAFT_DOCUMENT,
+                                               from_version, to_version)
+  return DraftVersionDiff(from_version=from_version, to_version=to_version,
+                          patch=patch)
+
+
+async def restore_user_stories_draft_version(
+    session_id: str,
+    version: int
+) -> UserStoriesResponse:
+  logger.info("开始将用户故事草稿恢复到第 %s 版", version)
+  content = await draft_versioning.get_version(session_id, DRAFT_DOCUMENT,
+                                               version)
+  await outcome_writer(session_id, DRAFT_DOCUMENT, content, versioned=True)
+  logger.info("成功将用户故事草稿恢复到第 %s 版", version)
+  return UserStoriesResponse.model_validate(content)
\ No newline at end of file
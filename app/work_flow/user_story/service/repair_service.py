@@ -0,0 +1,40 @@
+import copy
+from typing import Any, Dict
+
+from app.work_flow.user_story.schemas.domain_schemas.user_story_domains import \
+  UserStory
+
+STORY_FIELDS = set(UserStory.model_fields)
+TEXT_FIELDS = ("function_name", "role", "action", "value")
+
+
+def fix_user_stories(user_stories: Dict[str, Any]) -> Dict[str, Any]:
+  """
+  对 llm 输出的用户故事做确定性的修正：去掉多余字段、把非字符串的文字转为字符串、
+  把字符串形式的验收标准拆成列表。不会修改传入的对象
+  :param user_stories: llm 输出的用户故事字典
+  :return: 修正后的用户故事字典
+  """
+  fixed = {"stories": copy.deepcopy(user_stories.get("stories"))}
+  if not isinstance(fixed["stories"], list):
+    return fixed
+
+  stories = []
+  for story in fixed["stories"]:
+    if not isinstance(story, dict):
+      continue
+    story = {key: value for key, value in story.items() if key in STORY_FIELDS}
+    for key in TEXT_FIELDS:
+      if key in story and story[key] is not None and not isinstance(story[key], str):
+        story[key] = str(story[key])
+
+    criteria = story.get("acceptance_criteria")
+    if isinstance(criteria, str):
+      story["acceptance_criteria"] = [line.strip(" -•\t") for line in criteria.splitlines()
+                                      if line.strip(" -•\t")]
+    elif isinstance(criteria, list):
+      story["acceptance_criteria"] = [str(item) for item in criteria
+                                      if item is not None and str(item).strip()]
+    stories.append(story)
+  fixed["stories"] = stories
+  return fixed